@@ -0,0 +1,493 @@
+# vim: set ts=8 sw=4 sts=4 et ai:
+# Copyright (C) 2026, OSSO B.V.
+'''
+Asyncio twin of the eppsocket/eppxml/eppsession stack. Requires
+Python 3.7+.
+
+All commands of a session share a single connection: every command is
+tagged with a clTRID, written as soon as there is room in the pipeline
+and its response is handed back by a reader task. Many coroutines can
+use the same AsyncEppSession concurrently.
+'''
+import asyncio
+import ssl
+import struct
+from base64 import b64decode
+from collections import OrderedDict
+from itertools import count
+from random import getrandbits
+from time import time
+
+from lxml import etree
+
+import eppresponse
+from eppcache import LruCache
+from eppcommand import (
+    Login, Logout,
+    ContactCheck, ContactCreate, ContactDelete, ContactInfo, ContactUpdate,
+    DomainCheck, DomainCreate, DomainDelete, DomainDeleteCancel, DomainInfo,
+    DomainRenew, DomainTransfer, DomainTransferApprove,
+    DomainTransferCancel, DomainTransferState, DnssecDomainUpdate)
+from eppsession import EppSession
+from eppsocket import MAX_FRAME_SIZE, FramingError
+from eppxml import PARSER_OPTIONS, pp, xpath, UnexpectedData
+
+IANA_TCP_PORT = 700  # the default TCP port for EPP
+
+
+class AsyncEppSocket(object):
+    def __init__(self, reader, writer, max_frame_size=MAX_FRAME_SIZE):
+        self.reader = reader
+        self.writer = writer
+        self.max_frame_size = max_frame_size
+
+    def close(self):
+        assert self.writer is not None
+        self.writer.close()
+        self.reader = self.writer = None
+
+    async def read(self):
+        assert self.reader is not None
+        header = await self.reader.readexactly(4)
+        length = struct.unpack('>I', header)[0] - 4
+        if not (0 <= length <= self.max_frame_size):
+            raise FramingError('invalid EPP frame length %d' % length)
+        return await self.reader.readexactly(length)
+
+    async def write(self, data):
+        assert self.writer is not None
+        # The frame is queued before the first await, so frames from
+        # concurrent writers never interleave.
+        self.writer.write(struct.pack('>I', len(data) + 4))
+        self.writer.write(data)
+        await self.writer.drain()
+
+
+class AsyncEppXml(object):
+    def __init__(self, eppsocket):
+        self.eppsocket = eppsocket
+        self.parser = etree.XMLParser(**PARSER_OPTIONS)
+
+    def close(self):
+        assert self.eppsocket is not None
+        self.eppsocket.close()
+        self.eppsocket = None
+
+    async def expect(self, write, xpath_read_check):
+        if write is not None:
+            await self.write(write)
+        xml = await self.read()
+        if xpath_read_check is not None and not xpath(xml, xpath_read_check):
+            raise UnexpectedData(write, xml, xpath_read_check)
+        return xml
+
+    async def read(self):
+        assert self.eppsocket is not None
+        return etree.XML(await self.eppsocket.read(), self.parser)
+
+    async def write(self, xml):
+        assert self.eppsocket is not None
+        if isinstance(xml, etree._Element):
+            data = etree.tostring(xml)
+        else:
+            data = xml.toxml()
+        await self.eppsocket.write(data)
+
+
+async def tcp_connect(address, ssl_context=True, max_frame_size=MAX_FRAME_SIZE):
+    '''
+    Example connection function. Pass ssl_context=False for plain TCP.
+    Like eppsocket.tcp_connect, certificates are not checked unless you
+    pass your own SSLContext.
+    '''
+    if isinstance(address, str):
+        address = (address, IANA_TCP_PORT)
+    if ssl_context is True:
+        ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+        ssl_context.check_hostname = False
+        ssl_context.verify_mode = ssl.CERT_NONE
+    reader, writer = await asyncio.open_connection(
+        address[0], int(address[1]), ssl=(ssl_context or None))
+    return AsyncEppXml(AsyncEppSocket(reader, writer, max_frame_size))
+
+
+class AsyncEppSession(object):
+    '''
+    Use as:
+
+        session = AsyncEppSession(
+            lambda: eppasync.tcp_connect('testdrs.my-domain-registry.nl'),
+            '301234', 'aabbccddee')
+        try:
+            print(await session.domain('nu.nl').get_nameservers())
+        finally:
+            await session.close()
+
+    eppxml_generator must return an awaitable that yields an AsyncEppXml.
+    '''
+    XPATH_OK = EppSession.XPATH_OK
+    XPATH_CLTRID = EppSession.XPATH_CLTRID
+    XPATH_PERIOD_UNCHANGED = EppSession.XPATH_PERIOD_UNCHANGED
+    CHECK_LIMIT = EppSession.CHECK_LIMIT
+
+    def __init__(self, eppxml_generator, username, password, pipeline_depth=16,
+                 cache_class=LruCache, cache_size=10000, info_ttl=None,
+                 write_through=False):
+        self.cache = {
+            'contacts': cache_class(cache_size),
+            'domains': cache_class(cache_size),
+        }
+        self.info_ttl = info_ttl
+        self.write_through = write_through
+        self.eppxml = None
+        self.eppxml_generator = eppxml_generator
+        self.username = username
+        self.password = password
+        self.pending = OrderedDict()
+        self.pipeline_depth = pipeline_depth
+        self.cltrid_prefix = 'EE%08X' % getrandbits(32)
+        self.cltrid_counter = count(1)
+        self.connecting = asyncio.Lock()
+        self.in_flight = asyncio.Semaphore(pipeline_depth)
+        self.reader_task = None
+
+    async def _ensure_connected(self):
+        async with self.connecting:
+            if self.eppxml is None:
+                eppxml = await self.eppxml_generator()
+                await eppxml.expect(None, '/epp:epp/epp:greeting')
+                await eppxml.expect(Login(username=self.username, password=self.password), self.XPATH_OK)
+                self.eppxml = eppxml
+                self.reader_task = asyncio.ensure_future(self._read_loop())
+
+    async def _exec(self, command, expect_response=None):
+        if expect_response is None:
+            expect_response = self.XPATH_OK
+        await self._ensure_connected()
+        async with self.in_flight:
+            # The reader drops a broken connection, maybe while we waited.
+            eppxml = self.eppxml
+            if eppxml is None:
+                raise ConnectionError('EPP connection lost')
+            command.cltrid = self._next_cltrid()
+            future = asyncio.get_running_loop().create_future()
+            self.pending[command.cltrid] = future
+            try:
+                await eppxml.write(command)
+                value = await future
+            finally:
+                # Never leave a future for the reader to hand a response.
+                self.pending.pop(command.cltrid, None)
+        if expect_response is not None and not xpath(value, expect_response):
+            raise UnexpectedData(command, value, expect_response)
+        return value
+
+    def _next_cltrid(self):
+        return '%s-%d' % (self.cltrid_prefix, next(self.cltrid_counter))
+
+    _is_fresh = EppSession._is_fresh
+
+    async def _read_loop(self):
+        try:
+            while True:
+                value = await self.eppxml.read()
+                cltrid = xpath(value, self.XPATH_CLTRID)
+                if cltrid:
+                    # None for a cancelled command: nobody waits for it.
+                    future = self.pending.pop(cltrid[0].text, None)
+                elif self.pending:
+                    # Responses without clTRID, like parse errors, belong
+                    # to the oldest command: the server answers in order.
+                    future = self.pending.popitem(last=False)[1]
+                else:
+                    future = None  # unsolicited
+                if future is None:
+                    continue
+                if not future.cancelled():
+                    future.set_result(value)
+        except Exception as e:
+            # The connection is unusable, fail everything in flight.
+            pending, self.pending = self.pending, OrderedDict()
+            for future in pending.values():
+                if not future.cancelled():
+                    future.set_exception(e)
+            eppxml, self.eppxml = self.eppxml, None
+            if eppxml is not None:
+                eppxml.close()
+
+    async def close(self):
+        ''' Await close in your finally block. '''
+        if self.eppxml is not None:
+            try:
+                await self._exec(Logout(), '/epp:epp/epp:response/epp:result[@code="1500"]')
+            finally:
+                self.reader_task.cancel()
+                if self.eppxml is not None:
+                    self.eppxml.close()
+                    self.eppxml = None
+
+    ####################################################################
+    # GETTING CONTACTS AND DOMAINS
+    ####################################################################
+
+    def contact(self, handle):
+        contact = self.cache['contacts'].get(handle)
+        if contact is None:
+            contact = self.cache['contacts'].setdefault(handle, self.Contact(session=self, handle=handle))
+        return contact
+
+    async def contact_create(self, name, street, zipcode, city, countrycode, phone, fax, email, legalform=None, legalformno=None):
+        ''' Create a new contact. '''
+        value = await self._exec(ContactCreate(
+            name=name, street=street, zipcode=zipcode,
+            city=city, countrycode=countrycode,
+            phone=phone, fax=fax, email=email,
+            legalform=legalform, legalformno=legalformno
+        ))
+        handle = xpath(value, '//contact:creData/contact:id')[0].text
+        contact = self.contact(handle)
+        contact._cache = {}  # dirty cache
+        return contact
+
+    async def contact_is_free(self, handle):
+        ''' Check availability of contact handle. '''
+        return (await self.contacts_are_free([handle]))[0][1]
+
+    async def contacts_are_free(self, handles):
+        ''' Check availability of many contact handles. Returns a list of
+        (handle, avail, reason) tuples in input order. '''
+        return await self._check_many(
+            (lambda chunk: ContactCheck(handles=chunk)), handles,
+            '//contact:chkData/contact:cd', 'contact:id')
+
+    def domain(self, domainname):
+        domain = self.cache['domains'].get(domainname)
+        if domain is None:
+            domain = self.cache['domains'].setdefault(domainname, self.Domain(session=self, domainname=domainname))
+        return domain
+
+    async def domain_create(self, domainname, registrant=None, admin=None, tech=None, nameservers=None):
+        ''' Register a new domain name. See EppSession.domain_create. '''
+        assert registrant is not None and admin is not None and tech is not None
+        create_cmd = DomainCreate(domainname=domainname)
+        for i in set(registrant):
+            create_cmd.set_registrant(i)
+        for i in set(admin):
+            create_cmd.add_admin(i)
+        for i in set(tech):
+            create_cmd.add_tech(i)
+        if nameservers is not None:
+            for i in set(nameservers):
+                create_cmd.add_nameserver(i)
+        await self._exec(create_cmd)
+        domain = self.domain(domainname)
+        domain._cache = {}  # dirty cache
+        return domain
+
+    async def domain_is_free(self, domainname):
+        ''' Returns a boolean stating whether the domain is free. '''
+        return (await self.domains_are_free([domainname]))[0][1]
+
+    async def domains_are_free(self, domainnames):
+        ''' Check availability of many domain names. Returns a list of
+        (domainname, avail, reason) tuples in input order. '''
+        return await self._check_many(
+            (lambda chunk: DomainCheck(domainnames=chunk)), domainnames,
+            '//domain:chkData/domain:cd', 'domain:name')
+
+    async def _check_many(self, command_generator, names, xpath_cd, xpath_name):
+        names = list(names)
+        values = await asyncio.gather(*[
+            self._exec(command_generator(names[i:(i + self.CHECK_LIMIT)]))
+            for i in range(0, len(names), self.CHECK_LIMIT)])
+        ret = []
+        for value in values:
+            ret.extend(EppSession._parse_checks(value, xpath_cd, xpath_name))
+        return ret
+
+    ####################################################################
+    # CONTACT OBJECT BY HANDLE
+    ####################################################################
+
+    class Contact(EppSession.Contact):
+        @property
+        def verbose_info(self):
+            ''' Verbose contact information (awaitable). '''
+            return self._verbose_info()
+
+        async def _verbose_info(self):
+            if not self._session._is_fresh(self._cache):
+                value = await self._session._exec(ContactInfo(handle=self._handle))
+                self._cache = {'record': eppresponse.ContactInfo.from_response(value), 'fetched': time()}
+            return self._cache['record']
+
+        def __repr__(self):
+            return "<AsyncEppSession.Contact('%s')>" % self._handle
+
+        async def change(self, name, street, zipcode, city, countrycode, phone, fax, email, legalform=None, legalformno=None):
+            ''' Update contact info (everything at once). '''
+            await self._session._exec(ContactUpdate(
+                handle=self._handle, name=name, street=street,
+                zipcode=zipcode, city=city,
+                countrycode=countrycode, phone=phone, fax=fax,
+                email=email, legalform=legalform,
+                legalformno=legalformno))
+            self._cache = {}
+
+        async def delete(self):
+            ''' Delete this contact. '''
+            await self._session._exec(ContactDelete(handle=self._handle))
+            self._cache = {}
+
+    ####################################################################
+    # DOMAIN OBJECT BY DOMAINNAME
+    ####################################################################
+
+    class Domain(EppSession.Domain):
+        ''' Like EppSession.Domain, but every property and method is
+        awaitable. The diffing and parsing is shared with it. '''
+
+        # PROPERTIES #
+
+        @property
+        def token(self):
+            return self._token()
+
+        async def _token(self):
+            return self._parse_token(await self._info())
+
+        @property
+        def transfer_info(self):
+            return self._transfer_info()
+
+        async def _transfer_info(self):
+            return self._parse_transfer(await self._session._exec(DomainTransferState(domainname=self._domainname)))
+
+        @property
+        def verbose_info(self):
+            return self._verbose_info()
+
+        async def _verbose_info(self):
+            return await self._info()
+
+        # GETTERS/SETTERS #
+
+        async def get_handles(self):
+            return self._parse_handles(await self._info())
+
+        async def set_handles(self, registrant=None, admin=None, tech=None):
+            update_cmd = self._set_handles_cmd(
+                await self.get_handles(), registrant, admin, tech)
+            if update_cmd is None:
+                return False
+            await self._exec_change(update_cmd)
+            self._write_through(self._written_handles, registrant, admin, tech)
+            return True
+
+        async def get_dnskeys(self, flags=None):
+            return self._parse_dnskeys(await self._info(), flags)
+
+        async def set_dnskeys(self, to_add, to_remove):
+            update_cmd = self._set_dnskeys_cmd(to_add, to_remove)
+            await self._exec_change(update_cmd)
+            self._write_through(self._written_dnskeys, update_cmd)
+
+        async def get_nameservers(self):
+            return self._parse_nameservers(await self._info())
+
+        async def set_nameservers(self, nameservers):
+            update_cmd = self._set_nameservers_cmd(
+                await self.get_nameservers(), nameservers)
+            if update_cmd is None:
+                return False
+            await self._exec_change(update_cmd)
+            self._write_through(self._written_nameservers, nameservers)
+            return True
+
+        async def set_period(self, period):
+            assert period in (1, 3, 12), period
+            try:
+                value = await self._exec_change(DomainRenew(domainname=self._domainname, period=period))
+            except UnexpectedData as e:
+                if self._period_unchanged(e):
+                    return False
+                raise
+            self._write_through(self._written_renew, value)
+            return True
+
+        async def dnskey_add(self, flags, protocol, algo, pubkey):
+            assert isinstance(flags, int)
+            assert isinstance(protocol, int)
+            assert isinstance(algo, int)
+            assert b64decode(pubkey) is not None
+            update_cmd = DnssecDomainUpdate(domainname=self._domainname)
+            update_cmd.dnskey_add(flags, protocol, algo, pubkey)
+            await self._exec_change(update_cmd)
+            self._write_through(self._written_dnskeys, update_cmd)
+
+        # HELPERS #
+
+        def __repr__(self):
+            return "<AsyncEppSession.Domain('%s')>" % self._domainname
+
+        async def _info(self):
+            if not self._session._is_fresh(self._cache):
+                value = await self._session._exec(DomainInfo(domainname=self._domainname))
+                self._cache = {'record': eppresponse.DomainInfo.from_response(value), 'fetched': time()}
+            return self._cache['record']
+
+        async def _exec_change(self, command):
+            try:
+                return await self._session._exec(command)
+            except Exception as e:
+                if not self._period_unchanged(e):
+                    self._cache = {}
+                raise
+
+        # ACTIONS #
+
+        async def delete(self):
+            await self._session._exec(DomainDelete(domainname=self._domainname))
+            self._cache = {}
+
+        async def undelete(self):
+            await self._session._exec(DomainDeleteCancel(domainname=self._domainname))
+            self._cache = {}
+
+        async def release(self):
+            await self._session._exec(DomainTransferApprove(domainname=self._domainname))
+            self._cache = {}
+
+        async def transfer(self, token):
+            value = await self._session._exec(DomainTransfer(domainname=self._domainname, token=token))
+            self._cache = {}
+            return self._parse_transfer(value)
+
+        async def untransfer(self):
+            await self._session._exec(DomainTransferCancel(domainname=self._domainname))
+
+
+def main():
+    async def run():
+        session = AsyncEppSession(lambda: tcp_connect('testdrs.my-domain-registry.nl'), '301234', 'aabbccddee')
+        try:
+            names = ['nu.nl', 'ditdomeinisvastvrij.nl']
+            print('availability', await session.domains_are_free(names))
+            domains = [session.domain(i) for i in ('nu.nl', 'now-power.nl')]
+            print('nameservers', await asyncio.gather(*[i.get_nameservers() for i in domains]))
+        except UnexpectedData as e:
+            print('== ERROR ==')
+            print(e)
+            print()
+            print('== SENT ==')
+            print(pp(e.output))
+            print('== RECEIVED ==')
+            print(pp(e.input))
+        finally:
+            await session.close()
+
+    asyncio.run(run())
+
+
+if __name__ == '__main__':
+    main()
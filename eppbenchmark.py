@@ -0,0 +1,229 @@
+# vim: set ts=8 sw=4 sts=4 et ai:
+# Copyright (C) 2026, OSSO B.V.
+import json
+import os
+import sys
+import threading
+import time
+
+import eppsocket
+import eppxml
+from eppbulk import BulkEngine, FAILED
+from eppcommand import DomainInfo
+from eppsession import EppSession
+from eppsessionpool import EppSessionPool
+
+SCENARIOS = ('sequential', 'pipelined', 'pooled', 'bulk')
+
+
+def rss():
+    ''' Returns the current resident set size in bytes, or the peak
+    where /proc is missing. '''
+    try:
+        with open('/proc/self/statm') as fp:
+            return int(fp.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError):
+        import resource
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+
+def percentile(values, fraction):
+    ''' Returns the value at fraction (0..1) of the sorted values. '''
+    if not values:
+        return 0.0
+    return values[int(round(fraction * (len(values) - 1)))]
+
+
+class Benchmark(object):
+    '''
+    Runs the scenarios against an EPP server, usually the MockServer:
+
+    sequential: one session, one domain info at a time
+    pipelined: one session, all domain infos submitted before collecting
+    pooled: workers threads doing domain infos through an EppSessionPool
+    bulk: a BulkEngine setting the nameservers of every domain (an info
+          and, the first time, an update)
+
+    Each operation is on domain mock00000.nl and up, modulo domains.
+    Latency is measured per command, from writing it until its response
+    is parsed, with the after_receive hook.
+    '''
+    def __init__(self, address, username, password, operations=1000,
+                 workers=4, domains=1000, ssl=True):
+        self.address = address
+        self.username = username
+        self.password = password
+        self.operations = operations
+        self.workers = workers
+        self.domains = domains
+        self.ssl = ssl
+        self.lock = threading.Lock()
+        self.latencies = []
+
+    def run(self, scenario):
+        ''' Returns a dictionary with the results of the scenario. '''
+        assert scenario in SCENARIOS, scenario
+        self.latencies = []
+        started = time.time()
+        getattr(self, '_run_' + scenario)()
+        seconds = time.time() - started
+        latencies = sorted(self.latencies)
+        return {
+            'scenario': scenario, 'operations': self.operations,
+            'commands': len(latencies), 'seconds': seconds,
+            'commands_per_second': len(latencies) / max(seconds, 0.000001),
+            'p50': percentile(latencies, 0.5), 'p99': percentile(latencies, 0.99),
+            'rss': rss(),
+        }
+
+    def _names(self):
+        return ('mock%05d.nl' % (i % self.domains,) for i in range(self.operations))
+
+    def _eppxml(self):
+        return eppxml.wrap_socket(eppsocket.tcp_connect(self.address, ssl=self.ssl))
+
+    def _measure(self, command, response, stats):
+        with self.lock:
+            self.latencies.append(
+                stats['serialize'] + stats['write'] + stats['wait'] + stats['parse'])
+
+    def _session(self, pool_size=None):
+        # info_ttl=0: every info is fetched, also for a name seen before.
+        if pool_size:
+            session = EppSessionPool(
+                self._eppxml, self.username, self.password,
+                min_size=pool_size, max_size=pool_size, info_ttl=0)
+        else:
+            session = EppSession(self._eppxml, self.username, self.password, info_ttl=0)
+        session.add_hook('after_receive', self._measure)
+        return session
+
+    def _run_sequential(self):
+        session = self._session()
+        try:
+            for name in self._names():
+                session.domain(name).get_nameservers()
+        finally:
+            session.close()
+
+    def _run_pipelined(self):
+        session = self._session()
+        try:
+            for name in self._names():
+                session.submit(DomainInfo(domainname=name))
+            for pending in session.collect():
+                pending.result()
+        finally:
+            session.close()
+
+    def _run_pooled(self):
+        session = self._session(pool_size=self.workers)
+        names = self._names()
+        names_lock = threading.Lock()
+        errors = []
+
+        def work():
+            try:
+                while True:
+                    with names_lock:
+                        name = next(names, None)
+                    if name is None:
+                        break
+                    session.domain(name).get_nameservers()
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=work) for i in range(self.workers)]
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            session.close()
+        if errors:
+            raise errors[0]
+
+    def _run_bulk(self):
+        session = self._session(pool_size=self.workers)
+        nameservers = ['ns1.example.nl', 'ns3.example.nl']
+        try:
+            stats = BulkEngine(session, workers=self.workers).run(
+                (name, 'set_nameservers', (nameservers,)) for name in self._names())
+        finally:
+            session.close()
+        if stats.counts[FAILED]:
+            raise RuntimeError('bulk: %s' % (stats,))
+
+
+def main():
+    import getopt
+    import eppmockserver
+
+    usage = (
+        'Usage: %s [-n OPERATIONS] [-w WORKERS] [-l LATENCY] [-d DOMAINS]'
+        ' [-a HOST:PORT [-u USER:PASSWORD]] [-j] [SCENARIO...]\n'
+        'Scenarios: %s. Without -a, a MockServer is started in this process,\n'
+        'which then shares the CPU (and the RSS) with the client.'
+        % (sys.argv[0], ', '.join(SCENARIOS)))
+    try:
+        opts, scenarios = getopt.getopt(sys.argv[1:], 'n:w:l:d:a:u:j')
+    except getopt.GetoptError:
+        opts, scenarios = [], ['help']
+    if any(i not in SCENARIOS for i in scenarios):
+        sys.stderr.write(usage + '\n')
+        sys.exit(1)
+
+    kwargs = {}
+    address = None
+    username, password = '301234', 'aabbccddee'
+    latency = 0.0
+    as_json = False
+    for opt, value in opts:
+        if opt == '-n':
+            kwargs['operations'] = int(value)
+        elif opt == '-w':
+            kwargs['workers'] = int(value)
+        elif opt == '-l':
+            latency = float(value)
+        elif opt == '-d':
+            kwargs['domains'] = int(value)
+        elif opt == '-a':
+            host, port = value.rsplit(':', 1)
+            address = (host, int(port))
+        elif opt == '-u':
+            username, password = value.split(':', 1)
+        elif opt == '-j':
+            as_json = True
+
+    server = None
+    if address is None:
+        registry = eppmockserver.MockRegistry()
+        registry.populate(username, domains=kwargs.get('domains', 1000))
+        server = eppmockserver.MockServer(registry=registry, latency=latency).start()
+        address = server.address
+    try:
+        benchmark = Benchmark(address, username, password, **kwargs)
+        if not as_json:
+            print('%-12s %8s %8s %8s %10s %8s %8s %8s' % (
+                'scenario', 'ops', 'commands', 'seconds', 'commands/s',
+                'p50 ms', 'p99 ms', 'rss MB'))
+        for scenario in scenarios or SCENARIOS:
+            result = benchmark.run(scenario)
+            if as_json:
+                print(json.dumps(result, sort_keys=True))
+            else:
+                print('%-12s %8d %8d %8.2f %10.1f %8.2f %8.2f %8.1f' % (
+                    scenario, result['operations'], result['commands'],
+                    result['seconds'], result['commands_per_second'],
+                    result['p50'] * 1000, result['p99'] * 1000,
+                    result['rss'] / 1048576.0))
+            sys.stdout.flush()
+    finally:
+        if server is not None:
+            server.stop()
+
+
+if __name__ == '__main__':
+    main()
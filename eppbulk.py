@@ -0,0 +1,192 @@
+# vim: set ts=8 sw=4 sts=4 et ai:
+# Copyright (C) 2026, OSSO B.V.
+import threading
+import time
+from collections import deque
+try:
+    from queue import Queue
+except ImportError:  # Python 2
+    from Queue import Queue
+
+from eppsessionpool import EppSessionPool
+
+# Domain methods that may be used as bulk operations, with their
+# positional arguments. Each returns whether the domain was changed.
+OPERATIONS = {
+    'set_handles': ('registrant', 'admin', 'tech'),
+    'set_nameservers': ('nameservers',),
+    'replace_dnskeys': ('flags', 'algo', 'pubkeys'),
+    'set_period': ('period',),
+}
+
+CHANGED = 'changed'
+UNCHANGED = 'unchanged'
+FAILED = 'failed'
+SKIPPED = 'skipped'  # an earlier operation on the domain failed
+
+
+class BulkStats(object):
+    def __init__(self):
+        self.started = time.time()
+        self.submitted = 0
+        self.done = 0
+        self.counts = dict((i, 0) for i in (CHANGED, UNCHANGED, FAILED, SKIPPED))
+
+    def rate(self):
+        ''' Finished operations per second. '''
+        return self.done / max(time.time() - self.started, 0.001)
+
+    def __str__(self):
+        return '%d/%d done (%.1f/s): %s' % (
+            self.done, self.submitted, self.rate(),
+            ', '.join('%d %s' % (self.counts[i], i) for i in (
+                CHANGED, UNCHANGED, FAILED, SKIPPED)))
+
+
+class BulkEngine(object):
+    '''
+    Runs (domainname, operation, args) tuples, see OPERATIONS, with at
+    most workers domains in progress at the same time. The operations
+    on a domain run one at a time, in input order; after a failure the
+    rest of the operations on that domain are skipped.
+
+    The Domain setters fetch the current info first and send nothing
+    when there is nothing to change. Use an EppSessionPool (with
+    max_size >= workers) as session to run on more than one worker.
+    '''
+    def __init__(self, session, workers=4, queue_size=64):
+        assert workers == 1 or isinstance(session, EppSessionPool), \
+            'an EppSession cannot be shared by more than one worker'
+        self.session = session
+        self.workers = workers
+        self.queue_size = queue_size
+        self.lock = threading.Lock()
+
+    def run(self, operations, on_result=None, on_progress=None, progress_interval=5):
+        '''
+        Runs all operations and returns the BulkStats. on_result is
+        called with (domainname, operation, status, error) for every
+        operation, on_progress with the BulkStats every
+        progress_interval seconds. Both are called from any thread,
+        but never concurrently. The operations are checked (see
+        validate) before the first one runs.
+        '''
+        operations = self.validate(operations)
+        stats = BulkStats()
+        self.condition = threading.Condition(self.lock)
+        self.ready = Queue()  # domains with an operation to run
+        self.waiting = {}  # domainname -> deque of (operation, args)
+        self.queued = 0
+        self.failed_domains = set()
+        threads = [
+            threading.Thread(target=self._work, args=(stats, on_result))
+            for i in range(self.workers)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+        # At most queue_size operations per worker are queued. Every
+        # domain is taken by one worker at a time, which runs its
+        # next operation and puts it back, so the operations on a
+        # domain run in order while the other domains go on.
+        self.next_progress = time.time() + progress_interval
+        try:
+            for domainname, operation, args in operations:
+                with self.condition:
+                    while self.queued >= self.queue_size * self.workers:
+                        self._wait(stats, on_progress, progress_interval)
+                    self.queued += 1
+                    stats.submitted += 1
+                    if domainname in self.waiting:
+                        self.waiting[domainname].append((operation, args))
+                    else:
+                        self.waiting[domainname] = deque([(operation, args)])
+                        self.ready.put(domainname)
+            with self.condition:
+                while self.queued:
+                    self._wait(stats, on_progress, progress_interval)
+        finally:
+            for thread in threads:
+                self.ready.put(None)
+            for thread in threads:
+                thread.join()
+        if on_progress:
+            on_progress(stats)
+        return stats
+
+    def validate(self, operations):
+        ''' Returns the operations as a list of (domainname, operation,
+        args). Raises ValueError on an unknown operation or a wrong
+        number of arguments, so nothing runs on bad input. '''
+        ret = []
+        for number, (domainname, operation, args) in enumerate(operations, 1):
+            if operation not in OPERATIONS:
+                raise ValueError('operation %d: unknown bulk operation %r' % (number, operation))
+            args = tuple(args)
+            if len(args) != len(OPERATIONS[operation]):
+                raise ValueError('operation %d: %s takes %d arguments, got %d' % (
+                    number, operation, len(OPERATIONS[operation]), len(args)))
+            ret.append((domainname, operation, args))
+        return ret
+
+    def _wait(self, stats, on_progress, progress_interval):
+        # With the condition held: wait for a finished operation.
+        self.condition.wait(max(self.next_progress - time.time(), 0.01))
+        if on_progress and time.time() >= self.next_progress:
+            self.next_progress = time.time() + progress_interval
+            on_progress(stats)
+
+    def _work(self, stats, on_result):
+        while True:
+            domainname = self.ready.get()
+            if domainname is None:
+                break
+            with self.lock:
+                operation, args = self.waiting[domainname].popleft()
+                skip = domainname in self.failed_domains
+            error = None
+            if skip:
+                status = SKIPPED
+            else:
+                try:
+                    domain = self.session.domain(domainname)
+                    if getattr(domain, operation)(*args):
+                        status = CHANGED
+                    else:
+                        status = UNCHANGED
+                except Exception as e:
+                    status, error = FAILED, e
+            with self.condition:
+                if status == FAILED:
+                    self.failed_domains.add(domainname)
+                stats.done += 1
+                stats.counts[status] += 1
+                self.queued -= 1
+                if self.waiting[domainname]:
+                    self.ready.put(domainname)
+                else:
+                    del self.waiting[domainname]
+                self.condition.notify()
+                if on_result:
+                    on_result(domainname, operation, status, error)
+
+
+def main():
+    import sys
+    import eppsocket
+    import eppxml
+
+    pool = EppSessionPool(lambda: eppxml.wrap_socket(eppsocket.tcp_connect('testdrs.my-domain-registry.nl')), '301234', 'aabbccddee', min_size=1, max_size=4)
+    try:
+        engine = BulkEngine(pool, workers=4)
+        stats = engine.run(
+            ((i, 'set_nameservers', (['ns1.example.nl', 'ns2.example.nl'],))
+             for i in ('nu.nl', 'now-power.nl')),
+            on_result=(lambda *args: sys.stdout.write('%s %s %s %s\n' % args)))
+        print(stats)
+    finally:
+        pool.close()
+
+
+if __name__ == '__main__':
+    main()
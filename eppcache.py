@@ -0,0 +1,98 @@
+# vim: set ts=8 sw=4 sts=4 et ai:
+# Copyright (C) 2026, OSSO B.V.
+import threading
+import weakref
+from collections import OrderedDict
+
+
+class LruCache(object):
+    '''
+    Dictionary-like cache holding at most max_entries entries; the least
+    recently used entry is evicted first.
+
+    Evicted values that are still referenced elsewhere stay reachable
+    (through a weak reference) and are put back on lookup. That keeps
+    session.domain(name) a singleton for as long as the object is live.
+    '''
+    def __init__(self, max_entries=10000):
+        assert max_entries > 0
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.evicted = weakref.WeakValueDictionary()
+        self.lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.entries or key in self.evicted
+
+    def __getitem__(self, key):
+        value = self.get(key, self)
+        if value is self:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        with self.lock:
+            self.entries.pop(key, None)
+            self.evicted.pop(key, None)
+            self._insert(key, value)
+
+    def __delitem__(self, key):
+        with self.lock:
+            found = self.entries.pop(key, self) is not self
+            found = self.evicted.pop(key, self) is not self or found
+            if not found:
+                raise KeyError(key)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.evicted.clear()
+
+    def get(self, key, default=None):
+        with self.lock:
+            value = self.entries.pop(key, self)
+            if value is self:
+                value = self.evicted.pop(key, self)
+                if value is self:
+                    self.misses += 1
+                    return default
+            self.hits += 1
+            self._insert(key, value)
+            return value
+
+    def setdefault(self, key, default):
+        ''' Returns the cached value, or stores and returns default. '''
+        with self.lock:
+            value = self.entries.get(key, self)
+            if value is self:
+                value = self.evicted.pop(key, self)
+                if value is self:
+                    value = default
+            else:
+                del self.entries[key]
+            self._insert(key, value)
+            return value
+
+    def stats(self):
+        return {
+            'entries': len(self.entries), 'max_entries': self.max_entries,
+            'hits': self.hits, 'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+    def _insert(self, key, value):
+        self.entries[key] = value  # most recently used goes last
+        while len(self.entries) > self.max_entries:
+            old_key, old_value = self.entries.popitem(last=False)
+            self.evictions += 1
+            try:
+                self.evicted[old_key] = old_value
+            except TypeError:
+                pass  # not weakly referenceable
@@ -1,16 +1,6 @@
 # vim: set ts=8 sw=4 sts=4 et ai:
 # Copyright (C) 2011,2016, OSSO B.V., Walter Doekes
-if not hasattr('', 'format'):
-    from string import Template
-    import re
-
-    def str_format(string, *args, **kwargs):
-        tpl = Template(string)
-        tpl.pattern = str_format.re
-        return tpl.substitute(*args, **kwargs)
-    str_format.re = re.compile(r'\{(?P<named>[A-Za-z0-9_]+)\}')
-else:
-    str_format = (lambda x, **y: x.format(**y))
+import re
 
 
 __all__ = (
@@ -34,10 +24,65 @@ __all__ = (
 
 XPATH_OK = '/epp:epp/epp:response/epp:result[@code="1000"]'
 
+XML_HEADER = (
+    u'<?xml version="1.0" encoding="UTF-8" standalone="no"?>'
+    u'<epp xmlns="urn:ietf:params:xml:ns:epp-1.0"'
+    u' xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">')
+XML_FOOTER = u'</epp>'
+
+# Compiled templates by template string, see compile_template.
+TEMPLATES = {}
+TEMPLATE_COMMENT_RE = re.compile(r'<!--.*?-->', re.S)
+TEMPLATE_FIELD_RE = re.compile(r'\{([A-Za-z0-9_]+)\}')
+
+
+def compile_template(template):
+    '''
+    Minify the template (drop the comments and the whitespace between
+    tags) and split it into a list of literals and (fieldname, is_xml)
+    pairs. Every template is compiled only once.
+    '''
+    try:
+        return TEMPLATES[template]
+    except KeyError:
+        pass
+    minified = TEMPLATE_COMMENT_RE.sub(u'', template)
+    minified = re.sub(r'>\s+', u'>', minified)
+    minified = re.sub(r'\s+<', u'<', minified)
+    minified = re.sub(r'\s+', u' ', minified).strip()
+    fragments = []
+    for i, part in enumerate(TEMPLATE_FIELD_RE.split(minified)):
+        if i % 2 == 0:
+            if part:
+                fragments.append(part)
+        else:
+            fragments.append((part, part.startswith('__')))
+    TEMPLATES[template] = fragments
+    return fragments
+
+
+def escape(value, _search=re.compile(r'[&<>"]').search):
+    '''
+    Escape a value for use in XML text and attribute values.
+    '''
+    try:
+        if _search(value) is None:
+            return value  # the common case
+    except TypeError:
+        value = u'%s' % (value,)
+    return (
+        value.replace('&', '&amp;').replace('<', '&lt;')
+        .replace('>', '&gt;').replace('"', '&quot;'))
+
 
 class Base(object):
+    '''
+    Template variables named like __this__ hold ready-made XML and are
+    inserted as-is, all other variables are escaped.
+    '''
     template = u''
     variables = {}
+    cltrid = None  # client transaction id, set by the session
 
     def __init__(self, **kwargs):
         self.variables = self.variables.copy()
@@ -47,31 +92,53 @@ class Base(object):
                 self.variables[k] = v.decode('UTF-8')
 
     def __str__(self):
-        ret = '%s%s%s%s%s' % (
-            '<?xml version="1.0" encoding="UTF-8" standalone="no"?>',
-            '<epp xmlns="urn:ietf:params:xml:ns:epp-1.0"',
-            ' xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">',
-            self._get_body().encode('UTF-8'),
-            '</epp>'
-        )
-        return ret
+        if str is bytes:
+            return self.toxml()
+        return self.toxml().decode('UTF-8')
 
     def toxml(self, encoding='UTF-8'):
+        ''' Returns the command as encoded bytes. '''
         assert encoding == 'UTF-8'
-        return str(self)
-
-    def _get_body(self):
-        return str_format(self.template, **self.variables)
+        return u''.join(self._get_parts()).encode('UTF-8')
+
+    def serialize(self, buffer):
+        ''' Append the encoded command to the bytearray buffer. '''
+        buffer.extend(u''.join(self._get_parts()).encode('UTF-8'))
+        return buffer
+
+    def _get_parts(self):
+        parts = [XML_HEADER]
+        self._add_body(parts)
+        parts.append(XML_FOOTER)
+        return parts
+
+    def _add_body(self, parts):
+        self._add_template(parts, self.template)
+
+    def _add_template(self, parts, template):
+        variables = self.variables
+        append = parts.append
+        for fragment in compile_template(template):
+            if fragment.__class__ is tuple:
+                if fragment[1]:
+                    append(variables[fragment[0]])
+                else:
+                    append(escape(variables[fragment[0]]))
+            else:
+                append(fragment)
 
 
 class Command(Base):
     def _get_custom(self):
         return ''
 
-    def _get_body(self):
+    def _add_body(self, parts):
         self.variables['__custom__'] = self._get_custom()
-        return '<command>%s</command>' % str_format(
-            self.template, **self.variables)
+        parts.append(u'<command>')
+        self._add_template(parts, self.template)
+        if self.cltrid is not None:
+            parts.append(u'<clTRID>%s</clTRID>' % escape(self.cltrid))
+        parts.append(u'</command>')
 
 
 class Hello(Base):
@@ -99,29 +166,41 @@ class Logout(Command):
 
 class MessageQueueBase(Command):
     ''' Message queue polling base. '''
-    template = u'''<poll op="{op}"{poll_attrs}/>'''
+    template = u'''<poll op="{op}"{__poll_attrs__}/>'''
 
 
 class MessageQueueReadFirst(MessageQueueBase):
     ''' Poll for new messages in the message queue. '''
     def __init__(self):
-        super(MessageQueueReadFirst, self).__init__(op='req', poll_attrs='')
+        super(MessageQueueReadFirst, self).__init__(op='req', __poll_attrs__='')
 
 
 class MessageQueueRemoveFirst(MessageQueueBase):
     ''' Remove the first message in the message queue. '''
     def __init__(self, msgid):
         super(MessageQueueRemoveFirst, self).__init__(
-            op='ack', poll_attrs=(' msgID="%s"' % msgid))
+            op='ack', __poll_attrs__=(' msgID="%s"' % escape(msgid)))
 
 
 class ContactCheck(Command):
+    ''' Query availability of one or more contact handles. '''
     template = u'''<check>
         <contact:check xmlns:contact="urn:ietf:params:xml:ns:contact-1.0">
-            <contact:id>{handle}</contact:id>
+            {__custom__}
         </contact:check>
     </check>'''
 
+    def __init__(self, handle=None, handles=()):
+        super(ContactCheck, self).__init__()
+        self.handles = list(handles)
+        if handle is not None:
+            self.handles.insert(0, handle)
+        assert self.handles
+
+    def _get_custom(self):
+        return super(ContactCheck, self)._get_custom() + ''.join(
+            '<contact:id>%s</contact:id>' % escape(i) for i in self.handles)
+
 
 class ContactCreateUpdateBase(Command):
     # SIDN supports exactly one postalInfo and only type loc.
@@ -155,7 +234,7 @@ class ContactCreateUpdateBase(Command):
             {__endchg__}
         </contact:{__cmd__}>
     </{__cmd__}>
-    {legalform_xml}
+    {__legalform__}
     '''
 
     def __init__(self, legalform=None, legalformno=None, **kwargs):
@@ -188,23 +267,18 @@ class ContactCreateUpdateBase(Command):
                 legalform_xml = (
                     '<sidn:legalForm>%s</sidn:legalForm>'
                     '<sidn:legalFormRegNo>%s</sidn:legalFormRegNo>' % (
-                        legalform, legalformno))
+                        legalform, escape(legalformno)))
             else:
                 legalform_xml = '<sidn:legalForm>ANDERS</sidn:legalForm>'
-            kwargs['legalform_xml'] = ('''
-                <extension>
-                    <sidn:ext xmlns:sidn="http://rxsd.domain-registry.nl/sidn-ext-epp-1.0"
-                            xsi:schemaLocation="http://rxsd.domain-registry.nl/sidn-ext-epp-1.0 sidn-ext-epp-1.0.xsd">
-                        <sidn:create>
-                            <sidn:contact>
-                                {legalform_xml}
-                            </sidn:contact>
-                        </sidn:create>
-                    </sidn:ext>
-                </extension>
-            ''').format(legalform_xml=legalform_xml)
+            kwargs['__legalform__'] = (
+                '<extension>'
+                '<sidn:ext xmlns:sidn="http://rxsd.domain-registry.nl/sidn-ext-epp-1.0"'
+                ' xsi:schemaLocation="http://rxsd.domain-registry.nl/sidn-ext-epp-1.0 sidn-ext-epp-1.0.xsd">'
+                '<sidn:create><sidn:contact>%s</sidn:contact></sidn:create>'
+                '</sidn:ext>'
+                '</extension>' % (legalform_xml,))
         else:
-            kwargs['legalform_xml'] = ''
+            kwargs['__legalform__'] = ''
 
         # SIDN MUST have a dot in the phone#
         if 'phone' in kwargs:
@@ -268,11 +342,21 @@ class DomainCheck(Command):
     ''' Query availability of a (or multiple) domain(s). '''
     template = u'''<check>
         <domain:check xmlns:domain="urn:ietf:params:xml:ns:domain-1.0">
-            <!-- TODO: allow multiple names here.. -->
-            <domain:name>{domainname}</domain:name>
+            {__custom__}
         </domain:check>
     </check>'''
 
+    def __init__(self, domainname=None, domainnames=()):
+        super(DomainCheck, self).__init__()
+        self.domainnames = list(domainnames)
+        if domainname is not None:
+            self.domainnames.insert(0, domainname)
+        assert self.domainnames
+
+    def _get_custom(self):
+        return super(DomainCheck, self)._get_custom() + ''.join(
+            '<domain:name>%s</domain:name>' % escape(i) for i in self.domainnames)
+
 
 class DomainCreate(Command):
     ''' Create a new domain. '''
@@ -293,17 +377,17 @@ class DomainCreate(Command):
 
     def add_nameserver(self, nameserver):
         self.ns_list.append(
-            '<domain:hostObj>%s</domain:hostObj>' % nameserver)
+            '<domain:hostObj>%s</domain:hostObj>' % escape(nameserver))
         return self
 
     def add_admin(self, handle):
         self.add_list.append(
-            '<domain:contact type="admin">%s</domain:contact>' % handle)
+            '<domain:contact type="admin">%s</domain:contact>' % escape(handle))
         return self
 
     def add_tech(self, handle):
         self.add_list.append(
-            '<domain:contact type="tech">%s</domain:contact>' % handle)
+            '<domain:contact type="tech">%s</domain:contact>' % escape(handle))
         return self
 
     def set_registrant(self, handle):
@@ -319,7 +403,7 @@ class DomainCreate(Command):
                 '<domain:ns>%s</domain:ns>' % ''.join(self.ns_list))
         if self.registrant is not None:
             custom.append(
-                '<domain:registrant>%s</domain:registrant>' % self.registrant)
+                '<domain:registrant>%s</domain:registrant>' % escape(self.registrant))
         custom.extend(self.add_list)
 
         return super(DomainCreate, self)._get_custom() + ''.join(custom)
@@ -342,10 +426,20 @@ class DomainDeleteCancel(Base):
             <sidn-ext-epp:domainCancelDelete>
                 <sidn-ext-epp:name>{domainname}</sidn-ext-epp:name>
             </sidn-ext-epp:domainCancelDelete>
-            <!--<sidn-ext-epp:clTRID>OMVDC10T10</sidn-ext-epp:clTRID>-->
+            {__cltrid__}
         </sidn-ext-epp:command>
     </extension>'''
 
+    def _add_body(self, parts):
+        # This is not a regular <command>, the clTRID lives in the
+        # extension namespace.
+        if self.cltrid is None:
+            self.variables['__cltrid__'] = ''
+        else:
+            self.variables['__cltrid__'] = (
+                '<sidn-ext-epp:clTRID>%s</sidn-ext-epp:clTRID>' % escape(self.cltrid))
+        super(DomainDeleteCancel, self)._add_body(parts)
+
 
 class DomainInfo(Command):
     ''' Query info about an owned domain. '''
@@ -412,40 +506,53 @@ class DomainUpdate(Command):
 
     def add_nameserver(self, nameserver):
         self.add_ns_list.append(
-            '<domain:hostObj>%s</domain:hostObj>' % nameserver)
+            '<domain:hostObj>%s</domain:hostObj>' % escape(nameserver))
         return self
 
     def remove_nameserver(self, nameserver):
         self.rem_ns_list.append(
-            '<domain:hostObj>%s</domain:hostObj>' % nameserver)
+            '<domain:hostObj>%s</domain:hostObj>' % escape(nameserver))
         return self
 
     def add_admin(self, handle):
         # Could be called change_admin by a higher level function, as
         # SIDN wants exactly one admin always.
         self.add_list.append(
-            '<domain:contact type="admin">%s</domain:contact>' % handle)
+            '<domain:contact type="admin">%s</domain:contact>' % escape(handle))
         return self
 
     def remove_admin(self, handle):
         self.rem_list.append(
-            '<domain:contact type="admin">%s</domain:contact>' % handle)
+            '<domain:contact type="admin">%s</domain:contact>' % escape(handle))
         return self
 
     def add_tech(self, handle):
         self.add_list.append(
-            '<domain:contact type="tech">%s</domain:contact>' % handle)
+            '<domain:contact type="tech">%s</domain:contact>' % escape(handle))
         return self
 
     def remove_tech(self, handle):
         self.rem_list.append(
-            '<domain:contact type="tech">%s</domain:contact>' % handle)
+            '<domain:contact type="tech">%s</domain:contact>' % escape(handle))
         return self
 
     def change_registrant(self, handle):
         assert len(self.chg_list) == 0
         self.chg_list.append(
-            '<domain:registrant>%s</domain:registrant>' % handle)
+            '<domain:registrant>%s</domain:registrant>' % escape(handle))
+        return self
+
+    def extend(self, other):
+        ''' Take over the changes of another update of the same domain,
+        so they are sent as one command. '''
+        assert isinstance(self, type(other)), (self, other)
+        assert self.variables['domainname'] == other.variables['domainname']
+        self.add_list.extend(other.add_list)
+        self.add_ns_list.extend(other.add_ns_list)
+        self.rem_list.extend(other.rem_list)
+        self.rem_ns_list.extend(other.rem_ns_list)
+        self.chg_list.extend(other.chg_list)
+        assert len(self.chg_list) <= 1
         return self
 
     def _get_custom(self):
@@ -512,6 +619,13 @@ class DnssecDomainUpdate(DomainUpdate):
     def dnskey_remove(self, flags, proto, algo, pubkey):
         self.dnskey_remove_list.append((flags, proto, algo, pubkey))
 
+    def extend(self, other):
+        super(DnssecDomainUpdate, self).extend(other)
+        if isinstance(other, DnssecDomainUpdate):
+            self.dnskey_add_list.extend(other.dnskey_add_list)
+            self.dnskey_remove_list.extend(other.dnskey_remove_list)
+        return self
+
     def _get_extension(self):
         custom = []
 
@@ -525,13 +639,15 @@ class DnssecDomainUpdate(DomainUpdate):
                 custom.append('<secDNS:rem><secDNS:keyData>')
                 custom.append(
                     '<secDNS:flags>%d</secDNS:flags><secDNS:protocol>%d</secDNS:protocol>'
-                    '<secDNS:alg>%d</secDNS:alg><secDNS:pubKey>%s</secDNS:pubKey>' % remove)
+                    '<secDNS:alg>%d</secDNS:alg><secDNS:pubKey>%s</secDNS:pubKey>' % (
+                        remove[0:3] + (escape(remove[3]),)))
                 custom.append('</secDNS:keyData></secDNS:rem>')
             for add in self.dnskey_add_list:
                 custom.append('<secDNS:add><secDNS:keyData>')
                 custom.append(
                     '<secDNS:flags>%d</secDNS:flags><secDNS:protocol>%d</secDNS:protocol>'
-                    '<secDNS:alg>%d</secDNS:alg><secDNS:pubKey>%s</secDNS:pubKey>' % add)
+                    '<secDNS:alg>%d</secDNS:alg><secDNS:pubKey>%s</secDNS:pubKey>' % (
+                        add[0:3] + (escape(add[3]),)))
                 custom.append('</secDNS:keyData></secDNS:add>')
             custom.append('</secDNS:update>')
             custom.append('</extension>')
@@ -541,10 +657,11 @@ class DnssecDomainUpdate(DomainUpdate):
 
 class DomainTransferBase(Command):
     ''' Do various domain transfer operations. '''
+    variables = {'__transfer__': ''}
     template = u'''<transfer op="{op}">
         <domain:transfer xmlns:domain="urn:ietf:params:xml:ns:domain-1.0">
             <domain:name>{domainname}</domain:name>
-            {transfer_xml}
+            {__transfer__}
         </domain:transfer>
     </transfer>'''
 
@@ -553,9 +670,9 @@ class DomainTransfer(DomainTransferBase):
     ''' Request transfer of a domain. '''
     def __init__(self, domainname, token):
         super(DomainTransfer, self).__init__(
-            domainname=domainname, op='request', transfer_xml=(
+            domainname=domainname, op='request', __transfer__=(
                 ('<domain:authInfo><domain:pw>%s</domain:pw>'
-                 '</domain:authInfo>' % token)))
+                 '</domain:authInfo>' % escape(token))))
 
 
 class DomainTransferApprove(DomainTransferBase):
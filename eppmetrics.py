@@ -0,0 +1,164 @@
+# vim: set ts=8 sw=4 sts=4 et ai:
+# Copyright (C) 2026, OSSO B.V.
+import os
+import threading
+import weakref
+from bisect import bisect_left
+
+from eppxml import xpath
+
+# Histogram bucket bounds, in seconds.
+BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1, 2.5, 5, 10)
+PHASES = ('serialize', 'write', 'wait', 'parse', 'total')
+CONNECT_PHASES = ('resolve', 'connect', 'handshake')
+
+
+class Histogram(object):
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)  # the last one is +Inf
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+
+    def lines(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(BUCKETS + ('+Inf',), self.counts):
+            cumulative += count
+            yield '%s_bucket{%sle="%s"} %d' % (name, labels, bound, cumulative)
+        yield '%s_sum{%s} %r' % (name, labels.rstrip(','), self.sum)
+        yield '%s_count{%s} %d' % (name, labels.rstrip(','), cumulative)
+
+
+class Metrics(object):
+    '''
+    Collects per command class latency histograms per phase, bytes in
+    and out, result codes and (re)connects of the sessions it is
+    attached to, and exports them in the Prometheus text format.
+
+    Use as: metrics = Metrics(); metrics.attach(session)
+    '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.phases = {}  # (command, phase) -> Histogram
+        self.bytes = {}  # (command, direction) -> count
+        self.results = {}  # (command, code) -> count
+        self.connect_phases = dict((i, Histogram()) for i in CONNECT_PHASES)
+        self.connects = 0
+        self.reconnects = 0
+        self.connected = weakref.WeakSet()  # sessions seen connecting
+        self.rate_limiters = []
+
+    def attach(self, session):
+        ''' Measure the commands of the session (or pool). '''
+        session.add_hook('after_receive', self.after_receive)
+        session.add_hook('after_connect', self.after_connect)
+        if session.rate_limiter is not None and session.rate_limiter not in self.rate_limiters:
+            self.rate_limiters.append(session.rate_limiter)
+
+    # HOOKS #
+
+    def after_receive(self, command, response, stats):
+        name = command.__class__.__name__
+        code = xpath(response, '/epp:epp/epp:response/epp:result/@code')
+        code = code[0] if code else 'none'
+        total = stats['serialize'] + stats['write'] + stats['wait'] + stats['parse']
+        with self.lock:
+            for phase in PHASES:
+                key = (name, phase)
+                if key not in self.phases:
+                    self.phases[key] = Histogram()
+                self.phases[key].observe(total if phase == 'total' else stats[phase])
+            for direction in ('out', 'in'):
+                key = (name, direction)
+                self.bytes[key] = self.bytes.get(key, 0) + stats['bytes_' + direction]
+            self.results[(name, code)] = self.results.get((name, code), 0) + 1
+
+    def after_connect(self, session):
+        eppsocket = getattr(session.eppxml, 'eppsocket', None)
+        timings = getattr(eppsocket, 'timings', None) or {}
+        with self.lock:
+            self.connects += 1
+            # A pool replaces a lost session with a new one.
+            if session in self.connected or session.replacement:
+                self.reconnects += 1
+            self.connected.add(session)
+            for phase in CONNECT_PHASES:
+                if phase in timings:
+                    self.connect_phases[phase].observe(timings[phase])
+
+    # EXPORT #
+
+    def to_prometheus(self):
+        ''' Returns the metrics in the Prometheus text format. '''
+        lines = []
+        with self.lock:
+            lines.append('# HELP epp_command_seconds Seconds per EPP command phase.')
+            lines.append('# TYPE epp_command_seconds histogram')
+            for (name, phase), histogram in sorted(self.phases.items()):
+                lines.extend(histogram.lines(
+                    'epp_command_seconds', 'command="%s",phase="%s",' % (name, phase)))
+            lines.append('# HELP epp_command_bytes_total Bytes of EPP command frames.')
+            lines.append('# TYPE epp_command_bytes_total counter')
+            for (name, direction), value in sorted(self.bytes.items()):
+                lines.append('epp_command_bytes_total{command="%s",direction="%s"} %d' % (
+                    name, direction, value))
+            lines.append('# HELP epp_command_results_total EPP responses by result code.')
+            lines.append('# TYPE epp_command_results_total counter')
+            for (name, code), value in sorted(self.results.items()):
+                lines.append('epp_command_results_total{command="%s",code="%s"} %d' % (
+                    name, code, value))
+            lines.append('# HELP epp_connect_seconds Seconds per connect phase.')
+            lines.append('# TYPE epp_connect_seconds histogram')
+            for phase in CONNECT_PHASES:
+                lines.extend(self.connect_phases[phase].lines(
+                    'epp_connect_seconds', 'phase="%s",' % (phase,)))
+            lines.append('# TYPE epp_connects_total counter')
+            lines.append('epp_connects_total %d' % (self.connects,))
+            lines.append('# TYPE epp_reconnects_total counter')
+            lines.append('epp_reconnects_total %d' % (self.reconnects,))
+        if self.rate_limiters:
+            stats = [i.stats() for i in self.rate_limiters]
+            lines.append('# TYPE epp_ratelimit_wait_seconds_total counter')
+            lines.append('epp_ratelimit_wait_seconds_total %r' % (sum(i['waited'] for i in stats),))
+            lines.append('# TYPE epp_ratelimit_rejected_total counter')
+            lines.append('epp_ratelimit_rejected_total %d' % (sum(i['rejected'] for i in stats),))
+        lines.append('')
+        return '\n'.join(lines)
+
+    def write_prometheus(self, path):
+        ''' Write the metrics to path, e.g. for the textfile collector
+        of the node exporter. The file is replaced atomically. '''
+        with open(path + '.tmp', 'w') as fp:
+            fp.write(self.to_prometheus())
+        os.rename(path + '.tmp', path)
+
+    def serve_prometheus(self, port, address='127.0.0.1'):
+        ''' Serve the metrics over HTTP from a background thread.
+        Returns the server; call shutdown() on it to stop. '''
+        try:
+            from http.server import BaseHTTPRequestHandler, HTTPServer
+        except ImportError:  # Python 2
+            from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = metrics.to_prometheus().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = HTTPServer((address, port), Handler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return server
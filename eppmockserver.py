@@ -0,0 +1,716 @@
+# vim: set ts=8 sw=4 sts=4 et ai:
+# Copyright (C) 2026, OSSO B.V.
+import os
+import random
+import select
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+from itertools import count
+try:
+    from socketserver import BaseRequestHandler, TCPServer, ThreadingMixIn
+except ImportError:  # Python 2
+    from SocketServer import BaseRequestHandler, TCPServer, ThreadingMixIn
+try:
+    from ssl import SSLContext, SSLError
+    try:
+        from ssl import PROTOCOL_TLS_SERVER as PROTOCOL
+    except ImportError:
+        from ssl import PROTOCOL_SSLv23 as PROTOCOL
+except ImportError:
+    # Python 2.7.8 and older.
+    from ssl import SSLError, wrap_socket as ssl_socket
+    SSLContext = None
+
+from eppcommand import escape
+from eppsocket import EppSocket, FramingError
+from eppxml import NAMESPACES, frombuffer, qname
+
+RESULT_MESSAGES = {
+    1000: 'Command completed successfully',
+    1300: 'Command completed successfully; no messages',
+    1301: 'Command completed successfully; ack to dequeue',
+    1500: 'Command completed successfully; ending session',
+    2001: 'Command syntax error',
+    2002: 'Command use error',
+    2101: 'Unimplemented command',
+    2200: 'Authentication error',
+    2201: 'Authorization error',
+    2301: 'Object not pending transfer',
+    2302: 'Object exists',
+    2303: 'Object does not exist',
+    2306: 'Parameter value policy error',
+    2308: 'Data management policy violation',
+    2400: 'Command failed',
+}
+
+XML_HEADER = (
+    u'<?xml version="1.0" encoding="UTF-8" standalone="no"?>'
+    u'<epp xmlns="%s" %s>' % (NAMESPACES['epp'], u' '.join(
+        u'xmlns:%s="%s"' % (prefix, uri)
+        for prefix, uri in sorted(NAMESPACES.items()) if prefix != 'epp')))
+GREETING = (
+    XML_HEADER + u'<greeting><svID>eppmockserver</svID><svDate>%s</svDate>'
+    u'<svcMenu><version>1.0</version><lang>en</lang>' + u''.join(
+        u'<objURI>%s</objURI>' % (NAMESPACES[i],) for i in ('contact', 'domain')) +
+    u'<svcExtension><extURI>%s</extURI><extURI>%s</extURI></svcExtension>' % (
+        NAMESPACES['secDNS'], NAMESPACES['sidn-ext-epp']) +
+    u'</svcMenu></greeting></epp>')
+
+
+class EppError(Exception):
+    def __init__(self, code, msg=None, body=u''):
+        super(EppError, self).__init__(code, msg or RESULT_MESSAGES[code])
+        self.code = code
+        self.body = body  # like an <extension> with details
+
+
+def timestamp(when=None):
+    return time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime(when))
+
+
+def self_signed_cert(directory):
+    ''' Create a throwaway certificate for localhost in directory.
+    Returns (certfile, keyfile). Needs the openssl binary. '''
+    certfile = os.path.join(directory, 'cert.pem')
+    keyfile = os.path.join(directory, 'key.pem')
+    with open(os.devnull, 'w') as devnull:
+        subprocess.check_call(
+            ['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes',
+             '-days', '1', '-subj', '/CN=localhost',
+             '-keyout', keyfile, '-out', certfile],
+            stdout=devnull, stderr=devnull)
+    return certfile, keyfile
+
+
+def _find(element, prefix, localname):
+    return element.find(qname(prefix, localname))
+
+
+def _findall(element, prefix, localname):
+    return element.findall(qname(prefix, localname))
+
+
+def _text(element, prefix, localname, default=None):
+    found = element.find(qname(prefix, localname))
+    if found is None:
+        return default
+    return found.text or ''
+
+
+class MockRegistry(object):
+    '''
+    In-memory registry data behind the MockServer: domains, contacts
+    and a poll queue per account. With accounts (a dictionary of
+    username to password) only those may log in, otherwise anyone may.
+
+    The command methods are named after the object and command, like
+    domain_info. They get the username, the object element (like
+    domain:info) and the epp:command element, and return the result
+    code and the XML that follows the result (msgQ, resData and
+    extension), or raise EppError.
+    '''
+    def __init__(self, accounts=None):
+        self.accounts = accounts
+        self.lock = threading.Lock()
+        self.domains = {}  # name -> dict
+        self.deleted = {}  # name -> dict, until the delete is cancelled
+        self.contacts = {}  # handle -> dict
+        self.queues = {}  # username -> deque of (msgid, qdate, text, domainname)
+        self.transfers = {}  # name -> transfer data XML
+        self.ids = count(1)
+
+    def populate(self, owner, domains=1000, messages=0, prefix='mock'):
+        ''' Add domains (mock00000.nl, ...) with contacts, nameservers
+        and a DNSSEC key, owned by owner, and queue messages for it. '''
+        with self.lock:
+            handles = {}
+            for role in ('REGIS', 'ADMIN', 'TECHC'):
+                handles[role] = self._new_contact(owner, {'name': 'Mock %s' % (role,)})
+            for i in range(domains):
+                self._new_domain('%s%05d.nl' % (prefix, i), owner, {
+                    'registrant': handles['REGIS'], 'admin': [handles['ADMIN']],
+                    'tech': [handles['TECHC']],
+                    'nameservers': ['ns1.example.nl', 'ns2.example.nl'],
+                    'dnskeys': [(257, 3, 13, 'bW9jayBrZXkgJWQ=')]})
+            for i in range(messages):
+                self._queue_message(owner, '1016 Transfer from me complete', '%s%05d.nl' % (prefix, i))
+
+    def login(self, username, password):
+        return self.accounts is None or self.accounts.get(username) == password
+
+    # HELPERS #
+
+    def _new_contact(self, owner, fields):
+        handle = 'MCK%06d' % (next(self.ids),)
+        contact = {
+            'owner': owner, 'created': time.time(), 'name': '', 'street': [],
+            'city': '', 'pc': '', 'cc': 'NL', 'voice': '', 'fax': '', 'email': ''}
+        contact.update(fields)
+        self.contacts[handle] = contact
+        return handle
+
+    def _new_domain(self, name, owner, fields):
+        domain = {
+            'owner': owner, 'created': time.time(), 'period': 12,
+            'registrant': None, 'admin': [], 'tech': [], 'nameservers': [],
+            'dnskeys': [], 'token': self._new_token()}
+        domain.update(fields)
+        domain['expires'] = domain['created'] + domain['period'] * 2629800
+        self.domains[name] = domain
+        return domain
+
+    @staticmethod
+    def _new_token():
+        return '%012d' % (random.randrange(10 ** 12),)
+
+    def _queue_message(self, username, text, domainname=None):
+        self.queues.setdefault(username, deque()).append(
+            (str(next(self.ids)), timestamp(), text, domainname))
+
+    def _owned_domain(self, username, element):
+        name = _text(element, 'domain', 'name')
+        if name not in self.domains:
+            raise EppError(2303)
+        if self.domains[name]['owner'] != username:
+            raise EppError(2201)
+        return name, self.domains[name]
+
+    # CONTACT COMMANDS #
+
+    def contact_check(self, username, element, command):
+        ret = []
+        for id in _findall(element, 'contact', 'id'):
+            ret.append(u'<contact:cd><contact:id avail="%s">%s</contact:id></contact:cd>' % (
+                ('false' if id.text in self.contacts else 'true'), escape(id.text)))
+        return 1000, u'<resData><contact:chkData>%s</contact:chkData></resData>' % (u''.join(ret),)
+
+    def contact_create(self, username, element, command):
+        handle = self._new_contact(username, self._contact_fields(element))
+        return 1000, (
+            u'<resData><contact:creData><contact:id>%s</contact:id>'
+            u'<contact:crDate>%s</contact:crDate></contact:creData></resData>' % (
+                handle, timestamp()))
+
+    def contact_delete(self, username, element, command):
+        handle = _text(element, 'contact', 'id')
+        self._owned_contact(username, handle)
+        del self.contacts[handle]
+        return 1000, u''
+
+    def contact_info(self, username, element, command):
+        handle = _text(element, 'contact', 'id')
+        contact = self.contacts.get(handle)
+        if contact is None:
+            raise EppError(2303)
+        return 1000, (
+            u'<resData><contact:infData><contact:id>%s</contact:id>'
+            u'<contact:roid>%s-MOCK</contact:roid><contact:status s="ok"/>'
+            u'<contact:postalInfo type="loc"><contact:name>%s</contact:name>'
+            u'<contact:addr>%s<contact:city>%s</contact:city><contact:pc>%s</contact:pc>'
+            u'<contact:cc>%s</contact:cc></contact:addr></contact:postalInfo>'
+            u'<contact:voice>%s</contact:voice><contact:fax>%s</contact:fax>'
+            u'<contact:email>%s</contact:email><contact:clID>%s</contact:clID>'
+            u'<contact:crDate>%s</contact:crDate></contact:infData></resData>' % (
+                handle, handle, escape(contact['name']), u''.join(
+                    u'<contact:street>%s</contact:street>' % (escape(i),)
+                    for i in contact['street']),
+                escape(contact['city']), escape(contact['pc']), escape(contact['cc']),
+                escape(contact['voice']), escape(contact['fax']), escape(contact['email']),
+                escape(contact['owner']), timestamp(contact['created'])))
+
+    def contact_update(self, username, element, command):
+        contact = self._owned_contact(username, _text(element, 'contact', 'id'))
+        chg = _find(element, 'contact', 'chg')
+        if chg is not None:
+            contact.update(self._contact_fields(chg))
+        return 1000, u''
+
+    def _owned_contact(self, username, handle):
+        if handle not in self.contacts:
+            raise EppError(2303)
+        if self.contacts[handle]['owner'] != username:
+            raise EppError(2201)
+        return self.contacts[handle]
+
+    @staticmethod
+    def _contact_fields(element):
+        fields = {}
+        for name in ('voice', 'fax', 'email'):
+            if _find(element, 'contact', name) is not None:
+                fields[name] = _text(element, 'contact', name)
+        postal = _find(element, 'contact', 'postalInfo')
+        if postal is not None:
+            fields['name'] = _text(postal, 'contact', 'name', '')
+            addr = _find(postal, 'contact', 'addr')
+            if addr is not None:
+                fields['street'] = [i.text or '' for i in _findall(addr, 'contact', 'street')]
+                for name in ('city', 'pc', 'cc'):
+                    fields[name] = _text(addr, 'contact', name, '')
+        return fields
+
+    # DOMAIN COMMANDS #
+
+    def domain_check(self, username, element, command):
+        ret = []
+        for name in _findall(element, 'domain', 'name'):
+            if name.text in self.domains:
+                avail, reason = 'false', u'<domain:reason>In use</domain:reason>'
+            elif name.text in self.deleted:
+                avail, reason = 'false', u'<domain:reason>In quarantine</domain:reason>'
+            else:
+                avail, reason = 'true', u''
+            ret.append(u'<domain:cd><domain:name avail="%s">%s</domain:name>%s</domain:cd>' % (
+                avail, escape(name.text), reason))
+        return 1000, u'<resData><domain:chkData>%s</domain:chkData></resData>' % (u''.join(ret),)
+
+    def domain_create(self, username, element, command):
+        name = _text(element, 'domain', 'name')
+        if name in self.domains or name in self.deleted:
+            raise EppError(2302)
+        registrant = _text(element, 'domain', 'registrant')
+        if not registrant:
+            raise EppError(2306, 'A registrant is required')
+        contacts = _findall(element, 'domain', 'contact')
+        ns = _find(element, 'domain', 'ns')
+        domain = self._new_domain(name, username, {
+            'registrant': registrant,
+            'admin': [i.text for i in contacts if i.get('type') == 'admin'],
+            'tech': [i.text for i in contacts if i.get('type') == 'tech'],
+            'nameservers': ([] if ns is None else [i.text for i in ns])})
+        return 1000, (
+            u'<resData><domain:creData><domain:name>%s</domain:name>'
+            u'<domain:crDate>%s</domain:crDate></domain:creData></resData>' % (
+                escape(name), timestamp(domain['created'])))
+
+    def domain_delete(self, username, element, command):
+        name, domain = self._owned_domain(username, element)
+        self.deleted[name] = self.domains.pop(name)
+        return 1000, u''
+
+    def domain_info(self, username, element, command):
+        name = _text(element, 'domain', 'name')
+        domain = self.domains.get(name)
+        if domain is None:
+            raise EppError(2303)
+        ret = [
+            u'<resData><domain:infData><domain:name>%s</domain:name>'
+            u'<domain:roid>%s-MOCK</domain:roid><domain:status s="ok"/>' % (
+                escape(name), abs(hash(name)))]
+        if domain['registrant']:
+            ret.append(u'<domain:registrant>%s</domain:registrant>' % (escape(domain['registrant']),))
+        for type in ('admin', 'tech'):
+            ret.extend(
+                u'<domain:contact type="%s">%s</domain:contact>' % (type, escape(i))
+                for i in domain[type])
+        if domain['nameservers']:
+            ret.append(u'<domain:ns>%s</domain:ns>' % (u''.join(
+                u'<domain:hostObj>%s</domain:hostObj>' % (escape(i),)
+                for i in domain['nameservers']),))
+        ret.append(
+            u'<domain:clID>%s</domain:clID><domain:crDate>%s</domain:crDate>'
+            u'<domain:exDate>%s</domain:exDate>' % (
+                escape(domain['owner']), timestamp(domain['created']),
+                timestamp(domain['expires'])))
+        if domain['owner'] == username:
+            ret.append(u'<domain:authInfo><domain:pw>%s</domain:pw></domain:authInfo>' % (
+                domain['token'],))
+        ret.append(u'</domain:infData></resData>')
+        if domain['dnskeys']:
+            ret.append(u'<extension><secDNS:infData>')
+            ret.extend(
+                u'<secDNS:keyData><secDNS:flags>%d</secDNS:flags>'
+                u'<secDNS:protocol>%d</secDNS:protocol><secDNS:alg>%d</secDNS:alg>'
+                u'<secDNS:pubKey>%s</secDNS:pubKey></secDNS:keyData>' % (
+                    flags, protocol, alg, escape(pubkey))
+                for flags, protocol, alg, pubkey in domain['dnskeys'])
+            ret.append(u'</secDNS:infData></extension>')
+        return 1000, u''.join(ret)
+
+    def domain_renew(self, username, element, command):
+        name, domain = self._owned_domain(username, element)
+        period = _find(element, 'domain', 'period')
+        months = int(period.text) * (12 if period.get('unit') == 'y' else 1)
+        if months == domain['period']:
+            # Like SIDN, see eppcommand.DomainRenew.
+            raise EppError(2308, 'Validation of the transaction failed.', (
+                u'<extension><sidn-ext-epp:ext><sidn-ext-epp:response>'
+                u'<sidn-ext-epp:msg code="C0163" field="">A change of subscription'
+                u' period is only allowed if this really leads to a change.'
+                u'</sidn-ext-epp:msg></sidn-ext-epp:response></sidn-ext-epp:ext></extension>'))
+        domain['period'] = months
+        domain['expires'] = domain['created'] + months * 2629800
+        return 1000, (
+            u'<resData><domain:renData><domain:name>%s</domain:name>'
+            u'<domain:exDate>%s</domain:exDate></domain:renData></resData>' % (
+                escape(name), timestamp(domain['expires'])))
+
+    def domain_transfer(self, username, element, command):
+        op = _find(command, 'epp', 'transfer').get('op')
+        name = _text(element, 'domain', 'name')
+        if name not in self.domains:
+            raise EppError(2303)
+        domain = self.domains[name]
+        if op == 'query':
+            if name not in self.transfers:
+                raise EppError(2301)
+            return 1000, self.transfers[name]
+        elif op != 'request':
+            raise EppError(2301)  # transfers complete right away
+        if domain['owner'] == username:
+            raise EppError(2002, 'The domain is yours already')
+        authinfo = _find(element, 'domain', 'authInfo')
+        if authinfo is None or _text(authinfo, 'domain', 'pw') != domain['token']:
+            raise EppError(2201, 'Invalid token')
+        self._queue_message(domain['owner'], '1016 Transfer from me complete', name)
+        self.transfers[name] = (
+            u'<resData><domain:trnData><domain:name>%s</domain:name>'
+            u'<domain:trStatus>serverApproved</domain:trStatus>'
+            u'<domain:reID>%s</domain:reID><domain:reDate>%s</domain:reDate>'
+            u'<domain:acID>%s</domain:acID><domain:acDate>%s</domain:acDate>'
+            u'</domain:trnData></resData>' % (
+                escape(name), escape(username), timestamp(),
+                escape(domain['owner']), timestamp()))
+        domain['owner'] = username
+        domain['token'] = self._new_token()
+        return 1000, self.transfers[name]
+
+    def domain_update(self, username, element, command):
+        name, domain = self._owned_domain(username, element)
+        # Change copies, so a failing update changes nothing.
+        changed = dict(
+            (i, list(domain[i])) for i in ('admin', 'tech', 'nameservers', 'dnskeys'))
+        for section, change in (('rem', self._remove), ('add', self._add)):
+            found = _find(element, 'domain', section)
+            if found is None:
+                continue
+            for contact in _findall(found, 'domain', 'contact'):
+                if contact.get('type') not in ('admin', 'tech'):
+                    raise EppError(2306, 'Unknown contact type')
+                change(changed[contact.get('type')], contact.text)
+            for ns in _findall(found, 'domain', 'ns'):
+                for host in ns:
+                    change(changed['nameservers'], host.text)
+        chg = _find(element, 'domain', 'chg')
+        if chg is not None and _find(chg, 'domain', 'registrant') is not None:
+            changed['registrant'] = _text(chg, 'domain', 'registrant')
+
+        extension = _find(command, 'epp', 'extension')
+        secdns = None if extension is None else _find(extension, 'secDNS', 'update')
+        if secdns is not None:
+            for section, change in (('rem', self._remove), ('add', self._add)):
+                for found in _findall(secdns, 'secDNS', section):
+                    if _text(found, 'secDNS', 'all') == 'true':
+                        del changed['dnskeys'][:]
+                    for key in _findall(found, 'secDNS', 'keyData'):
+                        change(changed['dnskeys'], (
+                            int(_text(key, 'secDNS', 'flags')),
+                            int(_text(key, 'secDNS', 'protocol')),
+                            int(_text(key, 'secDNS', 'alg')),
+                            _text(key, 'secDNS', 'pubKey')))
+        domain.update(changed)
+        return 1000, u''
+
+    @staticmethod
+    def _add(values, value):
+        if value in values:
+            raise EppError(2306, '%s is present already' % (value,))
+        values.append(value)
+
+    @staticmethod
+    def _remove(values, value):
+        if value not in values:
+            raise EppError(2306, '%s is not present' % (value,))
+        values.remove(value)
+
+    def domain_cancel_delete(self, username, element, command):
+        name = _text(element, 'sidn-ext-epp', 'name')
+        if name not in self.deleted:
+            raise EppError(2303)
+        if self.deleted[name]['owner'] != username:
+            raise EppError(2201)
+        self.domains[name] = self.deleted.pop(name)
+        return 1000, u''
+
+    # MESSAGE QUEUE #
+
+    def poll(self, username, element, command):
+        queue = self.queues.get(username) or deque()
+        if element.get('op') == 'ack':
+            if not queue or queue[0][0] != element.get('msgID'):
+                raise EppError(2303)
+            queue.popleft()
+            if not queue:
+                return 1000, u''
+            return 1000, u'<msgQ count="%d" id="%s"/>' % (len(queue), queue[0][0])
+        if not queue:
+            return 1300, u''
+        msgid, qdate, text, domainname = queue[0]
+        ret = u'<msgQ count="%d" id="%s"><qDate>%s</qDate><msg>%s</msg></msgQ>' % (
+            len(queue), msgid, qdate, escape(text))
+        if domainname is not None:
+            ret += (
+                u'<resData><domain:trnData><domain:name>%s</domain:name>'
+                u'</domain:trnData></resData>' % (escape(domainname),))
+        return 1301, ret
+
+
+class MockHandler(BaseRequestHandler):
+    '''
+    One connection. Responses are sent latency (plus jitter) seconds
+    after the command came in and always in order, so pipelined
+    commands overlap their waits like they would on a real link.
+    '''
+    def handle(self):
+        server = self.server
+        sock = self.request
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            if server.ssl_context is not None:
+                sock = server.ssl_context.wrap_socket(sock, server_side=True)
+            elif server.certfile is not None:
+                sock = ssl_socket(sock, server_side=True, certfile=server.certfile, keyfile=server.keyfile)
+            self.eppsocket = EppSocket(sock)
+            self.username = None
+            self.serve(sock)
+        except (FramingError, SSLError, socket.error):
+            pass  # the client hung up
+        finally:
+            try:
+                sock.close()
+            except Exception:
+                pass
+
+    def serve(self, sock):
+        server = self.server
+        outgoing = deque()  # (due, frame or None to hang up)
+        outgoing.append((0, (GREETING % (timestamp(),)).encode('utf-8')))
+        while True:
+            now = time.time()
+            frames = []
+            while outgoing and outgoing[0][0] <= now:
+                frame = outgoing.popleft()[1]
+                if frame is None:
+                    if frames:
+                        self.eppsocket.write_many(frames)
+                    return
+                frames.append(frame)
+            if frames:
+                self.eppsocket.write_many(frames)
+            timeout = (outgoing[0][0] - now) if outgoing else None
+            if not (getattr(sock, 'pending', None) and sock.pending()):
+                if not select.select([sock], [], [], timeout)[0]:
+                    continue
+            data = self.eppsocket.read()
+            due = max(time.time() + server.delay(), outgoing[-1][0] if outgoing else 0)
+            response, hang_up = self.respond(data)
+            if response is not None:
+                outgoing.append((due, response))
+            if hang_up:
+                outgoing.append((due, None))
+
+    def respond(self, data):
+        ''' Returns the response frame (or None) and whether to hang up
+        after it. '''
+        server = self.server
+        try:
+            root = frombuffer(data)
+        except Exception:
+            return self.result(2001, None, u''), False
+        for command in root:
+            break
+        else:
+            return self.result(2001, None, u''), False
+
+        if command.tag == qname('epp', 'hello'):
+            return (GREETING % (timestamp(),)).encode('utf-8'), False
+        if command.tag == qname('epp', 'extension'):
+            # SIDN commands, like domainCancelDelete, with their own clTRID.
+            command = _find(command, 'sidn-ext-epp', 'command')
+            if command is None or len(command) == 0:
+                return self.result(2101, None, u''), False
+            element = command[0]
+            cltrid = _text(command, 'sidn-ext-epp', 'clTRID')
+            method = {'domainCancelDelete': 'domain_cancel_delete'}.get(
+                element.tag.rsplit('}', 1)[-1])
+        elif command.tag == qname('epp', 'command') and len(command):
+            verb = command[0].tag.rsplit('}', 1)[-1]
+            cltrid = _text(command, 'epp', 'clTRID')
+            if verb in ('login', 'logout'):
+                return self.login_logout(verb, command[0], cltrid)
+            elif verb == 'poll':
+                element, method = command[0], 'poll'
+            elif len(command[0]):
+                element = command[0][0]
+                prefix = element.tag[1:].split('}')[0]
+                prefix = dict((v, k) for k, v in NAMESPACES.items()).get(prefix)
+                method = '%s_%s' % (prefix, verb)
+            else:
+                return self.result(2001, cltrid, u''), False
+        else:
+            return self.result(2001, None, u''), False
+
+        if self.username is None:
+            return self.result(2002, cltrid, u'', 'Log in first'), False
+        if random.random() < server.disconnect_rate:
+            return None, True
+        if random.random() < server.error_rate:
+            return self.result(server.error_code, cltrid, u''), False
+        registry = server.registry
+        if method is None or not hasattr(registry, method):
+            return self.result(2101, cltrid, u''), False
+        try:
+            with registry.lock:
+                code, body = getattr(registry, method)(self.username, element, command)
+        except EppError as e:
+            return self.result(e.code, cltrid, e.body, e.args[1]), False
+        return self.result(code, cltrid, body), False
+
+    def login_logout(self, verb, element, cltrid):
+        if verb == 'logout':
+            self.username = None
+            return self.result(1500, cltrid, u''), True
+        if self.username is not None:
+            return self.result(2002, cltrid, u'', 'Logged in already'), False
+        username = _text(element, 'epp', 'clID')
+        if not self.server.registry.login(username, _text(element, 'epp', 'pw')):
+            return self.result(2200, cltrid, u''), True
+        self.username = username
+        return self.result(1000, cltrid, u''), False
+
+    def result(self, code, cltrid, body, msg=None):
+        return (
+            XML_HEADER +
+            u'<response><result code="%d"><msg>%s</msg></result>%s<trID>%s'
+            u'<svTRID>MOCK%d</svTRID></trID></response></epp>' % (
+                code, escape(msg or RESULT_MESSAGES[code]), body,
+                (u'' if cltrid is None else u'<clTRID>%s</clTRID>' % (escape(cltrid),)),
+                next(self.server.svtrids))).encode('utf-8')
+
+
+class MockServer(ThreadingMixIn, TCPServer):
+    '''
+    A local stand-in for the registry, speaking EPP over TLS (or plain
+    TCP with ssl=False) on address, for tests and benchmarks.
+
+    Every response is delayed by latency plus a random part of jitter
+    seconds. After login, a command gets error_code instead of its
+    result with chance error_rate, and the connection is dropped
+    without a response with chance disconnect_rate. Without a
+    certfile, a self-signed certificate is created with openssl.
+
+    Use as: server = MockServer().start(); ...; server.stop()
+    '''
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address=('127.0.0.1', 0), registry=None, ssl=True,
+                 certfile=None, keyfile=None, latency=0.0, jitter=0.0,
+                 error_rate=0.0, error_code=2400, disconnect_rate=0.0):
+        self.registry = registry or MockRegistry()
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_code = error_code
+        self.disconnect_rate = disconnect_rate
+        self.svtrids = count(1)
+        self.tempdir = None
+        self.ssl_context = None
+        self.certfile = self.keyfile = None
+        if ssl:
+            if certfile is None:
+                self.tempdir = tempfile.mkdtemp(prefix='eppmockserver-')
+                certfile, keyfile = self_signed_cert(self.tempdir)
+            self.certfile, self.keyfile = certfile, keyfile
+            if SSLContext is not None:
+                self.ssl_context = SSLContext(PROTOCOL)
+                self.ssl_context.load_cert_chain(certfile, keyfile)
+        TCPServer.__init__(self, address, MockHandler)
+        self.thread = None
+
+    @property
+    def address(self):
+        ''' The (host, port) to connect to, e.g. with tcp_connect. '''
+        return self.server_address[0:2]
+
+    def delay(self):
+        return self.latency + random.random() * self.jitter
+
+    def start(self):
+        ''' Serve from a background thread. Returns self. '''
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        if self.thread is not None:
+            self.shutdown()
+            self.thread.join()
+            self.thread = None
+        self.server_close()
+        if self.tempdir is not None:
+            shutil.rmtree(self.tempdir, ignore_errors=True)
+            self.tempdir = None
+
+
+def main():
+    import getopt
+
+    usage = (
+        'Usage: %s [-a HOST:PORT] [-l LATENCY] [-j JITTER] [-e ERROR_RATE]'
+        ' [-d DISCONNECT_RATE] [-n DOMAINS] [-u USER:PASSWORD]... [-c CERTFILE -k KEYFILE]'
+        % (sys.argv[0],))
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'a:l:j:e:d:n:u:c:k:')
+    except getopt.GetoptError:
+        opts, args = None, True
+    if args:
+        sys.stderr.write(usage + '\n')
+        sys.exit(1)
+
+    host, port = '127.0.0.1', 7700
+    kwargs = {}
+    domains = 1000
+    accounts = {}
+    for opt, value in opts:
+        if opt == '-a':
+            host, port = value.rsplit(':', 1)
+            port = int(port)
+        elif opt in ('-l', '-j', '-e', '-d'):
+            kwargs[{'-l': 'latency', '-j': 'jitter', '-e': 'error_rate',
+                    '-d': 'disconnect_rate'}[opt]] = float(value)
+        elif opt == '-n':
+            domains = int(value)
+        elif opt == '-u':
+            username, password = value.split(':', 1)
+            accounts[username] = password
+        elif opt == '-c':
+            kwargs['certfile'] = value
+        elif opt == '-k':
+            kwargs['keyfile'] = value
+
+    registry = MockRegistry(accounts or None)
+    usernames = sorted(accounts) or ['301234']
+    for username in usernames:
+        prefix = 'mock' if len(usernames) == 1 else 'mock%s-' % (username,)
+        registry.populate(username, domains=domains, messages=10, prefix=prefix)
+    server = MockServer((host, port), registry=registry, **kwargs)
+    print('Serving EPP on %s:%d, populated for %s' % (
+        server.address + (', '.join(usernames),)))
+    sys.stdout.flush()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,194 @@
+# vim: set ts=8 sw=4 sts=4 et ai:
+# Copyright (C) 2026, OSSO B.V.
+import os
+import struct
+import threading
+import time
+try:
+    import fcntl
+except ImportError:  # not on Windows
+    fcntl = None
+
+BLOCK = 'block'
+REJECT = 'reject'
+
+# Rate limiters by account, e.g. (host, username), so every session of
+# an account in this process draws from the same buckets.
+RATE_LIMITERS = {}
+RATE_LIMITERS_LOCK = threading.Lock()
+
+
+class RateLimited(Exception):
+    pass
+
+
+class TokenBucket(object):
+    '''
+    Allows rate commands per second on average and bursts of up to
+    burst commands.
+    '''
+    def __init__(self, rate, burst=None):
+        assert rate > 0
+        self.rate = float(rate)
+        self.burst = float(burst or rate)
+        self.tokens = self.burst
+        self.last = time.time()
+        self.lock = threading.Lock()
+
+    def take(self, block=True, deadline=None):
+        ''' Takes a token. Returns the seconds spent waiting for it, or
+        raises RateLimited if we may not wait (long enough). '''
+        waited = 0.0
+        while True:
+            wait = self._take(time.time())
+            if not wait:
+                return waited
+            if not block or (deadline is not None and time.time() + wait > deadline):
+                raise RateLimited('rate limit of %g/s exceeded' % (self.rate,))
+            time.sleep(wait)
+            waited += wait
+
+    def give_back(self):
+        ''' Returns a token that was taken but not used. '''
+        self._update(time.time(), self._refill_and_give_back)
+
+    def _take(self, now):
+        return self._update(now, self._refill_and_take)
+
+    def _update(self, now, step):
+        with self.lock:
+            self.tokens, self.last, wait = step(self.tokens, self.last, now)
+        return wait
+
+    def _refill_and_take(self, tokens, last, now):
+        # Returns the new tokens and last, and the time to wait.
+        tokens = min(self.burst, tokens + max(now - last, 0) * self.rate)
+        if tokens >= 1:
+            return tokens - 1, now, 0
+        return tokens, now, (1 - tokens) / self.rate
+
+    def _refill_and_give_back(self, tokens, last, now):
+        tokens = min(self.burst, tokens + max(now - last, 0) * self.rate + 1)
+        return tokens, now, 0
+
+
+class FileTokenBucket(TokenBucket):
+    '''
+    A TokenBucket that keeps its state in a file, so all processes that
+    use the same file share the bucket. Uses fcntl locks. The file is
+    only open while the bucket is updated, so nothing needs closing.
+    '''
+    STATE = struct.Struct('=dd')  # tokens, last
+
+    def __init__(self, path, rate, burst=None):
+        if fcntl is None:
+            raise NotImplementedError('FileTokenBucket needs fcntl')
+        super(FileTokenBucket, self).__init__(rate, burst)
+        self.path = path
+
+    def _update(self, now, step):
+        with self.lock:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                # Closing the file releases the lock.
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                data = os.read(fd, self.STATE.size)
+                if len(data) == self.STATE.size:
+                    tokens, last = self.STATE.unpack(data)
+                else:
+                    tokens, last = self.burst, now
+                tokens, last, wait = step(tokens, last, now)
+                os.lseek(fd, 0, os.SEEK_SET)
+                os.write(fd, self.STATE.pack(tokens, last))
+            finally:
+                os.close(fd)
+        return wait
+
+
+class RateLimiter(object):
+    '''
+    Token buckets for a registrar account: one for all commands (rate,
+    burst) and one per command class (command_rates, a dictionary of
+    class name to (rate, burst)). A command class also matches its
+    subclasses, e.g. DomainUpdate covers DnssecDomainUpdate.
+
+    With policy BLOCK, acquire() waits for a token, for at most max_wait
+    seconds if set. With policy REJECT it raises RateLimited instead.
+    With a path, the buckets live in files starting with that path and
+    are shared with other processes.
+    '''
+    def __init__(self, rate=None, burst=None, command_rates=None,
+                 policy=BLOCK, max_wait=None, path=None):
+        assert policy in (BLOCK, REJECT)
+        self.policy = policy
+        self.max_wait = max_wait
+        self.path = path
+        self.bucket = None
+        if rate:
+            self.bucket = self._new_bucket('', rate, burst)
+        self.command_buckets = {}
+        for name, (command_rate, command_burst) in (command_rates or {}).items():
+            self.command_buckets[name] = self._new_bucket(
+                '.' + name, command_rate, command_burst)
+        self.lock = threading.Lock()
+        self.acquired = 0
+        self.delayed = 0  # commands that had to wait
+        self.waited = 0.0  # total seconds of waiting
+        self.rejected = 0
+
+    def _new_bucket(self, suffix, rate, burst):
+        if self.path is None:
+            return TokenBucket(rate, burst)
+        return FileTokenBucket(self.path + suffix, rate, burst)
+
+    def acquire(self, command):
+        ''' Waits until the command may be sent. Returns the seconds
+        waited. '''
+        buckets = [self.bucket] if self.bucket else []
+        for cls in type(command).__mro__:
+            if cls.__name__ in self.command_buckets:
+                buckets.append(self.command_buckets[cls.__name__])
+                break
+        block = (self.policy == BLOCK)
+        deadline = None
+        if block and self.max_wait is not None:
+            deadline = time.time() + self.max_wait
+        waited = 0.0
+        taken = []
+        try:
+            for bucket in buckets:
+                waited += bucket.take(block=block, deadline=deadline)
+                taken.append(bucket)
+        except RateLimited:
+            # The command is not sent; do not let it use up the tokens
+            # of the other buckets.
+            for bucket in taken:
+                bucket.give_back()
+            with self.lock:
+                self.rejected += 1
+                self.waited += waited
+            raise
+        with self.lock:
+            self.acquired += 1
+            if waited:
+                self.delayed += 1
+                self.waited += waited
+        return waited
+
+    def stats(self):
+        with self.lock:
+            return {
+                'acquired': self.acquired, 'delayed': self.delayed,
+                'waited': self.waited, 'rejected': self.rejected,
+            }
+
+
+def rate_limiter(account, **kwargs):
+    '''
+    Returns the RateLimiter of the account, e.g. (host, username),
+    creating it with kwargs if this process has none yet.
+    '''
+    with RATE_LIMITERS_LOCK:
+        if account not in RATE_LIMITERS:
+            RATE_LIMITERS[account] = RateLimiter(**kwargs)
+        return RATE_LIMITERS[account]
@@ -0,0 +1,294 @@
+# vim: set ts=8 sw=4 sts=4 et ai:
+# Copyright (C) 2026, OSSO B.V.
+import json
+import sys
+from collections import OrderedDict, deque
+
+from eppbulk import CHANGED, FAILED, UNCHANGED
+from eppcommand import DnssecDomainUpdate, DomainRenew, DomainUpdate
+from eppxml import UnexpectedData
+
+FIELDS = ('registrant', 'admin', 'tech', 'nameservers', 'dnskeys', 'period')
+PERIODS = (1, 3, 12)
+
+
+def load_desired(fp):
+    '''
+    Reads the desired state, a JSON object of domain name to an object
+    with any of:
+
+        "registrant": "ABC000123",
+        "admin": ["ABC000123"], "tech": ["DEF000456", ...],
+        "nameservers": ["ns1.example.nl", ...],
+        "dnskeys": [{"flags": 257, "algo": 13, "key": "base64..."}, ...],
+        "period": 12
+
+    Fields that are left out are left as-is; "dnskeys": [] removes all
+    keys. Returns an OrderedDict of domain name to the desired fields,
+    with the keys grouped as {flags: (algo, [key, ...])}. Raises
+    ValueError on bad input.
+    '''
+    desired = json.load(fp, object_pairs_hook=OrderedDict)
+    if not isinstance(desired, dict):
+        raise ValueError('Expected an object of domain names')
+    ret = OrderedDict()
+    for domainname, wanted in desired.items():
+        try:
+            ret[domainname.lower()] = _parse_wanted(wanted)
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError('%s: %s' % (domainname, e))
+    return ret
+
+
+def _parse_wanted(wanted):
+    unknown = set(wanted).difference(FIELDS)
+    if unknown:
+        raise ValueError('unknown field(s) %s' % (', '.join(sorted(unknown)),))
+    ret = {}
+    if wanted.get('registrant') is not None:
+        ret['registrant'] = wanted['registrant']
+    for field in ('admin', 'tech', 'nameservers'):
+        value = wanted.get(field)
+        if value is None:
+            continue
+        if not isinstance(value, list):
+            value = [value]
+        if field == 'nameservers':
+            if not value:
+                raise ValueError('nameservers may not be empty')
+            value = [i.lower() for i in value]
+        ret[field] = value
+    if wanted.get('dnskeys') is not None:
+        ret['dnskeys'] = {}
+        for key in wanted['dnskeys']:
+            flags, algo = int(key['flags']), int(key['algo'])
+            # Domain.replace_dnskeys does one algorithm per flags.
+            if ret['dnskeys'].setdefault(flags, (algo, []))[0] != algo:
+                raise ValueError('more than one algorithm for flags %d' % (flags,))
+            ret['dnskeys'][flags][1].append(key['key'])
+    if wanted.get('period') is not None:
+        if int(wanted['period']) not in PERIODS:
+            raise ValueError('period must be 1, 3 or 12')
+        ret['period'] = int(wanted['period'])
+    return ret
+
+
+class DomainPlan(object):
+    '''
+    What it takes to bring a domain to its desired state: changes holds
+    readable lines like "nameservers: +ns3.example.nl -ns2.example.nl",
+    commands the DomainUpdate (or DnssecDomainUpdate, holding all
+    changes at once) and DomainRenew to send. Without commands, the
+    domain is as desired already, unless error (the info failed) is set.
+    '''
+    def __init__(self, domain):
+        self.domain = domain
+        self.changes = []
+        self.commands = []
+        self.error = None
+
+    @property
+    def period_only(self):
+        ''' True if the only command is a renew to a period that may well
+        be the current one already. '''
+        return (len(self.commands) == 1 and
+                isinstance(self.commands[0], DomainRenew) and
+                self.domain._load_period() is None)
+
+    @property
+    def name(self):
+        return self.domain.name
+
+    def __repr__(self):
+        return '<DomainPlan(%r, %d commands)>' % (self.name, len(self.commands))
+
+    def __str__(self):
+        lines = [self.name]
+        if self.error is not None:
+            lines.append('  error: %s: %s' % (self.error.__class__.__name__, self.error))
+        lines.extend('  %s' % (i,) for i in self.changes)
+        return '\n'.join(lines)
+
+
+class Reconciler(object):
+    '''
+    Compares the desired state (see load_desired) with the registry and
+    plans the fewest commands to get there: per domain at most one
+    update, with the handle, nameserver and DNSSEC changes together,
+    and one renew. Domains that are as desired get no commands. The
+    differences are computed by the same Domain methods that set_handles,
+    set_nameservers and replace_dnskeys use.
+
+    The info response does not tell the current period, so a renew is
+    planned whenever a period is desired and the session store does not
+    know it (see EppStore.load_period); when the period turns out to be
+    unchanged already, that renew counts as unchanged. Such plans are
+    period_only.
+
+    Use as: reconciler = Reconciler(session)
+            plans = reconciler.plan(load_desired(fp))
+            for plan in plans: print(plan)  # dry run
+            reconciler.apply(plans)
+    '''
+    def __init__(self, session):
+        self.session = session
+
+    def plan(self, desired, chunk_size=1000):
+        ''' Returns a DomainPlan for every domain, in order. The infos
+        are prefetched chunk_size domains at a time. '''
+        plans = []
+        names = list(desired)
+        for start in range(0, len(names), chunk_size):
+            chunk = names[start:start + chunk_size]
+            errors = self.session.prefetch_domains(chunk)
+            plans.extend(
+                self._plan_domain(domainname, desired[domainname], errors.get(domainname))
+                for domainname in chunk)
+        return plans
+
+    def apply(self, plans, on_result=None, window=None):
+        '''
+        Sends the commands of the plans, pipelined, with the commands of
+        at most window (default pipeline_depth) plans in flight, and
+        returns a dictionary of status (eppbulk CHANGED, UNCHANGED or
+        FAILED) to the number of domains. The error of a failed domain
+        is set on its plan. on_result is called with (plan, status) per
+        domain, as soon as its results are in.
+        '''
+        window = window or self.session.pipeline_depth
+        counts = dict((i, 0) for i in (CHANGED, UNCHANGED, FAILED))
+        in_flight = deque()
+        for plan in plans:
+            pendings = []
+            if plan.error is None:
+                try:
+                    for command in plan.commands:
+                        pendings.append(self.session.submit(command))
+                except Exception as e:
+                    plan.error = e
+            in_flight.append((plan, pendings))
+            if len(in_flight) >= window:
+                self._applied(counts, on_result, *in_flight.popleft())
+        while in_flight:
+            self._applied(counts, on_result, *in_flight.popleft())
+        return counts
+
+    def _applied(self, counts, on_result, plan, pendings):
+        status = UNCHANGED
+        for pending in pendings:
+            try:
+                pending.result()
+                status = CHANGED
+            except Exception as e:
+                if not (isinstance(pending.command, DomainRenew) and
+                        plan.domain._period_unchanged(e)):
+                    plan.error = e
+                    continue
+            if isinstance(pending.command, DomainRenew):
+                plan.domain._save_period(int(pending.command.variables['period']))
+        if plan.commands:
+            plan.domain._cache = {}
+        if plan.error is not None:
+            status = FAILED
+        counts[status] += 1
+        if on_result is not None:
+            on_result(plan, status)
+
+    def _plan_domain(self, domainname, wanted, error=None):
+        domain = self.session.domain(domainname)
+        plan = DomainPlan(domain)
+        if error is not None:
+            plan.error = error
+            return plan
+        try:
+            info = domain._info()
+        except UnexpectedData as e:
+            plan.error = e
+            return plan
+
+        updates = []
+        if any(i in wanted for i in ('registrant', 'admin', 'tech')):
+            old = domain._parse_handles(info)
+            registrant = wanted.get('registrant')
+            updates.append(domain._set_handles_cmd(
+                old, (None if registrant is None else [registrant]),
+                wanted.get('admin'), wanted.get('tech')))
+            if registrant is not None and old['registrant'] != set([registrant]):
+                plan.changes.append('registrant: %s -> %s' % (
+                    ', '.join(old['registrant']) or '-', registrant))
+            for field in ('admin', 'tech'):
+                if field in wanted:
+                    self._describe(plan, field, old[field], wanted[field])
+
+        if 'nameservers' in wanted:
+            old = domain._parse_nameservers(info)
+            updates.append(domain._set_nameservers_cmd(old, wanted['nameservers']))
+            self._describe(plan, 'nameservers', old, wanted['nameservers'])
+
+        if 'dnskeys' in wanted:
+            # Keys with flags that are not desired at all are removed.
+            all_flags = set(wanted['dnskeys']).union(i.flags for i in info.dnskeys)
+            for flags in sorted(all_flags, reverse=True):
+                algo, keys = wanted['dnskeys'].get(flags, (None, []))
+                update_cmd = domain._replace_dnskeys_cmd(
+                    domain._parse_dnskeys(info, flags), flags, algo, keys)
+                if update_cmd is not None:
+                    updates.append(update_cmd)
+                    plan.changes.append('dnskeys %d: %s' % (flags, ' '.join(
+                        ['+%d %d %s' % (i[1], i[2], i[3]) for i in update_cmd.dnskey_add_list] +
+                        ['-%d %d %s' % (i[1], i[2], i[3]) for i in update_cmd.dnskey_remove_list])))
+
+        updates = [i for i in updates if i is not None]
+        if updates:
+            if any(isinstance(i, DnssecDomainUpdate) for i in updates):
+                update_cmd = DnssecDomainUpdate(domainname=domainname)
+            else:
+                update_cmd = DomainUpdate(domainname=domainname)
+            for i in updates:
+                update_cmd.extend(i)
+            plan.commands.append(update_cmd)
+
+        if 'period' in wanted:
+            period = domain._load_period()
+            if period is None:
+                plan.commands.append(DomainRenew(domainname=domainname, period=wanted['period']))
+                plan.changes.append('period: ? -> %d (unless unchanged)' % (wanted['period'],))
+            elif period != wanted['period']:
+                plan.commands.append(DomainRenew(domainname=domainname, period=wanted['period']))
+                plan.changes.append('period: %d -> %d' % (period, wanted['period']))
+        return plan
+
+    @staticmethod
+    def _describe(plan, field, old, new):
+        new = set(new)
+        if old != new:
+            plan.changes.append('%s: %s' % (field, ' '.join(
+                ['+%s' % (i,) for i in sorted(new.difference(old))] +
+                ['-%s' % (i,) for i in sorted(set(old).difference(new))])))
+
+
+def main():
+    import eppsession
+    import eppsocket
+    import eppxml
+
+    if len(sys.argv) != 4:
+        sys.stderr.write(
+            'Usage: %s DESIREDFILE USERNAME PASSWORD\n'
+            'Prints the plan against the SIDN test registry; changes nothing.\n' % (
+                sys.argv[0],))
+        sys.exit(1)
+    with open(sys.argv[1]) as fp:
+        desired = load_desired(fp)
+    eppxml_generator = (lambda: eppxml.wrap_socket(eppsocket.tcp_connect('testdrs.my-domain-registry.nl')))
+    session = eppsession.EppSession(eppxml_generator, sys.argv[2], sys.argv[3])
+    try:
+        for plan in Reconciler(session).plan(desired):
+            if plan.commands or plan.error is not None:
+                print(plan)
+    finally:
+        session.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,308 @@
+# vim: set ts=8 sw=4 sts=4 et ai:
+# Copyright (C) 2026, OSSO B.V.
+import json
+import select
+import sys
+import threading
+import time
+from collections import OrderedDict
+from itertools import count
+
+from lxml import etree
+
+import eppsocket
+from eppbenchmark import percentile
+from eppcommand import Login, Logout
+from eppsocket import MAX_FRAME_SIZE
+from epptrace import TraceWriter
+from eppxml import UnexpectedData, fromdom, wrap_socket, xpath
+
+XPATH_OK = '/epp:epp/epp:response/epp:result[@code="1000"]'
+XPATH_CLTRID = '/epp:epp/epp:response/epp:trID/epp:clTRID'
+XPATH_CODE = '/epp:epp/epp:response/epp:result/@code'
+SESSION_COMMANDS = ('hello', 'login', 'logout')  # done by the replay itself
+
+
+class Capture(object):
+    '''
+    Records the commands and responses of EppXml connections in file,
+    as epptrace JSON lines with a conn number per connection. Payloads
+    are kept whole; passwords and tokens are still redacted.
+
+    Use as: capture = Capture('run.jsonl')
+            session = EppSession(capture.wrap(eppxml_generator), ...)
+    '''
+    def __init__(self, file):
+        self.file = None
+        if not hasattr(file, 'write'):
+            file = self.file = open(file, 'w')  # a new capture, not appended
+        self.writer = TraceWriter(file, max_payload=MAX_FRAME_SIZE)
+        self.connections = count(1)
+
+    def wrap(self, eppxml_generator):
+        ''' Returns an eppxml_generator whose connections are captured. '''
+        def generator():
+            return CapturedEppXml(eppxml_generator(), self.writer, next(self.connections))
+        return generator
+
+    def close(self):
+        self.writer.close()
+        if self.file is not None:
+            self.file.close()
+
+
+class CapturedEppXml(object):
+    ''' An EppXml that hands every frame it writes or reads to the
+    TraceWriter. Everything else goes to the EppXml itself. '''
+    def __init__(self, eppxml, writer, connection):
+        self.eppxml = eppxml
+        self.writer = writer
+        self.connection = connection
+
+    def __getattr__(self, name):
+        return getattr(self.eppxml, name)
+
+    def close(self):
+        self.eppxml.close()
+
+    def expect(self, write, xpath_read_check):
+        if write is not None:
+            self.write(write)
+        xml = self.read()
+        if xpath_read_check is not None:
+            if not xpath(xml, xpath_read_check):
+                raise UnexpectedData(write, xml, xpath_read_check)
+        return xml
+
+    def read(self):
+        root = self.eppxml.read()
+        self.writer.record('in', etree.tostring(root), self.connection)
+        return root
+
+    def write(self, xml):
+        return self.write_many((xml,))
+
+    def write_many(self, xmls):
+        frames = [fromdom(i) for i in xmls]
+        for frame in frames:
+            self.writer.record('out', frame, self.connection)
+        return self.eppxml.write_many(frames)
+
+
+def load_capture(lines):
+    '''
+    Returns the captured commands per connection, as a dictionary of
+    conn to a list of (ts, command, cltrid, payload, duration, code),
+    where duration and code are those of the captured response. Login,
+    logout and hello are left out.
+    '''
+    commands = {}
+    by_cltrid = {}
+    for line in lines:
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        if record['dir'] == 'out':
+            if record['command'] in SESSION_COMMANDS or record.get('truncated'):
+                continue
+            if record['cltrid'] is None:
+                continue
+            command = [
+                record['ts'], record['command'], record['cltrid'],
+                record['payload'].encode('utf-8'), None, None]
+            commands.setdefault(record.get('conn', 0), []).append(command)
+            by_cltrid[record['cltrid']] = command
+        elif record['cltrid'] in by_cltrid:
+            command = by_cltrid.pop(record['cltrid'])
+            command[4], command[5] = record['duration'], record.get('code')
+    return dict(
+        (conn, [tuple(i) for i in connection_commands])
+        for conn, connection_commands in commands.items())
+
+
+class ReplayStats(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}  # command -> list of (captured, replayed)
+        self.code_changes = {}  # (command, captured code, replayed code) -> count
+        self.errors = []
+        self.seconds = 0.0
+        self.captured_seconds = 0.0
+
+    def add(self, command, duration, latency, code, new_code):
+        with self.lock:
+            self.latencies.setdefault(command, []).append((duration, latency))
+            if code != new_code:
+                key = (command, code, new_code)
+                self.code_changes[key] = self.code_changes.get(key, 0) + 1
+
+    def summary(self):
+        ''' Returns a list of dictionaries, one per command, with the
+        count and the captured and replayed p50 and p99 latencies. '''
+        ret = []
+        with self.lock:
+            for command, pairs in sorted(self.latencies.items()):
+                captured = sorted(i[0] for i in pairs if i[0] is not None)
+                replayed = sorted(i[1] for i in pairs)
+                row = {'command': command, 'count': len(pairs)}
+                for name, fraction in (('p50', 0.5), ('p99', 0.99)):
+                    row['captured_' + name] = percentile(captured, fraction)
+                    row['replayed_' + name] = percentile(replayed, fraction)
+                    row['delta_' + name] = row['replayed_' + name] - row['captured_' + name]
+                ret.append(row)
+        return ret
+
+
+class Replay(object):
+    '''
+    Re-issues captured commands against the server at address, logged
+    in as username. Every captured connection gets its own connection,
+    and every command is sent at its captured time divided by speed (so
+    2 is twice as fast), or as soon as possible with speed 0. At most
+    window commands are in flight per connection.
+
+    Captured poll acks, transfers (the tokens were redacted) and
+    commands on objects the server does not have will fail; the result
+    codes that differ from the captured ones are counted.
+    '''
+    def __init__(self, address, username, password, speed=1.0, window=16, ssl=True):
+        self.address = address
+        self.username = username
+        self.password = password
+        self.speed = speed
+        self.window = window
+        self.ssl = ssl
+
+    def run(self, commands):
+        ''' Replays the load_capture result; returns the ReplayStats. '''
+        stats = ReplayStats()
+        first = min([i[0][0] for i in commands.values() if i] or [0])
+        last = max([i[-1][0] for i in commands.values() if i] or [0])
+        stats.captured_seconds = last - first
+        began = time.time()
+        started = began + 0.1  # time to connect
+        threads = [
+            threading.Thread(target=self._replay_connection, args=(
+                connection_commands, stats, started, first))
+            for connection_commands in commands.values()]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join()
+        stats.seconds = time.time() - began
+        return stats
+
+    def _due(self, ts, started, first):
+        if not self.speed:
+            return 0
+        return started + (ts - first) / float(self.speed)
+
+    def _replay_connection(self, commands, stats, started, first):
+        try:
+            xml = wrap_socket(eppsocket.tcp_connect(self.address, ssl=self.ssl))
+            xml.expect(None, '/epp:epp/epp:greeting')
+            xml.expect(Login(username=self.username, password=self.password), XPATH_OK)
+        except Exception as e:
+            with stats.lock:
+                stats.errors.append(e)
+            return
+        try:
+            self._replay_commands(xml, commands, stats, started, first)
+            xml.expect(Logout(), '/epp:epp/epp:response/epp:result[@code="1500"]')
+        except Exception as e:
+            with stats.lock:
+                stats.errors.append(e)
+        finally:
+            xml.close()
+
+    def _replay_commands(self, xml, commands, stats, started, first):
+        sock = xml.eppsocket.socket
+        commands = list(commands)
+        in_flight = OrderedDict()  # cltrid -> (sent, command)
+        while commands or in_flight:
+            now = time.time()
+            frames = []
+            while (commands and len(in_flight) + len(frames) < self.window and
+                    self._due(commands[0][0], started, first) <= now):
+                command = commands.pop(0)
+                frames.append(command[3])
+                in_flight[command[2]] = (now, command)
+            if frames:
+                xml.write_many(frames)
+                continue
+            timeout = None
+            if commands and len(in_flight) < self.window:
+                timeout = max(0, self._due(commands[0][0], started, first) - now)
+            if not (getattr(sock, 'pending', None) and sock.pending()):
+                if not select.select([sock], [], [], timeout)[0]:
+                    continue
+            value = xml.read()
+            received = time.time()
+            cltrid = xpath(value, XPATH_CLTRID)
+            if cltrid and cltrid[0].text in in_flight:
+                sent, command = in_flight.pop(cltrid[0].text)
+            else:
+                sent, command = in_flight.popitem(last=False)[1]
+            code = xpath(value, XPATH_CODE)
+            stats.add(command[1], command[4], received - sent, command[5], (code[0] if code else None))
+
+
+def main():
+    import getopt
+
+    usage = (
+        'Usage: %s [-s SPEED] [-w WINDOW] [-j] CAPTUREFILE HOST:PORT USERNAME PASSWORD\n'
+        'Replays a capture (see Capture, or earlyepp bulk -c) against a server,\n'
+        'like the eppmockserver, at SPEED times the captured speed (default 1,\n'
+        '0 is as fast as possible) and reports the latency deltas per command.'
+        % (sys.argv[0],))
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 's:w:j')
+    except getopt.GetoptError:
+        opts, args = [], []
+    if len(args) != 4:
+        sys.stderr.write(usage + '\n')
+        sys.exit(1)
+
+    kwargs = {}
+    as_json = False
+    for opt, value in opts:
+        if opt == '-s':
+            kwargs['speed'] = float(value)
+        elif opt == '-w':
+            kwargs['window'] = int(value)
+        elif opt == '-j':
+            as_json = True
+    host, port = args[1].rsplit(':', 1)
+
+    with open(args[0]) as fp:
+        commands = load_capture(fp)
+    stats = Replay((host, int(port)), args[2], args[3], **kwargs).run(commands)
+
+    summary = stats.summary()
+    if as_json:
+        for row in summary:
+            print(json.dumps(row, sort_keys=True))
+    else:
+        print('%-20s %6s %9s %9s %9s %9s %9s %9s' % (
+            'command (ms)', 'count', 'p50 was', 'p50 now', 'p50 delta',
+            'p99 was', 'p99 now', 'p99 delta'))
+        for row in summary:
+            print('%-20s %6d %9.2f %9.2f %+9.2f %9.2f %9.2f %+9.2f' % (
+                row['command'], row['count'],
+                row['captured_p50'] * 1000, row['replayed_p50'] * 1000, row['delta_p50'] * 1000,
+                row['captured_p99'] * 1000, row['replayed_p99'] * 1000, row['delta_p99'] * 1000))
+    sys.stderr.write('captured %.2fs, replayed in %.2fs\n' % (
+        stats.captured_seconds, stats.seconds))
+    for (command, code, new_code), number in sorted(stats.code_changes.items()):
+        sys.stderr.write('%d %s result(s) changed from %s to %s\n' % (
+            number, command, code, new_code))
+    for error in stats.errors:
+        sys.stderr.write('connection failed: %s: %s\n' % (error.__class__.__name__, error))
+    if stats.errors:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,218 @@
+# vim: set ts=8 sw=4 sts=4 et ai:
+# Copyright (C) 2026, OSSO B.V.
+from collections import OrderedDict
+
+from eppxml import qname
+
+# Tags picked from the responses, each in a single tree walk.
+TAG_NAME = qname('domain', 'name')
+TAG_ROID = qname('domain', 'roid')
+TAG_STATUS = qname('domain', 'status')
+TAG_REGISTRANT = qname('domain', 'registrant')
+TAG_CONTACT = qname('domain', 'contact')
+TAG_HOSTOBJ = qname('domain', 'hostObj')
+TAG_HOSTNAME = qname('domain', 'hostName')
+TAG_CLID = qname('domain', 'clID')
+TAG_CRDATE = qname('domain', 'crDate')
+TAG_UPDATE = qname('domain', 'upDate')
+TAG_EXDATE = qname('domain', 'exDate')
+TAG_PW = qname('domain', 'pw')
+TAG_KEYDATA = qname('secDNS', 'keyData')
+DOMAIN_TAGS = (
+    TAG_NAME, TAG_ROID, TAG_STATUS, TAG_REGISTRANT, TAG_CONTACT,
+    TAG_HOSTOBJ, TAG_HOSTNAME, TAG_CLID, TAG_CRDATE, TAG_UPDATE,
+    TAG_EXDATE, TAG_PW, TAG_KEYDATA)
+DOMAIN_DATES = {TAG_CRDATE: 'created', TAG_UPDATE: 'updated', TAG_EXDATE: 'expires'}
+
+# Contact fields by tag; street may repeat.
+CONTACT_FIELDS = dict((qname('contact', tag), field) for tag, field in (
+    ('id', 'handle'), ('roid', 'roid'), ('name', 'name'), ('org', 'org'),
+    ('city', 'city'), ('pc', 'zipcode'), ('cc', 'countrycode'),
+    ('voice', 'phone'), ('fax', 'fax'), ('email', 'email'),
+    ('clID', 'owner'), ('crDate', 'created'), ('upDate', 'updated'),
+    ('pw', 'token')))
+CONTACT_FIELDS[qname('sidn-ext-epp', 'legalForm')] = 'legalform'
+CONTACT_FIELDS[qname('sidn-ext-epp', 'legalFormRegNo')] = 'legalformno'
+TAG_CONTACT_STATUS = qname('contact', 'status')
+TAG_STREET = qname('contact', 'street')
+CONTACT_TAGS = tuple(CONTACT_FIELDS) + (TAG_CONTACT_STATUS, TAG_STREET)
+
+TRANSFER_FIELDS = dict((qname(prefix, tag), field) for prefix, tag, field in (
+    ('domain', 'name', 'name'), ('domain', 'trStatus', 'status'),
+    ('domain', 'reID', 'requested_by'), ('domain', 'reDate', 'requested'),
+    ('domain', 'acID', 'action_by'), ('domain', 'acDate', 'action'),
+    ('domain', 'exDate', 'expires'), ('epp', 'svTRID', 'svtrid')))
+
+
+class Record(object):
+    '''
+    Fields extracted from a response. The records keep no reference to
+    the lxml tree, so it is freed once they are made. Dates are kept as
+    the registry sent them, e.g. 2010-05-22T13:49:04.000Z.
+    '''
+    __slots__ = ()
+
+    def __init__(self, **kwargs):
+        for field in self.__slots__:
+            setattr(self, field, kwargs.pop(field, None))
+        assert not kwargs, kwargs
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.as_dict() == other.as_dict()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __str__(self):
+        if str is bytes:
+            return self.__unicode__().encode('utf-8')
+        return self.__unicode__()
+
+    def __unicode__(self):
+        lines = []
+        for field, value in self.as_dict().items():
+            if value is None:
+                continue
+            if isinstance(value, frozenset):
+                value = sorted(value)
+            if isinstance(value, (tuple, list)):
+                value = u'; '.join(u'%s' % (i,) for i in value)
+            lines.append(u'  %s: %s' % (field, value))
+        return u'\n'.join(lines)
+
+    def as_dict(self):
+        ''' Returns the fields in __slots__ order. '''
+        return OrderedDict((i, getattr(self, i)) for i in self.__slots__)
+
+    def copy(self, **changes):
+        ''' Returns a copy, with changes to some of its fields. '''
+        fields = self.as_dict()
+        fields.update(changes)
+        return type(self)(**fields)
+
+
+class Dnskey(object):
+    __slots__ = ('protocol', 'flags', 'algo', 'key')
+
+    @classmethod
+    def from_xml(cls, xml):
+        # flags, protocol, alg, pubkey
+        kwargs = dict(
+            (i.tag.rsplit('}', 1)[-1], i.text)
+            for i in xml.iterchildren())
+        return cls(**kwargs)
+
+    def __init__(self, protocol, flags, alg, pubKey):
+        self.protocol = int(protocol)   # 3=DNSSEC
+        self.flags = int(flags)         # 257=KSK, 256=ZSK
+        self.algo = int(alg)            # 13=ECDSA..
+        self.key = pubKey               # public key in base64
+
+    def __eq__(self, other):
+        return isinstance(other, Dnskey) and self.sort_key() == other.sort_key()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.sort_key())
+
+    def __repr__(self):
+        return '<Dnskey(%d,%d,%d,%s)>' % (
+            self.protocol, self.flags, self.algo, self.key)
+
+    def __str__(self):
+        return '%d %d %d %s' % (self.flags, self.protocol, self.algo, self.key)
+
+    def sort_key(self):
+        return (self.protocol, -self.flags, self.algo, self.key)
+
+
+class DomainInfo(Record):
+    ''' A domain info response. The handles and nameservers are
+    frozensets, dnskeys is a sorted tuple of Dnskeys. '''
+    __slots__ = (
+        'name', 'roid', 'statuses', 'registrant', 'admin', 'tech',
+        'nameservers', 'dnskeys', 'owner', 'created', 'updated', 'expires',
+        'token')
+
+    @classmethod
+    def from_response(cls, value):
+        fields = {'statuses': [], 'admin': set(), 'tech': set(), 'nameservers': set(), 'dnskeys': []}
+        for element in value.iter(*DOMAIN_TAGS):
+            tag = element.tag
+            if tag == TAG_CONTACT:
+                if element.get('type') in ('admin', 'tech'):
+                    fields[element.get('type')].add(element.text)
+            elif tag in (TAG_HOSTOBJ, TAG_HOSTNAME):
+                fields['nameservers'].add(element.text)
+            elif tag == TAG_KEYDATA:
+                fields['dnskeys'].append(Dnskey.from_xml(element))
+            elif tag == TAG_STATUS:
+                fields['statuses'].append(element.get('s'))
+            elif tag == TAG_REGISTRANT:
+                fields['registrant'] = element.text
+            elif tag == TAG_NAME:
+                fields['name'] = element.text
+            elif tag == TAG_ROID:
+                fields['roid'] = element.text
+            elif tag == TAG_CLID:
+                fields['owner'] = element.text
+            elif tag == TAG_PW:
+                fields['token'] = element.text
+            else:
+                fields[DOMAIN_DATES[tag]] = element.text
+        return cls(
+            statuses=tuple(fields.pop('statuses')),
+            admin=frozenset(fields.pop('admin')),
+            tech=frozenset(fields.pop('tech')),
+            nameservers=frozenset(fields.pop('nameservers')),
+            dnskeys=tuple(sorted(fields.pop('dnskeys'), key=Dnskey.sort_key)),
+            **fields)
+
+    def __repr__(self):
+        return '<DomainInfo(%r)>' % (self.name,)
+
+
+class ContactInfo(Record):
+    ''' A contact info response. street is a tuple of lines. '''
+    __slots__ = (
+        'handle', 'roid', 'statuses', 'name', 'org', 'street', 'city',
+        'zipcode', 'countrycode', 'phone', 'fax', 'email', 'legalform',
+        'legalformno', 'owner', 'created', 'updated', 'token')
+
+    @classmethod
+    def from_response(cls, value):
+        fields = {'statuses': [], 'street': []}
+        for element in value.iter(*CONTACT_TAGS):
+            tag = element.tag
+            if tag == TAG_STREET:
+                fields['street'].append(element.text)
+            elif tag == TAG_CONTACT_STATUS:
+                fields['statuses'].append(element.get('s'))
+            else:
+                fields[CONTACT_FIELDS[tag]] = element.text
+        return cls(
+            statuses=tuple(fields.pop('statuses')),
+            street=tuple(fields.pop('street')), **fields)
+
+    def __repr__(self):
+        return '<ContactInfo(%r)>' % (self.handle,)
+
+
+class TransferInfo(Record):
+    ''' A domain transfer (query) response. action is the date of the
+    (expected) approval. '''
+    __slots__ = (
+        'name', 'status', 'requested_by', 'requested', 'action_by',
+        'action', 'expires', 'svtrid')
+
+    @classmethod
+    def from_response(cls, value):
+        fields = {}
+        for element in value.iter(*TRANSFER_FIELDS):
+            fields[TRANSFER_FIELDS[element.tag]] = element.text
+        return cls(**fields)
+
+    def __repr__(self):
+        return '<TransferInfo(%r, %r)>' % (self.name, self.status)
@@ -1,8 +1,16 @@
 # vim: set ts=8 sw=4 sts=4 et ai:
 # let g:flake8_ignore="E501"
 # Copyright (C) 2011,2016, OSSO B.V., Walter Doekes
+import os
+import re
+import time
 from base64 import b64decode
+from collections import OrderedDict, deque
+from itertools import count, islice
+from random import getrandbits
 
+import eppresponse
+from eppcache import LruCache
 from eppcommand import (
     Login, Logout,
     ContactCreate, ContactCheck, ContactDelete, ContactInfo, ContactUpdate,
@@ -11,7 +19,7 @@ from eppcommand import (
     DomainTransfer, DomainTransferApprove, DomainTransferCancel,
     DomainTransferState, DnssecDomainUpdate,
     MessageQueueReadFirst, MessageQueueRemoveFirst)
-from eppxml import pp, xpath, UnexpectedData
+from eppxml import fromdom, xpath, UnexpectedData
 
 # Checking for used commands:
 # for x in `sed -e '/^__all/,/^)/!d;/^ *'\''/!d;s/[^A-Za-z0-9 ]//g' eppcommand.py`; do grep -q $x eppsession.py || echo "$x is unused"; done
@@ -20,26 +28,78 @@ from eppxml import pp, xpath, UnexpectedData
 
 # BUGS/TODO:
 # - Host* is not implemented (glue records?)
-# - The domain and contact cache is never purged. This is good because
-#   we'll have singleton objects. It is bad however because no record
-#   is discarded, ever. That could cause a daemon to run out of memory.
-# - Add DB for message storage, domain info caching and set_nameserver
-#   and set_handles triggers for when a domain has been moved.
+# - The domain and contact caches hold at most cache_size objects each.
+#   Evicted objects that are still in use stay singletons; cached info
+#   expires after info_ttl seconds (never, by default). With
+#   write_through, the domain setters apply their confirmed changes to
+#   the cached info instead of dropping it.
+# - Pass an EppStore to keep info responses and acknowledged messages
+#   in SQLite. Still missing: set_nameserver and set_handles triggers
+#   for when a domain has been moved.
+
+# SIDN poll message codes, the first word of the message text.
+MESSAGE_CODES = {
+    1013: 'transfer to me in progress',
+    1014: 'transfer from me in progress',
+    1015: 'transfer to me complete',
+    1016: 'transfer from me complete',
+}
+
+# Commands that change registry objects: the stored info of the object
+# is dropped when they are answered. Maps to (kind, variable).
+STORE_INVALIDATES = {
+    ContactDelete: ('contact', 'handle'),
+    ContactUpdate: ('contact', 'handle'),
+    DomainCreate: ('domain', 'domainname'),
+    DomainDelete: ('domain', 'domainname'),
+    DomainDeleteCancel: ('domain', 'domainname'),
+    DomainRenew: ('domain', 'domainname'),
+    DomainUpdate: ('domain', 'domainname'),
+    DnssecDomainUpdate: ('domain', 'domainname'),
+    DomainTransfer: ('domain', 'domainname'),
+    DomainTransferApprove: ('domain', 'domainname'),
+    DomainTransferCancel: ('domain', 'domainname'),
+}
 
 
 class EppSession(object):
     XPATH_OK = '/epp:epp/epp:response/epp:result[@code="1000"]'
-
-    def __init__(self, eppxml_generator, username, password):
+    # SIDN refuses a renew that keeps the period, see DomainRenew.
+    XPATH_PERIOD_UNCHANGED = '//sidn-ext-epp:msg[@code="C0163"]'
+    XPATH_CLTRID = '/epp:epp/epp:response/epp:trID/epp:clTRID'
+    CHECK_LIMIT = 10  # max names per check command, the server may cap this
+
+    def __init__(self, eppxml_generator, username, password, pipeline_depth=16,
+                 cache_class=LruCache, cache_size=10000, info_ttl=None,
+                 store=None, rate_limiter=None, write_through=False):
         self.cache = {
-            'contacts': {},
-            'domains': {},
+            'contacts': cache_class(cache_size),
+            'domains': cache_class(cache_size),
         }
+        self.info_ttl = info_ttl
+        self.write_through = write_through  # read-your-writes, see Domain
+        self.store = store  # optional EppStore
+        if store is not None:
+            store.claim(username)
+        self.rate_limiter = rate_limiter  # optional, shared per account
         self.eppxml = None
         self.eppxml_logged_in = False
         self.eppxml_generator = eppxml_generator
         self.username = username
         self.password = password
+        # Commands that are written but not answered yet, keyed by
+        # clTRID, in the order in which they were written.
+        self.pending = OrderedDict()
+        self.pipeline_depth = pipeline_depth
+        # Submitted commands that are not written yet; they are written
+        # together when we start waiting for a response.
+        self.outgoing = []
+        self.cltrid_prefix = 'EE%08X' % getrandbits(32)
+        self.cltrid_counter = count(1)
+        # Callables, see add_hook(). A pool shares them with its sessions.
+        self.hooks = {'before_send': [], 'after_receive': [], 'after_connect': []}
+        # Set by a pool on a new session that replaces a lost one.
+        self.replacement = False
 
     def _ensure_connected(self):
         if self.eppxml is None:
@@ -47,20 +107,155 @@ class EppSession(object):
             self.eppxml.expect(None, '/epp:epp/epp:greeting')
             self._login()
             self.eppxml_logged_in = True
+            for hook in self.hooks['after_connect']:
+                hook(self)
 
     def _ensure_disconnected(self):
         if self.eppxml is not None:
             if self.eppxml_logged_in:
+                self.collect()
                 self._logout()
                 self.eppxml_logged_in = False
             self.eppxml.close()
             self.eppxml = None
 
     def _exec(self, command, expect_response=None):
-        if expect_response is None:
-            expect_response = self.XPATH_OK
-        self._ensure_connected()
-        return self.eppxml.expect(command, expect_response)
+        return self.submit(command, expect_response).result()
+
+    def _next_cltrid(self):
+        return '%s-%d' % (self.cltrid_prefix, next(self.cltrid_counter))
+
+    def _is_fresh(self, cache):
+        ''' Whether the object cache holds info younger than info_ttl. '''
+        if 'record' not in cache:
+            return False
+        return self.info_ttl is None or cache['fetched'] + self.info_ttl > time.time()
+
+    def _fetch_info(self, kind, key, command, record_class):
+        ''' Returns a new object cache with the info response parsed into
+        a record_class record: from the store if it has a recent one,
+        from the registry otherwise. The response itself is not kept. '''
+        cache = self._stored_info(kind, key, record_class)
+        if cache is not None:
+            return cache
+        return self._fetched_info(kind, key, self._exec(command), record_class)
+
+    def _stored_info(self, kind, key, record_class):
+        ''' Returns an object cache from the store, if it has a recent
+        info response. '''
+        if self.store is not None:
+            stored = self.store.load(kind, key)
+            if stored is not None and (
+                    self.info_ttl is None or stored[1] + self.info_ttl > time.time()):
+                return {'record': record_class.from_response(stored[0]), 'fetched': stored[1]}
+        return None
+
+    def _fetched_info(self, kind, key, value, record_class):
+        ''' Returns an object cache for an info response that just came
+        in, and saves the response in the store. '''
+        fetched = time.time()
+        if self.store is not None:
+            self.store.save(kind, key, value, fetched)
+        return {'record': record_class.from_response(value), 'fetched': fetched}
+
+    def _prefetch(self, infos, window):
+        ''' Fetch the (object, kind, key, command, record_class) infos
+        on this session, see prefetch_domains. '''
+        errors = {}
+        self._prefetch_on(self, infos, window, errors)
+        return errors
+
+    def _prefetch_on(self, session, infos, window, errors):
+        in_flight = deque()
+        for info in infos:
+            in_flight.append((info, session.submit(info[3])))
+            if len(in_flight) >= window:
+                self._prefetched(errors, *in_flight.popleft())
+        while in_flight:
+            self._prefetched(errors, *in_flight.popleft())
+
+    def _prefetched(self, errors, info, pending):
+        obj, kind, key, command, record_class = info
+        try:
+            value = pending.result()
+        except UnexpectedData as e:
+            errors[key] = e
+        else:
+            obj._cache = self._fetched_info(kind, key, value, record_class)
+
+    def _prefetch_infos(self, objects, kind, command_generator, record_class):
+        # Yields what needs fetching: the (key, object)s without fresh
+        # info that the store does not have either.
+        for key, obj in objects:
+            if self._is_fresh(obj._cache):
+                continue
+            cache = self._stored_info(kind, key, record_class)
+            if cache is not None:
+                obj._cache = cache
+                continue
+            yield (obj, kind, key, command_generator(key), record_class)
+
+    def _store_invalidate(self, command):
+        if self.store is not None and type(command) in STORE_INVALIDATES:
+            kind, variable = STORE_INVALIDATES[type(command)]
+            self.store.invalidate(kind, command.variables[variable])
+
+    def _read_pending(self):
+        ''' Write the outgoing commands, read one response and hand it
+        to the pending command it belongs to. '''
+        try:
+            if self.outgoing:
+                outgoing, self.outgoing = self.outgoing, []
+                if self.hooks['before_send'] or self.hooks['after_receive']:
+                    self._write_measured(outgoing)
+                else:
+                    self.eppxml.write_many(outgoing)
+            value = self.eppxml.read()
+        except Exception as e:
+            # The connection is unusable, fail everything in flight.
+            self.outgoing = []
+            pending, self.pending = self.pending, OrderedDict()
+            for i in pending.values():
+                i._set_error(e)
+                self._store_invalidate(i.command)  # it may have run
+            # Drop it, so the next command connects and logs in again.
+            self.reset()
+            raise
+        cltrid = xpath(value, self.XPATH_CLTRID)
+        if cltrid and cltrid[0].text in self.pending:
+            pending = self.pending.pop(cltrid[0].text)
+        else:
+            # Responses without (a known) clTRID, like parse errors,
+            # belong to the oldest command: the server answers in order.
+            pending = self.pending.popitem(last=False)[1]
+        pending._set_response(value)
+        self._store_invalidate(pending.command)
+        if pending.stats is not None and self.hooks['after_receive']:
+            stats = pending.stats
+            received, stats['parse'], stats['bytes_in'] = (
+                getattr(self.eppxml, 'read_stats', None) or (time.time(), 0.0, 0))
+            stats['wait'] = received - stats.pop('sent')
+            for hook in self.hooks['after_receive']:
+                hook(pending.command, value, stats)
+
+    def _write_measured(self, outgoing):
+        # Serialize and write like EppXml.write_many, but keep the
+        # seconds spent and the sizes for the after_receive hooks.
+        frames = []
+        for command in outgoing:
+            for hook in self.hooks['before_send']:
+                hook(command)
+            started = time.time()
+            frames.append(fromdom(command))
+            self.pending[command.cltrid].stats = {
+                'serialize': time.time() - started, 'bytes_out': len(frames[-1])}
+        started = time.time()
+        self.eppxml.write_many(frames)
+        sent = time.time()
+        for command in outgoing:
+            stats = self.pending[command.cltrid].stats
+            stats['write'] = (sent - started) / len(outgoing)  # shared
+            stats['sent'] = sent
 
     def _login(self):
         self.eppxml.expect(Login(username=self.username, password=self.password), self.XPATH_OK)
@@ -68,19 +263,111 @@ class EppSession(object):
     def _logout(self):
         self.eppxml.expect(Logout(), '/epp:epp/epp:response/epp:result[@code="1500"]')
 
+    def add_hook(self, name, hook):
+        ''' Call hook for every command: before_send(command) before it
+        is serialized, after_receive(command, response, stats) with the
+        seconds spent per phase (serialize, write, wait, parse) and the
+        bytes_out/bytes_in. Or after_connect(session) after every login
+        on a new connection. '''
+        self.hooks[name].append(hook)
+
     def close(self):
         ''' Call close in your finally block. '''
         self._ensure_disconnected()
 
+    def reset(self):
+        ''' Drop the connection without logging out, e.g. after an I/O
+        error. The next command connects and logs in again. '''
+        eppxml, self.eppxml = self.eppxml, None
+        self.eppxml_logged_in = False
+        self.outgoing = []
+        pending, self.pending = self.pending, OrderedDict()
+        for i in pending.values():
+            i._set_error(IOError('connection reset'))
+        if eppxml is not None:
+            try:
+                eppxml.close()
+            except Exception:
+                pass  # dead already
+
+    def submit(self, command, expect_response=None):
+        ''' Queue the command without waiting for the response. Returns
+        a Pending object; call result() on it to get the response.
+        Queued commands are written together as soon as a response is
+        waited for. At most pipeline_depth commands are in flight. The
+        server handles the commands of a session in the order in which
+        they were written, so commands touching the same domain keep
+        their order. The rate_limiter may make us wait before the
+        command is queued. '''
+        if expect_response is None:
+            expect_response = self.XPATH_OK
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire(command)
+        self._ensure_connected()
+        while len(self.pending) >= self.pipeline_depth:
+            self._read_pending()
+        command.cltrid = self._next_cltrid()
+        self.outgoing.append(command)
+        pending = self.Pending(self, command, expect_response)
+        self.pending[command.cltrid] = pending
+        return pending
+
+    def collect(self):
+        ''' Wait for all submitted commands to be answered. Returns the
+        list of Pending objects that were in flight. '''
+        in_flight = list(self.pending.values())
+        while self.pending:
+            self._read_pending()
+        return in_flight
+
+    class Pending(object):
+        ''' A submitted command and, eventually, its response. '''
+        def __init__(self, session, command, expect_response):
+            self._session = session
+            self._done = False
+            self._value = None
+            self._error = None
+            self.command = command
+            self.expect_response = expect_response
+            self.stats = None  # set when measured, see add_hook()
+
+        def __repr__(self):
+            return '<EppSession.Pending(%s, %s)>' % (
+                self.command.__class__.__name__, self.command.cltrid)
+
+        def done(self):
+            return self._done
+
+        def result(self):
+            ''' Block until the response is in. Raises UnexpectedData if
+            it did not match the expected xpath. '''
+            while not self._done:
+                self._session._read_pending()
+            if self._error is not None:
+                raise self._error
+            return self._value
+
+        def _set_error(self, error):
+            self._done = True
+            self._error = error
+
+        def _set_response(self, value):
+            self._done = True
+            self._value = value
+            if self.expect_response is not None:
+                if not xpath(value, self.expect_response):
+                    self._error = UnexpectedData(
+                        self.command, value, self.expect_response)
+
     ####################################################################
     # GETTING CONTACTS, DOMAINS AND MESSAGES
     ####################################################################
 
     def contact(self, handle):
-        # NOTE: this will consume infinite memory as we never purge the cache
-        if handle not in self.cache['contacts']:
-            self.cache['contacts'][handle] = self.Contact(session=self, handle=handle)
-        return self.cache['contacts'][handle]
+        contact = self.cache['contacts'].get(handle)
+        if contact is None:
+            contact = self.cache['contacts'].setdefault(handle, self.Contact(session=self, handle=handle))
+        return contact
 
     def contact_create(self, name, street, zipcode, city, countrycode, phone, fax, email, legalform=None, legalformno=None):
         ''' Create a new contact. '''
@@ -95,19 +382,45 @@ class EppSession(object):
         contact._cache = {}  # dirty cache
         return contact
 
+    def prefetch_contacts(self, handles, window=None):
+        ''' Like prefetch_domains, for contacts. '''
+        return self._prefetch(self._prefetch_infos(
+            ((i, self.contact(i)) for i in handles), 'contact',
+            (lambda key: ContactInfo(handle=key)), eppresponse.ContactInfo),
+            window or self.pipeline_depth)
+
     def contact_is_free(self, handle):
         ''' Check availability of contact handle. No caching is
         performed. '''
-        value = self._exec(ContactCheck(handle=handle))
-        info = xpath(value, '//contact:chkData/contact:cd/contact:id')[0]
-        assert info.text == handle
-        return info.attrib['avail'] == 'true'
+        for info in self.contacts_are_free([handle]):
+            assert info[0] == handle
+            return info[1]
+
+    def contacts_are_free(self, handles):
+        ''' Check availability of many contact handles. Yields
+        (handle, avail, reason) tuples in input order. '''
+        return self._check_many(
+            (lambda chunk: ContactCheck(handles=chunk)), handles,
+            '//contact:chkData/contact:cd', 'contact:id')
 
     def domain(self, domainname):
-        # NOTE: this will consume infinite memory as we never purge the cache
-        if domainname not in self.cache['domains']:
-            self.cache['domains'][domainname] = self.Domain(session=self, domainname=domainname)
-        return self.cache['domains'][domainname]
+        domain = self.cache['domains'].get(domainname)
+        if domain is None:
+            domain = self.cache['domains'].setdefault(domainname, self.Domain(session=self, domainname=domainname))
+        return domain
+
+    def prefetch_domains(self, domainnames, window=None):
+        ''' Fetch the info of many domains ahead of use, so their getters
+        need no round trip. At most window (default pipeline_depth)
+        DomainInfo commands are in flight; domains with fresh info are
+        skipped. Prefetch at most cache_size domains at a time, or the
+        first ones are evicted before they are used. Returns a
+        dictionary of domain name to the UnexpectedData of those that
+        failed, like unknown domains. '''
+        return self._prefetch(self._prefetch_infos(
+            ((i, self.domain(i)) for i in domainnames), 'domain',
+            (lambda key: DomainInfo(domainname=key)), eppresponse.DomainInfo),
+            window or self.pipeline_depth)
 
     def domain_create(self, domainname, registrant=None, admin=None, tech=None, nameservers=None):
         ''' Register a new domain name. Supply iterables as parameters.
@@ -132,46 +445,136 @@ class EppSession(object):
     def domain_is_free(self, domainname):
         ''' Returns a boolean stating whether the domain is free. No
         caching is performed. '''
-        # TODO: add so we can check multiple domains at once
-        value = self._exec(DomainCheck(domainname=domainname))
-        info = xpath(value, '//domain:chkData/domain:cd/domain:name')[0]
-        assert info.text == domainname
-        return info.attrib['avail'] == 'true'
+        for info in self.domains_are_free([domainname]):
+            assert info[0] == domainname
+            return info[1]
+
+    def domains_are_free(self, domainnames):
+        ''' Check availability of many domain names. Yields
+        (domainname, avail, reason) tuples in input order. The names
+        are sent CHECK_LIMIT at a time, with the check commands
+        pipelined. No caching is performed. '''
+        return self._check_many(
+            (lambda chunk: DomainCheck(domainnames=chunk)), domainnames,
+            '//domain:chkData/domain:cd', 'domain:name')
+
+    def _check_many(self, command_generator, names, xpath_cd, xpath_name):
+        names = iter(names)
+        in_flight = deque()
+        while True:
+            chunk = list(islice(names, self.CHECK_LIMIT))
+            if chunk:
+                in_flight.append(self.submit(command_generator(chunk)))
+            if not in_flight:
+                break
+            if not chunk or len(in_flight) >= self.pipeline_depth:
+                value = in_flight.popleft().result()
+                for i in self._parse_checks(value, xpath_cd, xpath_name):
+                    yield i
+
+    @staticmethod
+    def _parse_checks(value, xpath_cd, xpath_name):
+        for cd in xpath(value, xpath_cd):
+            name = xpath(cd, xpath_name)[0]
+            reason = xpath(cd, '*[local-name()="reason"]')
+            yield (
+                name.text, name.attrib['avail'] in ('1', 'true'),
+                (reason[0].text if reason else None))
 
     def messages(self, keep=False):
-        ''' Poll the EPP server for new messages. '''
-        max_messages = 9  # SIDN is very limited (9 or 10??)
-        messages = []
-        count = 0
-
-        while max_messages > 0:
-            max_messages -= 1
-            readfirst_cmd = MessageQueueReadFirst()
-            value = self._exec(readfirst_cmd, '/epp:epp/epp:response/epp:result[@code]')
+        ''' Poll the EPP server for new messages. Returns the message
+        texts. With keep, only the first message is read and left in the
+        queue, and the list is padded with None up to the queue size. '''
+        if keep:
+            for message in self.poll(ack=False):
+                return [message.text] + [None] * (message.count - 1)
+            return []
+        return [message.text for message in self.poll()]
+
+    def poll(self, ack=True, checkpoint=None):
+        ''' Drain the poll queue, yielding a Message for every queued
+        message. A message is acknowledged when the next one is asked
+        for; that ack and the request for the next message are sent
+        together. Stop iterating and the current message stays queued.
+
+        Pass a checkpoint filename to survive crashes: the id of a
+        handled message is saved there before it is acknowledged, so a
+        message whose ack got lost is acknowledged on the next run
+        instead of being yielded again. '''
+        handled_id = self._load_checkpoint(checkpoint)
+        expect_code = '/epp:epp/epp:response/epp:result[@code]'
+        ack_pending = None
+        pending = self.submit(MessageQueueReadFirst(), expect_code)
+        while True:
+            value = pending.result()
+            if ack_pending is not None:
+                ack_pending.result()  # raises if the ack failed
             code = xpath(value, '/epp:epp/epp:response/epp:result')[0].attrib['code']
             if code == '1300':
-                # Done
-                break
-            elif code == '1301':
-                message_info = xpath(value, '/epp:epp/epp:response/epp:msgQ')[0]
-                # FIXME: we should do better parsing here:
-                # <sidn-ext-epp:command>domain:transfer-start</sidn-ext-epp:command> and others..
-                # In the mean time:
-                # 1013: transfer to me in progress
-                # 1014: transfer from me in progress
-                # 1015: transfer to me complete
-                # 1016: transfer from me complete
-                messages.append(xpath(value, '/epp:epp/epp:response/epp:msgQ/epp:msg')[0].text)
-                count = int(message_info.attrib['count'])
-                if keep:
-                    break  # before we start popping queued messages
-                self._exec(MessageQueueRemoveFirst(msgid=message_info.attrib['id']))  # pop message
-            else:
-                raise UnexpectedData(readfirst_cmd, value, '/epp:epp/epp:response/epp:result[@code] code 1300 or 1301')
+                break  # queue is empty
+            elif code != '1301':
+                raise UnexpectedData(pending.command, value, expect_code + ' code 1300 or 1301')
+            message = self.Message.from_response(value)
+            if message.id != handled_id:
+                if self.store is not None:
+                    self.store.archive_message(message.id, value, message.qdate)
+                yield message
+                if not ack:
+                    break
+                if checkpoint is not None:
+                    self._save_checkpoint(checkpoint, message.id)
+            ack_pending = self.submit(MessageQueueRemoveFirst(msgid=message.id))
+            pending = self.submit(MessageQueueReadFirst(), expect_code)
+
+    @staticmethod
+    def _load_checkpoint(filename):
+        if filename is None or not os.path.exists(filename):
+            return None
+        with open(filename) as fp:
+            return fp.read().strip() or None
+
+    @staticmethod
+    def _save_checkpoint(filename, msgid):
+        # Write and rename, so the file always holds a whole id.
+        with open(filename + '.tmp', 'w') as fp:
+            fp.write('%s\n' % (msgid,))
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.rename(filename + '.tmp', filename)
+
+    class Message(object):
+        ''' A poll message. code is the SIDN code at the start of the
+        text (see MESSAGE_CODES), domainname and command are taken from
+        the response data and the SIDN extension, if present. '''
+        @classmethod
+        def from_response(cls, value):
+            msgq = xpath(value, '/epp:epp/epp:response/epp:msgQ')[0]
+            msg = xpath(msgq, 'epp:msg')
+            text = (''.join(msg[0].itertext()).strip() if msg else '')
+            qdate = xpath(msgq, 'epp:qDate')
+            code = re.match(r'(\d{4})\b', text)
+            domainname = (
+                xpath(value, '/epp:epp/epp:response/epp:resData//domain:name') or
+                xpath(value, '//sidn-ext-epp:domainname'))
+            command = xpath(value, '//sidn-ext-epp:command')
+            return cls(
+                id=msgq.attrib['id'], count=int(msgq.attrib['count']),
+                qdate=(qdate[0].text if qdate else None), text=text,
+                code=(int(code.group(1)) if code else None),
+                domainname=(domainname[0].text if domainname else None),
+                command=(command[0].text if command else None))
+
+        def __init__(self, id, count, qdate, text, code=None, domainname=None, command=None):
+            self.id = id
+            self.count = count  # messages in the queue, this one included
+            self.qdate = qdate
+            self.text = text
+            self.code = code
+            self.domainname = domainname
+            self.command = command
 
-        # Increase the list size to the message count
-        messages.extend(None for i in range(count - 1))
-        return messages
+        def __repr__(self):
+            return '<EppSession.Message(%s, %s, %r)>' % (self.id, self.code, self.domainname)
 
     ####################################################################
     # CONTACT OBJECT BY HANDLE
@@ -190,11 +593,12 @@ class EppSession(object):
 
         @property
         def verbose_info(self):
-            ''' Verbose contact information. '''
-            if 'info' not in self._cache:
-                value = self._session._exec(ContactInfo(handle=self._handle))
-                self._cache['info'] = value
-            return pp(self._cache['info'])  # FIXME: return value is not nice
+            ''' Contact information, an eppresponse.ContactInfo. '''
+            if not self._session._is_fresh(self._cache):
+                self._cache = self._session._fetch_info(
+                    'contact', self._handle, ContactInfo(handle=self._handle),
+                    eppresponse.ContactInfo)
+            return self._cache['record']
 
         def __repr__(self):
             return "<EppSession.Contact('%s')>" % self._handle
@@ -219,24 +623,7 @@ class EppSession(object):
     ####################################################################
 
     class Domain(object):
-        class Dnskey(object):
-            @classmethod
-            def from_xml(cls, xml):
-                # flags, protocol, alg, pubkey
-                kwargs = dict(
-                    (i.tag.rsplit('}', 1)[-1], i.text)
-                    for i in xml.iterchildren())
-                return cls(**kwargs)
-
-            def __init__(self, protocol, flags, alg, pubKey):
-                self.protocol = int(protocol)   # 3=DNSSEC
-                self.flags = int(flags)         # 257=KSK, 256=ZSK
-                self.algo = int(alg)            # 13=ECDSA..
-                self.key = pubKey               # public key in base64
-
-            def __repr__(self):
-                return '<Dnskey(%d,%d,%d,%s)>' % (
-                    self.protocol, self.flags, self.algo, self.key)
+        Dnskey = eppresponse.Dnskey
 
         def __init__(self, session, domainname):
             self._cache = {}
@@ -253,35 +640,41 @@ class EppSession(object):
         @property
         def token(self):
             ''' Domain token for away transfers. '''
-            return xpath(self._info(), '//domain:infData/domain:authInfo/domain:pw')[0].text
+            return self._parse_token(self._info())
 
         @property
         def transfer_info(self):
-            ''' Verbose transfer information. '''
+            ''' Transfer information, an eppresponse.TransferInfo. '''
             value = self._session._exec(DomainTransferState(domainname=self._domainname))
-            return pp(value)  # FIXME: this return value is not nice
+            return self._parse_transfer(value)
 
         @property
         def verbose_info(self):
-            ''' Get verbose domain information. '''
-            return pp(self._info())  # FIXME: return value is not nice
+            ''' Domain information, an eppresponse.DomainInfo. '''
+            return self._info()
 
         # GETTERS/SETTERS #
 
         def get_handles(self):
             ''' Returns a dictionary with sets of handles. '''
-            return {
-                'registrant': set(i.text for i in xpath(self._info(), '//domain:infData/domain:registrant')),
-                'admin': set(i.text for i in xpath(self._info(), '//domain:infData/domain:contact[@type="admin"]')),
-                'tech': set(i.text for i in xpath(self._info(), '//domain:infData/domain:contact[@type="tech"]')),
-            }
+            return self._parse_handles(self._info())
 
         def set_handles(self, registrant=None, admin=None, tech=None):
             ''' Supply one or more iterables of registrant, admin or tech.
             Supply None to leave it as-is, supply the empty list to clear
             the handles. Note that SIDN enforces 1 registrant, 1 admin and
-            1+ techs. '''
-            old = self.get_handles()
+            1+ techs. Returns whether anything was changed. '''
+            update_cmd = self._set_handles_cmd(
+                self.get_handles(), registrant, admin, tech)
+            if update_cmd is None:
+                return False
+            self._exec_change(update_cmd)
+            self._write_through(self._written_handles, registrant, admin, tech)
+            return True
+
+        def _set_handles_cmd(self, old, registrant, admin, tech):
+            ''' Returns the DomainUpdate to go from the old handles to the
+            new ones, or None if nothing changes. '''
             has_edits = False
             update_cmd = DomainUpdate(domainname=self._domainname)
 
@@ -312,67 +705,105 @@ class EppSession(object):
                         update_cmd.remove_tech(i)
 
             if has_edits:
-                self._session._exec(update_cmd)
-                self._cache = {}
+                return update_cmd
+            return None
 
         def get_dnskeys(self, flags=None):
             ''' Returns a set of DNSSEC keys. '''
-            # If we don't pass the namespace explicitly, it will fail with:
-            #   #xpath(self._info(), '/secDNS:infData') ==>
-            #   *** XPathEvalError: Undefined namespace prefix
-            # See: http://lxml.de/xpathxslt.html
-            namespaces = self._info().nsmap.copy()
-            namespaces.pop(None)
-            if 'secDNS' in namespaces:
-                iterator = self._info().xpath(
-                    '//secDNS:infData', namespaces=namespaces)[0].iterchildren()
-            else:
-                iterator = []
-            dnskeys = [self.Dnskey.from_xml(i) for i in iterator]
-            dnskeys.sort(key=(
-                lambda x: (x.protocol, -x.flags, x.algo, x.key)))
-
-            if flags:
-                dnskeys = tuple(i for i in dnskeys if i.flags == flags)
-
-            return tuple(dnskeys)
+            return self._parse_dnskeys(self._info(), flags)
 
         def set_dnskeys(self, to_add, to_remove):
+            update_cmd = self._set_dnskeys_cmd(to_add, to_remove)
+            self._exec_change(update_cmd)
+            self._write_through(self._written_dnskeys, update_cmd)
+
+        def _set_dnskeys_cmd(self, to_add, to_remove):
             update_cmd = DnssecDomainUpdate(domainname=self._domainname)
             for add in to_add:
                 update_cmd.dnskey_add(add.flags, add.protocol, add.algo, add.key)
             for remove in to_remove:
                 update_cmd.dnskey_remove(remove.flags, remove.protocol, remove.algo, remove.key)
-            self._session._exec(update_cmd)
-            self._cache = {}
+            return update_cmd
+
+        def replace_dnskeys(self, flags, algo, pubkeys):
+            ''' Make the pubkeys (base64) the only DNSSEC keys with these
+            flags (257=KSK, 256=ZSK), all with algorithm algo. Returns
+            whether anything was changed. '''
+            update_cmd = self._replace_dnskeys_cmd(
+                self.get_dnskeys(flags), flags, algo, pubkeys)
+            if update_cmd is None:
+                return False
+            self._exec_change(update_cmd)
+            self._write_through(self._written_dnskeys, update_cmd)
+            return True
+
+        def _replace_dnskeys_cmd(self, old_dnskeys, flags, algo, pubkeys):
+            ''' Returns the DnssecDomainUpdate to go from the old keys with
+            these flags to the new ones, or None if nothing changes. '''
+            to_add = [i for i in pubkeys if i]
+            to_remove = []
+            for old in old_dnskeys:
+                if old.flags != flags:
+                    continue
+                if old.protocol != 3 or old.algo != algo or old.key not in to_add:
+                    to_remove.append(old)
+                else:
+                    to_add.remove(old.key)
+            if not to_add and not to_remove:
+                return None
+            to_add = [
+                self.Dnskey(protocol=3, flags=flags, alg=algo, pubKey=i)
+                for i in to_add]
+            return self._set_dnskeys_cmd(to_add, to_remove)
 
         def get_nameservers(self):
             ''' Returns a set of nameservers. '''
-            return set(i.text for i in xpath(self._info(), '//domain:infData/domain:ns')[0].iterchildren())
+            return self._parse_nameservers(self._info())
 
         def set_nameservers(self, nameservers):
-            ''' Supply an iterable of nameservers. '''
-            old_nameservers = self.get_nameservers()
+            ''' Supply an iterable of nameservers. Returns whether anything
+            was changed. '''
+            update_cmd = self._set_nameservers_cmd(
+                self.get_nameservers(), nameservers)
+            if update_cmd is None:
+                return False
+            self._exec_change(update_cmd)
+            self._write_through(self._written_nameservers, nameservers)
+            return True
+
+        def _set_nameservers_cmd(self, old_nameservers, nameservers):
+            ''' Returns the DomainUpdate to go from the old nameservers to
+            the new ones, or None if nothing changes. '''
             new_nameservers = set(nameservers)
             if not new_nameservers:
                 raise AssertionError('fail')
-            if old_nameservers != new_nameservers:
-                update_cmd = DomainUpdate(domainname=self._domainname)
-                for i in new_nameservers.difference(old_nameservers):
-                    update_cmd.add_nameserver(i)
-                for i in old_nameservers.difference(new_nameservers):
-                    update_cmd.remove_nameserver(i)
-                self._session._exec(update_cmd)
-                self._cache = {}
+            if old_nameservers == new_nameservers:
+                return None
+            update_cmd = DomainUpdate(domainname=self._domainname)
+            for i in new_nameservers.difference(old_nameservers):
+                update_cmd.add_nameserver(i)
+            for i in old_nameservers.difference(new_nameservers):
+                update_cmd.remove_nameserver(i)
+            return update_cmd
 
         def get_period(self):
             raise NotImplementedError()
 
         def set_period(self, period):
+            ''' Set the renewal/subscription period to 1, 3 or 12 months.
+            Returns whether anything was changed. '''
             assert period in (1, 3, 12), period
             renew_cmd = DomainRenew(domainname=self._domainname, period=period)
-            self._session._exec(renew_cmd)
-            self._cache = {}
+            try:
+                value = self._exec_change(renew_cmd)
+            except UnexpectedData as e:
+                if self._period_unchanged(e):
+                    self._save_period(period)
+                    return False
+                raise
+            self._save_period(period)
+            self._write_through(self._written_renew, value)
+            return True
 
         # DNSSEC
 
@@ -383,8 +814,8 @@ class EppSession(object):
             assert b64decode(pubkey) is not None
             update_cmd = DnssecDomainUpdate(domainname=self._domainname)
             update_cmd.dnskey_add(flags, protocol, algo, pubkey)
-            self._session._exec(update_cmd)
-            self._cache = {}
+            self._exec_change(update_cmd)
+            self._write_through(self._written_dnskeys, update_cmd)
 
         # HELPERS #
 
@@ -392,9 +823,109 @@ class EppSession(object):
             return "<EppSession.Domain('%s')>" % self._domainname
 
         def _info(self):
-            if 'info' not in self._cache:
-                self._cache['info'] = self._session._exec(DomainInfo(domainname=self._domainname))
-            return self._cache['info']
+            if not self._session._is_fresh(self._cache):
+                self._cache = self._session._fetch_info(
+                    'domain', self._domainname,
+                    DomainInfo(domainname=self._domainname),
+                    eppresponse.DomainInfo)
+            return self._cache['record']
+
+        def _exec_change(self, command):
+            try:
+                return self._session._exec(command)
+            except Exception as e:
+                # Not a plain 1000: a 1001 (pending) or a lost connection
+                # may or may not have changed the domain. Fetch it again,
+                # unless the registry said nothing changed.
+                if not self._period_unchanged(e):
+                    self._cache = {}
+                raise
+
+        def _write_through(self, written, *args):
+            ''' After a change the registry answered with 1000: with
+            write_through, put the fields that written(info, *args)
+            returns in the cached info, which keeps its age, so it is
+            still fetched again after info_ttl. Otherwise, or when
+            written returns None, the info is fetched on next use. '''
+            info = self._cache.get('record')
+            changes = None
+            if info is not None and self._session.write_through:
+                changes = written(info, *args)
+            if changes is None:
+                self._cache = {}
+            else:
+                self._cache = {'record': info.copy(**changes), 'fetched': self._cache['fetched']}
+
+        # The getters on a DomainInfo, shared with AsyncEppSession.Domain.
+
+        def _parse_dnskeys(self, info, flags):
+            if flags:
+                return tuple(i for i in info.dnskeys if i.flags == flags)
+            return info.dnskeys
+
+        def _parse_handles(self, info):
+            registrant = set() if info.registrant is None else set([info.registrant])
+            return {'registrant': registrant, 'admin': set(info.admin), 'tech': set(info.tech)}
+
+        def _parse_nameservers(self, info):
+            return set(info.nameservers)
+
+        def _parse_token(self, info):
+            return info.token
+
+        def _parse_transfer(self, value):
+            return eppresponse.TransferInfo.from_response(value)
+
+        def _load_period(self):
+            # The last period set, if there is a store that knows it.
+            if self._session.store is None:
+                return None
+            return self._session.store.load_period(self._domainname)
+
+        def _save_period(self, period):
+            if self._session.store is not None:
+                self._session.store.save_period(self._domainname, period)
+
+        def _period_unchanged(self, error):
+            # Whether a renew failed only because the period was set
+            # already.
+            return (
+                isinstance(error, UnexpectedData) and error.input is not None and
+                bool(xpath(error.input, self._session.XPATH_PERIOD_UNCHANGED)))
+
+        # The DomainInfo fields after a confirmed change, for
+        # _write_through.
+
+        def _written_handles(self, info, registrant, admin, tech):
+            changes = {}
+            if registrant is not None:
+                registrant = set(registrant)
+                changes['registrant'] = registrant.pop() if registrant else None
+            if admin is not None:
+                changes['admin'] = frozenset(admin)
+            if tech is not None:
+                changes['tech'] = frozenset(tech)
+            return changes
+
+        def _written_nameservers(self, info, nameservers):
+            return {'nameservers': frozenset(nameservers)}
+
+        def _written_dnskeys(self, info, update_cmd):
+            dnskeys = set(info.dnskeys)
+            dnskeys.difference_update(
+                self.Dnskey(protocol=i[1], flags=i[0], alg=i[2], pubKey=i[3])
+                for i in update_cmd.dnskey_remove_list)
+            dnskeys.update(
+                self.Dnskey(protocol=i[1], flags=i[0], alg=i[2], pubKey=i[3])
+                for i in update_cmd.dnskey_add_list)
+            return {'dnskeys': tuple(sorted(dnskeys, key=self.Dnskey.sort_key))}
+
+        def _written_renew(self, info, value):
+            # The new expiry date is in the response; without it, refetch.
+            expires = xpath(value, '//domain:renData/domain:exDate')
+            if not expires:
+                return None
+            return {'expires': expires[0].text}
 
         # ACTIONS #
 
@@ -417,12 +948,7 @@ class EppSession(object):
             ''' Request a domain transfer (to self). '''
             value = self._session._exec(DomainTransfer(domainname=self._domainname, token=token))
             self._cache = {}
-            # FIXME: this return value is not nice
-            domainname = xpath(value, '//domain:trnData/domain:name')[0].text
-            status = xpath(value, '//domain:trnData/domain:trStatus')[0].text  # pending
-            activation_date = xpath(value, '//domain:trnData/domain:acDate')[0].text  # 2010-05-22T13:49:04.000Z
-            svtrid = xpath(value, '//epp:trID/epp:svTRID')[0].text
-            return domainname, status, activation_date, svtrid
+            return self._parse_transfer(value)
 
         def untransfer(self):
             ''' Undo/cancel a domain transfer (to self). '''
@@ -449,20 +975,20 @@ def main():
             domain = session.domain_create('nu.nl', registrant=['DOE001234-REGIS'], tech=['DOE001234-TECHC'], admin=['DOE001234-ADMIN'])
             assert not session.domain_is_free('nu.nl')
 
-        print 'now-power.nl token', session.domain('now-power.nl').token
-        print 'message queue', session.messages(keep=False)
+        print('now-power.nl token %s' % (session.domain('now-power.nl').token,))
+        print('message queue %r' % (session.messages(keep=False),))
         assert session.domain_is_free('ditdomeinisvastvrij.nl')
         assert not session.domain_is_free('nu.nl')
         domain = session.domain('nu.nl')
-        print 'nu.nl handles', domain.get_handles()
-    except eppxml.UnexpectedData, e:
-        print '== ERROR =='
-        print e
-        print
-        print '== SENT =='
-        print eppxml.pp(e.output)
-        print '== RECEIVED =='
-        print eppxml.pp(e.input)
+        print('nu.nl handles %r' % (domain.get_handles(),))
+    except eppxml.UnexpectedData as e:
+        print('== ERROR ==')
+        print(e)
+        print('')
+        print('== SENT ==')
+        print(eppxml.pp(e.output))
+        print('== RECEIVED ==')
+        print(eppxml.pp(e.input))
     finally:
         session.close()
         dsession.close()
@@ -0,0 +1,268 @@
+# vim: set ts=8 sw=4 sts=4 et ai:
+# Copyright (C) 2026, OSSO B.V.
+import threading
+import time
+from contextlib import contextmanager
+
+from eppcommand import Hello
+from eppratelimit import RateLimited
+from eppsession import EppSession
+from eppxml import UnexpectedData
+
+
+class PoolClosed(Exception):
+    pass
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class EppSessionPool(EppSession):
+    '''
+    A pool of logged in EppSessions for a single registrar account.
+
+    The pool behaves like an EppSession: every command checks out a
+    logged in session, runs on it and returns it to the pool. That
+    means that pool.domain(name) and pool.contact(handle) objects run
+    their commands on whichever connection is available.
+
+    Set max_size to (at most) the number of sessions the registry
+    allows for the account. A background thread keeps at least
+    min_size sessions logged in, replaces dead ones and sends a hello
+    on sessions that have been idle for keepalive seconds.
+    '''
+    def __init__(self, eppxml_generator, username, password, min_size=1,
+                 max_size=4, keepalive=300, pipeline_depth=16, **kwargs):
+        assert 0 <= min_size <= max_size and max_size > 0
+        super(EppSessionPool, self).__init__(
+            eppxml_generator, username, password,
+            pipeline_depth=pipeline_depth, **kwargs)
+        self.min_size = min_size
+        self.max_size = max_size
+        self.keepalive = keepalive
+        self.last_error = None
+
+        self.condition = threading.Condition()
+        self.idle = []  # list of (last_used, session), most recent last
+        self.size = 0   # idle, checked out and connecting sessions
+        self.lost = 0   # discarded sessions not replaced yet
+        self.closed = threading.Event()
+        self.refiller = threading.Thread(target=self._refill_loop)
+        self.refiller.daemon = True
+        self.refiller.start()
+
+    def _ensure_disconnected(self):
+        self.closed.set()
+        if self.refiller is not threading.current_thread():
+            self.refiller.join()
+        with self.condition:
+            idle, self.idle = self.idle, []
+            self.size -= len(idle)
+            self.condition.notify_all()
+        for last_used, session in idle:
+            self._close_quietly(session)
+
+    def _exec(self, command, expect_response=None):
+        with self.session() as session:
+            return session._exec(command, expect_response)
+
+    def submit(self, command, expect_response=None):
+        ''' Run the command on a pooled session. The returned Pending is
+        already done: pooled commands are not pipelined, use checkout()
+        or session() to pipeline on a single connection. '''
+        with self.session() as session:
+            pending = session.submit(command, expect_response)
+            session.collect()
+        return pending
+
+    def _prefetch(self, infos, window):
+        # Prefetch over up to max_size sessions, each pipelining window
+        # info commands; the sessions take the next one from infos. A
+        # session per window of infos is enough, so count them first.
+        infos = list(infos)
+        sessions = min(self.max_size, (len(infos) + window - 1) // window)
+        infos = iter(infos)
+        errors = {}
+        failures = []
+        lock = threading.Lock()
+
+        def take():
+            while True:
+                with lock:
+                    info = next(infos, None)
+                if info is None:
+                    break
+                yield info
+
+        def work():
+            try:
+                with self.session() as session:
+                    self._prefetch_on(session, take(), window, errors)
+            except Exception as e:
+                failures.append(e)
+
+        threads = [threading.Thread(target=work) for i in range(sessions)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if failures:
+            raise failures[0]
+        return errors
+
+    # CHECKOUT/CHECKIN #
+
+    def checkout(self, timeout=None):
+        ''' Take a logged in session from the pool, log in a new one if
+        there is room, or wait for one to be returned. Return it with
+        checkin(). Raises PoolTimeout if none is free within timeout
+        seconds. '''
+        deadline = None if timeout is None else time.time() + timeout
+        with self.condition:
+            while True:
+                if self.closed.is_set():
+                    raise PoolClosed('pool is closed')
+                if self.idle:
+                    return self.idle.pop()[1]
+                if self.size < self.max_size:
+                    self.size += 1
+                    break
+                if deadline is None:
+                    self.condition.wait()
+                elif deadline > time.time():
+                    self.condition.wait(deadline - time.time())
+                else:
+                    raise PoolTimeout('timeout waiting for a free session')
+        try:
+            return self._new_session()
+        except Exception:
+            with self.condition:
+                self.size -= 1
+                self.condition.notify()
+            raise
+
+    def checkin(self, session, discard=False):
+        ''' Return a session to the pool. Commands still in flight are
+        collected first, so the next user (or the keepalive) does not
+        read their responses. Discard it if the connection is no longer
+        usable. '''
+        if not discard and session.pending and session.eppxml is not None:
+            try:
+                session.collect()
+            except Exception:
+                discard = True  # the error is on the Pendings too
+        with self.condition:
+            if discard or self.closed.is_set() or session.eppxml is None:
+                self.size -= 1
+                if not self.closed.is_set():
+                    self.lost += 1
+                discard = True
+            else:
+                self.idle.append((time.time(), session))
+            self.condition.notify()
+        if discard:
+            self._close_quietly(session)
+
+    @contextmanager
+    def session(self, timeout=None):
+        ''' Use as: with pool.session() as session: ... '''
+        session = self.checkout(timeout=timeout)
+        try:
+            yield session
+        except (UnexpectedData, RateLimited):
+            # The registry did not like the command, or the rate limiter
+            # did not let it out; the connection itself is fine.
+            self.checkin(session)
+            raise
+        except BaseException:
+            self.checkin(session, discard=True)
+            raise
+        else:
+            self.checkin(session)
+
+    # HELPERS #
+
+    def _new_session(self):
+        session = EppSession(
+            self.eppxml_generator, self.username, self.password,
+            pipeline_depth=self.pipeline_depth, store=self.store,
+            rate_limiter=self.rate_limiter)
+        session.hooks = self.hooks
+        with self.condition:
+            if self.lost:
+                self.lost -= 1
+                session.replacement = True
+        try:
+            session._ensure_connected()
+        except Exception:
+            if session.replacement:
+                with self.condition:
+                    self.lost += 1
+            raise
+        return session
+
+    def _close_quietly(self, session):
+        try:
+            session.close()
+        except Exception:
+            # Probably dead already; make sure the socket is gone.
+            session.eppxml = None
+
+    def _ping(self, session):
+        session.eppxml.expect(Hello(), '/epp:epp/epp:greeting')
+
+    def _refill_loop(self):
+        interval = max(1, min(self.keepalive, 30))
+        while not self.closed.is_set():
+            try:
+                self._refill()
+            except Exception as e:
+                self.last_error = e  # registry down? try again later
+            self.closed.wait(interval)
+
+    def _refill(self):
+        # Keepalive for idle sessions.
+        with self.condition:
+            stale_before = time.time() - self.keepalive
+            stale = [i for i in self.idle if i[0] < stale_before]
+            self.idle = [i for i in self.idle if i[0] >= stale_before]
+        for last_used, session in stale:
+            try:
+                self._ping(session)
+            except Exception as e:
+                self.last_error = e
+                self.checkin(session, discard=True)
+            else:
+                self.checkin(session)
+
+        # Log in new sessions until we have min_size.
+        while True:
+            with self.condition:
+                if self.closed.is_set() or self.size >= self.min_size:
+                    break
+                self.size += 1
+            try:
+                session = self._new_session()
+            except Exception:
+                with self.condition:
+                    self.size -= 1
+                raise
+            self.checkin(session)
+
+
+def main():
+    import eppsocket
+    import eppxml
+
+    pool = EppSessionPool(lambda: eppxml.wrap_socket(eppsocket.tcp_connect('testdrs.my-domain-registry.nl')), '301234', 'aabbccddee', min_size=2, max_size=4)
+    try:
+        print('nu.nl handles %r' % (pool.domain('nu.nl').get_handles(),))
+        with pool.session() as session:
+            print('nu.nl free %r' % (session.domain_is_free('nu.nl'),))
+    finally:
+        pool.close()
+
+
+if __name__ == '__main__':
+    main()
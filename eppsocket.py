@@ -1,119 +1,316 @@
 # vim: set ts=8 sw=4 sts=4 et ai:
 # Copyright (C) 2011, OSSO B.V., Walter Doekes
+import errno
+import os
+import select
 import socket
-import sys
+import struct
+import time
 try:
-    from ssl import wrap_socket as ssl_socket
+    from ssl import SSLContext, CERT_NONE
+    try:
+        from ssl import PROTOCOL_TLS_CLIENT as PROTOCOL
+    except ImportError:
+        from ssl import PROTOCOL_SSLv23 as PROTOCOL
 except ImportError:
-    class ssl_socket:
-        def __init__(self, socket):
-            self.socket = socket
+    # Python 2.7.8 and older: a fresh context for every connection.
+    SSLContext = None
+    from ssl import wrap_socket as ssl_socket
 
-        def __getattr__(self, name):
-            return getattr(self.socket, name)
+from epptrace import trace_writer
 
-        def connect(self, *args, **kwargs):
-            self.socket.connect(*args, **kwargs)
-            self.ssl = socket.ssl(self.socket)
+IANA_TCP_PORT = 700  # the default TCP port for EPP
+MAX_FRAME_SIZE = 16 * 1024 * 1024  # refuse larger frames from the server
+HEADER = struct.Struct('>I')  # total frame length, including the header
+CONNECT_TIMEOUT = 30  # seconds for the TCP connect and TLS handshake
+FALLBACK_DELAY = 0.25  # start the next address if a connect takes longer
 
-        def read(self, *args, **kwargs):
-            return self.ssl.read(*args, **kwargs)
-        recv = read
+# Shared by all connections: one SSLContext per client certificate and
+# the last TLS session per server, to resume instead of doing a full
+# handshake on reconnect.
+SSL_CONTEXTS = {}
+TLS_SESSIONS = {}
 
-        def write(self, *args, **kwargs):
-            return self.ssl.write(*args, **kwargs)
-        send = write
 
-
-IANA_TCP_PORT = 700  # the default TCP port for EPP
+class FramingError(IOError):
+    pass
 
 
 class EppSocket(object):
-    def __init__(self, socket, tracefile=None):
+    def __init__(self, socket, tracefile=None, max_frame_size=MAX_FRAME_SIZE):
         self.socket = socket
-        self.tracefile = tracefile
+        if tracefile is not None and not hasattr(tracefile, 'record'):
+            tracefile = trace_writer(tracefile)  # a plain file
+        self.tracefile = tracefile  # an epptrace.TraceWriter
+        self.max_frame_size = max_frame_size
+        self.timings = {}  # seconds per connect phase, set by tcp_connect
+        self.tls_session_key = None
+        # TLS sockets cannot scatter-gather (and have no sendmsg on
+        # Python 2 anyway).
+        self.scatter_gather = (
+            hasattr(socket, 'sendmsg') and not hasattr(socket, 'cipher'))
 
     def close(self):
         assert self.socket is not None
+        # TLS 1.3 session tickets arrive after the handshake; by now we
+        # have them.
+        save_tls_session(self.tls_session_key, self.socket)
         self.socket.shutdown(socket.SHUT_RDWR)
         self.socket.close()
         self.socket = None
 
     def read(self):
+        '''
+        Read one frame. Returns the body as a bytearray, which was
+        allocated once and filled in place.
+        '''
         # FIXME: catch timeout, broken pipe, etc.
         assert self.socket is not None
-        length = self.socket.recv(4)
-        length = (ord(length[0]) << 24 | ord(length[1]) << 16 | ord(length[2]) << 8 | ord(length[3])) - 4
-        # print 'attempting to read %d bytes\n' % length
-        data = ''
-        while len(data) < length:
-            data += self.socket.recv(length - len(data))
+        header = bytearray(HEADER.size)
+        self._recv_into(header)
+        length = HEADER.unpack_from(header)[0] - HEADER.size
+        if not (0 <= length <= self.max_frame_size):
+            raise FramingError('invalid EPP frame length %d' % length)
+        data = bytearray(length)
+        self._recv_into(data)
         if self.tracefile:
-            self.tracefile.write('\x1b[1;35minput[\x1b[0m%s\x1b[1;35m]\x1b[0m\n' % data)
+            self.tracefile.record('in', data)
         return data
 
+    def read_chunks(self, chunk_size=16384):
+        '''
+        Read one frame, yielding the body in chunks as they arrive. The
+        generator must be exhausted before the next read.
+        '''
+        assert self.socket is not None
+        header = bytearray(HEADER.size)
+        self._recv_into(header)
+        length = HEADER.unpack_from(header)[0] - HEADER.size
+        if not (0 <= length <= self.max_frame_size):
+            raise FramingError('invalid EPP frame length %d' % length)
+        traced = []
+        while length:
+            chunk = self.socket.recv(min(length, chunk_size))
+            if not chunk:
+                raise FramingError('connection closed by peer with %d bytes to go' % length)
+            length -= len(chunk)
+            if self.tracefile:
+                traced.append(chunk)
+            yield chunk
+        if self.tracefile:
+            self.tracefile.record('in', b''.join(traced))
+
+    def _recv_into(self, buffer):
+        # TLS records and TCP segments may split the frame anywhere, so
+        # keep reading until the buffer is full.
+        view = memoryview(buffer)
+        while len(view):
+            received = self.socket.recv_into(view)
+            if not received:
+                raise FramingError('connection closed by peer with %d bytes to go' % len(view))
+            view = view[received:]
+
     def write(self, data):
+        self.write_many((data,))
+
+    def write_many(self, frames):
+        '''
+        Write one or more frames at once. Plain sockets get the headers
+        and bodies through a single scatter-gather sendmsg. Otherwise
+        the frames are laid out in one buffer, so several pipelined
+        commands can share a TLS record. Partial sends never copy.
+        '''
         # FIXME: catch timeout, broken pipe, etc.
         assert self.socket is not None
         if self.tracefile:
-            self.tracefile.write('\x1b[1;34moutput[\x1b[0m%s\x1b[1;34m]\x1b[0m\n' % data)
-        l = len(data) + 4
-        length = '%c%c%c%c' % (chr((l >> 24) & 0xff), chr((l >> 16) & 0xff), chr((l >> 8) & 0xff), chr(l & 0xff))
-        sent = 0
-        data = '%s%s' % (length, data)
-        while sent < l:
-            sent += self.socket.send(data[sent:])
+            for data in frames:
+                self.tracefile.record('out', data)
+        if self.scatter_gather:
+            buffers = []
+            for data in frames:
+                buffers.append(HEADER.pack(len(data) + HEADER.size))
+                buffers.append(data)
+            self._sendmsg_all(buffers)
+        else:
+            buffer = bytearray(sum(HEADER.size + len(i) for i in frames))
+            offset = 0
+            for data in frames:
+                HEADER.pack_into(buffer, offset, len(data) + HEADER.size)
+                offset += HEADER.size
+                buffer[offset:(offset + len(data))] = data
+                offset += len(data)
+            self._send_all(buffer)
+
+    def _send_all(self, buffer):
+        view = memoryview(buffer)
+        while len(view):
+            view = view[self.socket.send(view):]
 
+    def _sendmsg_all(self, buffers):
+        views = [memoryview(i) for i in buffers]
+        while views:
+            sent = self.socket.sendmsg(views)
+            while views and sent >= len(views[0]):
+                sent -= len(views.pop(0))
+            if sent:
+                views[0] = views[0][sent:]
 
-def wrap_socket(socket, tracefile=None):
+
+def wrap_socket(socket, tracefile=None, max_frame_size=MAX_FRAME_SIZE):
     '''
     Wrap the socket in an EppSocket. Now you can only read/write/close
     the socket.
     '''
-    return EppSocket(socket, tracefile=tracefile)
+    return EppSocket(socket, tracefile=tracefile, max_frame_size=max_frame_size)
 
 
-def tcp_connect(address, ssl=True, tracefile=None):
+def ssl_context(certfile=None, keyfile=None):
     '''
-    Example connection function.
+    Returns the shared SSLContext for the client certificate, if any.
+    Like before, the server certificate is not checked.
     '''
-    if isinstance(address, basestring):
+    key = (certfile, keyfile)
+    context = SSL_CONTEXTS.get(key)
+    if context is None:
+        context = SSLContext(PROTOCOL)
+        context.check_hostname = False
+        context.verify_mode = CERT_NONE
+        if certfile:
+            context.load_cert_chain(certfile, keyfile)
+        context = SSL_CONTEXTS.setdefault(key, context)
+    return context
+
+
+def save_tls_session(key, sock):
+    if key is not None and getattr(sock, 'session', None) is not None:
+        TLS_SESSIONS[key] = sock.session
+
+
+def tcp_connect(address, ssl=True, tracefile=None, max_frame_size=MAX_FRAME_SIZE,
+                certfile=None, keyfile=None, timeout=CONNECT_TIMEOUT):
+    '''
+    Example connection function. Races the addresses of the host
+    (happy eyeballs), resumes the previous TLS session to the host when
+    the ssl module supports that and records how long every phase took
+    in the timings of the returned EppSocket.
+    '''
+    if not isinstance(address, (tuple, list)):
         address = (str(address), IANA_TCP_PORT)
     else:
         assert len(address) == 2
         address = (str(address[0]), int(address[1]))
+    timings = {}
+    started = time.time()
 
     # Lookup addresses
-    addresses = socket.getaddrinfo(address[0], address[1])
-    addresses = [i for i in addresses if (i[0] == socket.AF_INET or i[0] == socket.AF_INET6) and i[1] == socket.SOCK_STREAM]
-    addresses.sort(key=lambda x: x[0], reverse=True)  # AF_INET6 sorts before AF_INET
-
-    for address in addresses:  # should be nonempty, or we have a previous gaierror
-        try:
-            sock = socket.socket(*address[0:3])
-            if ssl:
-                ssl_sock = ssl_socket(sock)  # skip certificate checks
-                ssl_sock.connect(address[4])
-                sock = ssl_sock
-            break
-        except:
-            exc_info = sys.exc_info()
-            pass
-    else:
-        # Re-raise exception
-        raise exc_info[1], None, exc_info[2]
+    addresses = socket.getaddrinfo(address[0], address[1], 0, socket.SOCK_STREAM)
+    addresses = [i for i in addresses if i[0] in (socket.AF_INET, socket.AF_INET6)]
+    if not addresses:
+        raise socket.gaierror('no IPv4/IPv6 address for %s' % (address[0],))
+    timings['resolve'] = time.time() - started
+
+    sock = _race_connect(_interleave(addresses), started + timeout)
+    timings['connect'] = time.time() - started - timings['resolve']
+    timings['address'] = sock.getpeername()
+    try:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        for option, value in (('TCP_KEEPIDLE', 60), ('TCP_KEEPINTVL', 15), ('TCP_KEEPCNT', 4)):
+            if hasattr(socket, option):
+                sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, option), value)
+
+        session_key = None
+        if ssl:
+            sock.settimeout(max(0.001, started + timeout - time.time()))
+            handshake_started = time.time()
+            if SSLContext is None:
+                sock = ssl_socket(sock, certfile=certfile, keyfile=keyfile)
+            else:
+                session_key = (address, certfile, keyfile)
+                kwargs = {}
+                if session_key in TLS_SESSIONS:
+                    kwargs['session'] = TLS_SESSIONS[session_key]
+                sock = ssl_context(certfile, keyfile).wrap_socket(
+                    sock, server_hostname=address[0], **kwargs)
+                timings['resumed'] = getattr(sock, 'session_reused', False)
+                save_tls_session(session_key, sock)
+            timings['handshake'] = time.time() - handshake_started
+        sock.settimeout(None)
+    except:
+        sock.close()
+        raise
 
-    return wrap_socket(sock, tracefile=tracefile)
+    eppsocket = wrap_socket(sock, tracefile=tracefile, max_frame_size=max_frame_size)
+    eppsocket.timings = timings
+    eppsocket.tls_session_key = session_key
+    return eppsocket
+
+
+def _interleave(addresses):
+    # Alternate the address families, starting with IPv6, so a broken
+    # family costs at most FALLBACK_DELAY.
+    ipv6 = [i for i in addresses if i[0] == socket.AF_INET6]
+    ipv4 = [i for i in addresses if i[0] == socket.AF_INET]
+    ret = []
+    while ipv6 or ipv4:
+        ret.extend(i.pop(0) for i in (ipv6, ipv4) if i)
+    return ret
+
+
+def _race_connect(addresses, deadline):
+    '''
+    Start a non-blocking connect to the first address, and to the next
+    one whenever the previous attempts failed or have not succeeded
+    within FALLBACK_DELAY. Returns the first connected socket.
+    '''
+    in_progress = {}  # socket -> address
+    error = None
+    next_attempt = 0
+    try:
+        while True:
+            now = time.time()
+            if addresses and (not in_progress or now >= next_attempt):
+                family, socktype, proto, canonname, sockaddr = addresses.pop(0)
+                sock = socket.socket(family, socktype, proto)
+                sock.setblocking(False)
+                code = sock.connect_ex(sockaddr)
+                if code in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+                    in_progress[sock] = sockaddr
+                else:
+                    sock.close()
+                    error = socket.error(code, os.strerror(code))
+                next_attempt = now + FALLBACK_DELAY
+                continue
+            if not in_progress:
+                raise error
+            if now >= deadline:
+                raise socket.timeout('connect timed out')
+            wait = deadline - now
+            if addresses:
+                wait = min(wait, next_attempt - now)
+            writable = select.select([], list(in_progress), [], wait)[1]
+            for sock in writable:
+                del in_progress[sock]
+                code = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                if code == 0:
+                    sock.setblocking(True)
+                    return sock
+                sock.close()
+                error = socket.error(code, os.strerror(code))
+                next_attempt = 0  # try the next address right away
+    finally:
+        for sock in in_progress:
+            sock.close()
 
 
 def main():
     socket = tcp_connect('testdrs.my-domain-registry.nl')
     socket.write("""<?xml version="1.0" encoding="UTF-8" standalone="no"?><epp xmlns="urn:ietf:params:xml:ns:epp-1.0"><hello/></epp>""")
     data = socket.read()
-    print data
+    print(data)
     data = socket.read()
     socket.close()
-    print data
+    print(data)
 
 
 if __name__ == '__main__':
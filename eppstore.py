@@ -0,0 +1,160 @@
+# vim: set ts=8 sw=4 sts=4 et ai:
+# Copyright (C) 2026, OSSO B.V.
+import sqlite3
+import threading
+import time
+
+from lxml import etree
+
+from eppxml import PARSER_OPTIONS, frombuffer
+
+
+class EppStore(object):
+    '''
+    Local SQLite store for info responses and acknowledged poll
+    messages, shared by every process that opens the same file.
+
+    Info responses are kept per (kind, key), e.g. ('domain', 'nu.nl'),
+    together with the time they were fetched. load() only returns them
+    while they are younger than max_age seconds. The session drops the
+    stored info of every object it sends a mutating command for.
+
+    The info response does not tell the renewal period of a domain, so
+    the last period set (or found set already) is kept as well.
+
+    All of it belongs to a single registrar account: the info holds its
+    transfer tokens. A session claims the store for its username, and a
+    session of another account is refused.
+    '''
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS info (
+            kind TEXT NOT NULL,
+            key TEXT NOT NULL,
+            fetched REAL NOT NULL,
+            xml BLOB NOT NULL,
+            PRIMARY KEY (kind, key));
+        CREATE TABLE IF NOT EXISTS message (
+            msgid TEXT NOT NULL PRIMARY KEY,
+            qdate TEXT,
+            archived REAL NOT NULL,
+            xml BLOB NOT NULL);
+        CREATE TABLE IF NOT EXISTS account (
+            username TEXT NOT NULL PRIMARY KEY);
+        CREATE TABLE IF NOT EXISTS period (
+            domainname TEXT NOT NULL PRIMARY KEY,
+            period INTEGER NOT NULL,
+            saved REAL NOT NULL);
+    '''
+
+    def __init__(self, path, max_age=300):
+        self.path = path
+        self.max_age = max_age
+        # One connection, shared by the sessions of a pool.
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(
+            path, timeout=30, isolation_level=None, check_same_thread=False)
+        with self.lock:
+            if path != ':memory:':
+                # Readers in other processes do not block the writer.
+                self.db.execute('PRAGMA journal_mode=WAL')
+            self.db.executescript(self.SCHEMA)
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    def claim(self, username):
+        ''' Ties the store to the account, unless it belongs to another
+        one already; then raises ValueError. '''
+        with self.lock:
+            self.db.execute(
+                'INSERT INTO account (username) SELECT ? '
+                'WHERE NOT EXISTS (SELECT 1 FROM account)', (username,))
+            owner = self.db.execute('SELECT username FROM account').fetchone()[0]
+        if owner != username:
+            raise ValueError('store %s belongs to account %s, not %s' % (
+                self.path, owner, username))
+
+    # INFO #
+
+    def load(self, kind, key):
+        ''' Returns (dom, fetched) or None if there is no recent info. '''
+        with self.lock:
+            row = self.db.execute(
+                'SELECT fetched, xml FROM info WHERE kind = ? AND key = ?',
+                (kind, key)).fetchone()
+        if row is None or row[0] + self.max_age <= time.time():
+            return None
+        return frombuffer(row[1], etree.XMLParser(**PARSER_OPTIONS)), row[0]
+
+    def save(self, kind, key, dom, fetched=None):
+        if fetched is None:
+            fetched = time.time()
+        xml = sqlite3.Binary(etree.tostring(dom))
+        with self.lock:
+            self.db.execute(
+                'INSERT OR REPLACE INTO info (kind, key, fetched, xml) '
+                'VALUES (?, ?, ?, ?)', (kind, key, fetched, xml))
+
+    def invalidate(self, kind, key):
+        with self.lock:
+            self.db.execute(
+                'DELETE FROM info WHERE kind = ? AND key = ?', (kind, key))
+
+    def expire(self):
+        ''' Drop all info older than max_age. '''
+        with self.lock:
+            self.db.execute(
+                'DELETE FROM info WHERE fetched <= ?',
+                (time.time() - self.max_age,))
+
+    # PERIODS #
+
+    def load_period(self, domainname):
+        ''' Returns the last period saved for the domain, or None. '''
+        with self.lock:
+            row = self.db.execute(
+                'SELECT period FROM period WHERE domainname = ?',
+                (domainname,)).fetchone()
+        return None if row is None else row[0]
+
+    def save_period(self, domainname, period):
+        with self.lock:
+            self.db.execute(
+                'INSERT OR REPLACE INTO period (domainname, period, saved) '
+                'VALUES (?, ?, ?)', (domainname, period, time.time()))
+
+    # MESSAGES #
+
+    def archive_message(self, msgid, dom, qdate=None):
+        ''' Store a poll message; call this before acknowledging it. '''
+        xml = sqlite3.Binary(etree.tostring(dom))
+        with self.lock:
+            self.db.execute(
+                'INSERT OR REPLACE INTO message (msgid, qdate, archived, xml) '
+                'VALUES (?, ?, ?, ?)', (msgid, qdate, time.time(), xml))
+
+    def messages(self, since=None):
+        ''' Yields (msgid, qdate, dom) of archived messages, oldest
+        first. Optionally only those archived after since. '''
+        with self.lock:
+            rows = self.db.execute(
+                'SELECT msgid, qdate, xml FROM message WHERE archived > ? '
+                'ORDER BY archived, rowid', (since or 0,)).fetchall()
+        for msgid, qdate, xml in rows:
+            yield msgid, qdate, frombuffer(xml, etree.XMLParser(**PARSER_OPTIONS))
+
+
+def main():
+    import sys
+
+    store = EppStore(sys.argv[1] if len(sys.argv) > 1 else ':memory:')
+    try:
+        for msgid, qdate, dom in store.messages():
+            print('%s %s %s' % (msgid, qdate, etree.tostring(dom)))
+    finally:
+        store.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+# vim: set ts=8 sw=4 sts=4 et ai:
+# Copyright (C) 2026, OSSO B.V.
+import atexit
+import json
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+try:
+    from queue import Full, Queue
+except ImportError:  # Python 2
+    from Queue import Full, Queue
+
+# Credentials and transfer tokens: <pw>, <newPW>, <domain:pw>, ...
+REDACT_RE = re.compile(br'(<(?:[\w-]+:)?(?:pw|newPW)\b[^>]*>)[^<]*(<)')
+CLTRID_RE = re.compile(br'<(?:[\w-]+:)?clTRID>([^<]*)<')
+COMMAND_RE = re.compile(br'<command>\s*<(\w+)\b[^>]*>\s*<(?:(\w+):)?')
+EXTENSION_COMMAND_RE = re.compile(br'<(?:[\w-]+:)?command\b[^>]*>\s*<(?:[\w-]+:)?(\w+)')
+RESULT_RE = re.compile(br'<result code="(\d+)"')
+MAX_UNANSWERED = 10000  # written commands remembered for the duration
+
+# TraceWriters for plain files, so all connections share one.
+TRACE_WRITERS = {}
+TRACE_WRITERS_LOCK = threading.Lock()
+
+
+class TraceWriter(object):
+    '''
+    Writes one JSON line per EPP frame: ts, dir (in/out), command (like
+    domain:info), cltrid, size, duration (seconds from command to
+    response), code (responses) and the payload.
+
+    The socket only queues a reference to the frame. The background
+    thread does the rest, so tracing stays off the hot path. When the
+    queue is full, frames are dropped and counted. Passwords and
+    tokens are redacted, payloads are cut at max_payload bytes and
+    sample (0..1) selects a fraction of the commands, always with their
+    responses.
+    '''
+    def __init__(self, file, sample=1.0, max_payload=4096, queue_size=10000, redact=True):
+        if hasattr(file, 'write'):
+            self.file = file
+            self.owns_file = False
+        else:
+            self.file = open(file, 'a')
+            self.owns_file = True
+        self.sample = sample
+        self.max_payload = max_payload
+        self.redact = redact
+        self.queue = Queue(queue_size)
+        self.dropped = 0
+        self.unanswered = OrderedDict()  # cltrid -> (ts, command)
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+        atexit.register(self.close)
+
+    def record(self, direction, data, connection=None):
+        ''' Queue a frame (bytes or bytearray, not changed afterwards).
+        Never blocks. A connection id, if any, is written as conn. '''
+        try:
+            self.queue.put_nowait((time.time(), direction, data, connection))
+        except Full:
+            self.dropped += 1
+
+    def close(self):
+        ''' Write what is queued and stop. '''
+        if self.thread is not None:
+            self.queue.put((None, None, None, None))
+            self.thread.join()
+            self.thread = None
+            if self.owns_file:
+                self.file.close()
+
+    def _run(self):
+        while True:
+            ts, direction, data, connection = self.queue.get()
+            if direction is None:
+                break
+            line = self._format(ts, direction, bytes(data), connection)
+            if line is not None:
+                self.file.write(line + '\n')
+            if self.queue.empty():
+                self.file.flush()
+        self.file.flush()
+
+    def _format(self, ts, direction, data, connection=None):
+        match = CLTRID_RE.search(data)
+        cltrid = match.group(1).decode('utf-8', 'replace') if match else None
+        if cltrid is not None and self.sample < 1:
+            if (zlib.crc32(cltrid.encode('utf-8')) & 0xffff) >= self.sample * 0x10000:
+                self.unanswered.pop(cltrid, None)
+                return None
+        record = OrderedDict((
+            ('ts', round(ts, 6)), ('dir', direction), ('command', None),
+            ('cltrid', cltrid), ('size', len(data)), ('duration', None)))
+        if connection is not None:
+            record['conn'] = connection
+
+        if direction == 'out':
+            record['command'] = self._command(data)
+            if cltrid is not None:
+                self.unanswered[cltrid] = (ts, record['command'])
+                if len(self.unanswered) > MAX_UNANSWERED:
+                    self.unanswered.popitem(last=False)
+        else:
+            if cltrid in self.unanswered:
+                sent, record['command'] = self.unanswered.pop(cltrid)
+                record['duration'] = round(ts - sent, 6)
+            match = RESULT_RE.search(data)
+            record['code'] = match.group(1).decode('ascii') if match else None
+
+        if self.redact:
+            data = REDACT_RE.sub(br'\1***\2', data)
+        if len(data) > self.max_payload:
+            data = data[:self.max_payload]
+            record['truncated'] = True
+        record['payload'] = data.decode('utf-8', 'replace')
+        return json.dumps(record)
+
+    @staticmethod
+    def _command(data):
+        match = COMMAND_RE.search(data)
+        if match:
+            # <command><info><domain:info ...> => domain:info
+            if match.group(2):
+                return '%s:%s' % (match.group(2).decode('ascii'), match.group(1).decode('ascii'))
+            return match.group(1).decode('ascii')  # login, logout, poll
+        match = EXTENSION_COMMAND_RE.search(data)
+        if match:
+            return match.group(1).decode('ascii')  # domainCancelDelete
+        if b'<hello' in data:
+            return 'hello'
+        return None
+
+
+def trace_writer(file, **kwargs):
+    ''' Returns the shared TraceWriter for a file object or path. '''
+    key = file if isinstance(file, str) else id(file)
+    with TRACE_WRITERS_LOCK:
+        if key not in TRACE_WRITERS:
+            TRACE_WRITERS[key] = TraceWriter(file, **kwargs)
+        return TRACE_WRITERS[key]
@@ -1,7 +1,22 @@
 # vim: set ts=8 sw=4 sts=4 et ai:
 # Copyright (C) 2011, OSSO B.V., Walter Doekes
+import time
+
 from lxml import etree
-import eppsocket
+
+NAMESPACES = {
+    'epp': 'urn:ietf:params:xml:ns:epp-1.0',
+    'contact': 'urn:ietf:params:xml:ns:contact-1.0',
+    'domain': 'urn:ietf:params:xml:ns:domain-1.0',
+    'secDNS': 'urn:ietf:params:xml:ns:secDNS-1.1',
+    'sidn-ext-epp': 'http://rxsd.domain-registry.nl/sidn-ext-epp-1.0',
+}
+
+PARSER_OPTIONS = {
+    'resolve_entities': False,
+    'no_network': True,
+    'load_dtd': False,
+}
 
 
 class UnexpectedData(Exception):
@@ -9,15 +24,34 @@ class UnexpectedData(Exception):
         self.output, self.input, self.xpath = output, input, xpath
 
     def __str__(self):
-        return unicode(self).encode('utf-8')
+        if str is bytes:
+            return self.__unicode__().encode('utf-8')
+        return self.__unicode__()
 
     def __unicode__(self):
         return u'Expected %s xpath on %s command.' % (self.xpath, self.output.__class__.__name__)
 
 
 class EppXml(object):
-    def __init__(self, eppsocket):
+    '''
+    With incremental=True, every frame is fed to a pull parser chunk by
+    chunk as it comes off the wire, so parsing overlaps with the
+    transfer. result_code is set as soon as the <result> tag is seen.
+    '''
+    def __init__(self, eppsocket, incremental=False):
         self.eppsocket = eppsocket
+        self.incremental = incremental
+        self.result_code = None
+        # (received at, seconds parsing, body size) of the last read.
+        self.read_stats = None
+        # Parsers are reused for every frame on this connection. They
+        # do not load DTDs, expand entities or touch the network.
+        if incremental:
+            self.parser = etree.XMLPullParser(
+                events=('start',), tag='{%s}result' % NAMESPACES['epp'],
+                **PARSER_OPTIONS)
+        else:
+            self.parser = etree.XMLParser(**PARSER_OPTIONS)
 
     def close(self):
         assert self.eppsocket is not None
@@ -29,24 +63,73 @@ class EppXml(object):
             self.write(write)
         xml = self.read()
         if xpath_read_check is not None:
-            try:
-                xpath(xml, xpath_read_check)[0]
-            except IndexError:
+            if not xpath(xml, xpath_read_check):
                 raise UnexpectedData(write, xml, xpath_read_check)
         return xml
 
     def read(self):
         assert self.eppsocket is not None
-        return etree.XML(self.eppsocket.read())
+        if self.incremental:
+            return self._read_incremental()
+        data = self.eppsocket.read()
+        received = time.time()
+        root = frombuffer(data, self.parser)
+        self.read_stats = (received, time.time() - received, len(data))
+        return root
+
+    def _read_incremental(self):
+        parser = self.parser
+        self.result_code = None
+        error = None
+        size = 0
+        # Always drain the whole frame, or the stream gets out of sync.
+        for chunk in self.eppsocket.read_chunks():
+            size += len(chunk)
+            if error is None:
+                try:
+                    parser.feed(chunk)
+                    for event, element in parser.read_events():
+                        self.result_code = element.get('code')
+                except etree.XMLSyntaxError as e:
+                    error = e
+        received = time.time()
+        try:
+            root = parser.close()  # also resets the parser
+        except etree.XMLSyntaxError as e:
+            error = error or e
+        # Most of the parsing overlapped with the transfer.
+        self.read_stats = (received, time.time() - received, size)
+        if error is not None:
+            raise error
+        return root
 
     def write(self, xml):
         assert self.eppsocket is not None
         return self.eppsocket.write(fromdom(xml))
 
+    def write_many(self, xmls):
+        assert self.eppsocket is not None
+        return self.eppsocket.write_many([fromdom(i) for i in xmls])
+
+
+try:
+    etree.XML(bytearray(b'<epp/>'))
+except (TypeError, ValueError):
+    # Older lxml (and lxml on Python 2) only parses strings.
+    def frombuffer(buffer, parser=None):
+        return etree.XML(bytes(buffer), parser)
+else:
+    def frombuffer(buffer, parser=None):
+        return etree.XML(buffer, parser)
+
 
 def fromdom(instance):
+    if isinstance(instance, bytes):
+        return instance  # serialized already
     if isinstance(instance, etree._Element):
         return etree.tostring(instance)
+    if hasattr(instance, 'toxml'):
+        return instance.toxml()
     return str(instance)
 
 
@@ -60,24 +143,44 @@ def pp(dom):
     return etree.tostring(todom(dom), pretty_print=True)
 
 
-def wrap_socket(socket):
-    return EppXml(socket)
+def wrap_socket(socket, incremental=False):
+    return EppXml(socket, incremental=incremental)
+
+
+# Compiled XPath objects by expression. Compiling is several times more
+# expensive than evaluating, so every expression is compiled only once.
+XPATHS = {}
+
+
+def compile_xpath(expr):
+    '''Returns the compiled etree.XPath for expr (using NAMESPACES).'''
+    try:
+        return XPATHS[expr]
+    except KeyError:
+        compiled = XPATHS[expr] = etree.XPath(expr, namespaces=NAMESPACES)
+        return compiled
 
 
 def xpath(dom, expr):
     '''Use as xpath(dom, '//epp:epp/epp:greeting').'''
-    return dom.xpath(expr, namespaces={
-        'epp': 'urn:ietf:params:xml:ns:epp-1.0',
-        'contact': 'urn:ietf:params:xml:ns:contact-1.0',
-        'domain': 'urn:ietf:params:xml:ns:domain-1.0',
-    })
+    try:
+        compiled = XPATHS[expr]
+    except KeyError:
+        compiled = compile_xpath(expr)
+    return compiled(dom)
+
+
+def qname(prefix, localname):
+    '''Returns the Clark notation tag, e.g. for comparing element.tag.'''
+    return '{%s}%s' % (NAMESPACES[prefix], localname)
 
 
 def main():
+    import eppsocket
     xml = wrap_socket(eppsocket.tcp_connect('testdrs.my-domain-registry.nl'))
     x = xml.read()
     xml.close()
-    print etree.tostring(x, pretty_print=True)
+    print(etree.tostring(x, pretty_print=True))
 
 
 if __name__ == '__main__':
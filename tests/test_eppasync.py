@@ -0,0 +1,149 @@
+# vim: set ts=8 sw=4 sts=4 et ai:
+# Copyright (C) 2026, OSSO B.V.
+'''
+Checks the framing, clTRID correlation and setters of eppasync. The
+coroutines are run with run_until_complete, so this file still loads
+(and skips) on Python 2.
+'''
+import os
+import struct
+import sys
+import unittest
+
+from lxml import etree
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import eppmockserver  # noqa
+from eppcommand import DomainInfo  # noqa
+from eppsocket import FramingError  # noqa
+try:
+    import asyncio
+    import eppasync
+except (ImportError, SyntaxError):  # Python 2
+    eppasync = None
+
+RESPONSE = (
+    '<epp xmlns="urn:ietf:params:xml:ns:epp-1.0"><response>'
+    '<result code="1000"><msg>ok</msg></result>'
+    '<trID><clTRID>%s</clTRID><svTRID>SV-1</svTRID></trID>'
+    '</response></epp>')
+
+
+class EchoXml(object):
+    ''' Stands in for AsyncEppXml: answers every command written with a
+    response carrying its clTRID; feed() queues any other frame. '''
+    def __init__(self, loop):
+        self.loop = loop
+        self.frames = asyncio.Queue()
+
+    def feed(self, cltrid):
+        self.frames.put_nowait(etree.XML(RESPONSE % (cltrid,)))
+
+    def read(self):
+        return self.frames.get()
+
+    def write(self, command):
+        self.feed(command.cltrid)
+        done = self.loop.create_future()
+        done.set_result(None)
+        return done
+
+    def close(self):
+        pass
+
+
+@unittest.skipIf(eppasync is None, 'Python 3.7+ only')
+class AsyncTestCase(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.addCleanup(self.loop.close)
+        self.addCleanup(asyncio.set_event_loop, None)
+
+    def run_async(self, awaitable):
+        return self.loop.run_until_complete(awaitable)
+
+    def read_frame(self, data):
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        return self.run_async(eppasync.AsyncEppSocket(reader, None, max_frame_size=1024).read())
+
+    def test_frame_length(self):
+        self.assertEqual(self.read_frame(struct.pack('>I', 7) + b'abc'), b'abc')
+        self.assertRaises(FramingError, self.read_frame, struct.pack('>I', 4 + 1025) + b'abc')
+        self.assertRaises(FramingError, self.read_frame, struct.pack('>I', 2))
+
+    def echo_session(self):
+        session = eppasync.AsyncEppSession(None, '301234', 'secret')
+        session.eppxml = EchoXml(self.loop)
+        session.reader_task = self.loop.create_task(session._read_loop())
+        self.addCleanup(self.run_async, asyncio.sleep(0))
+        self.addCleanup(session.reader_task.cancel)
+        return session
+
+    def test_unsolicited_frame_is_ignored(self):
+        session = self.echo_session()
+        session.eppxml.feed('SOMEONE-ELSE')
+        self.run_async(asyncio.sleep(0.01))
+        self.assertFalse(session.reader_task.done())
+        value = self.run_async(session._exec(DomainInfo(domainname='example.nl')))
+        self.assertTrue(value is not None)
+        self.assertEqual(dict(session.pending), {})
+
+    def test_failed_write_leaves_no_pending(self):
+        session = self.echo_session()
+
+        def write(command):
+            raise IOError('broken pipe')
+        session.eppxml.write = write
+        self.assertRaises(IOError, self.run_async, session._exec(DomainInfo(domainname='example.nl')))
+        self.assertEqual(dict(session.pending), {})
+
+    def test_lost_connection(self):
+        session = self.echo_session()
+        session._ensure_connected = lambda: asyncio.sleep(0)
+        session.eppxml = None
+        self.assertRaises(ConnectionError, self.run_async, session._exec(DomainInfo(domainname='example.nl')))  # noqa
+
+
+@unittest.skipIf(eppasync is None, 'Python 3.7+ only')
+class AsyncMockServerTestCase(unittest.TestCase):
+    def setUp(self):
+        registry = eppmockserver.MockRegistry()
+        registry.populate('301234', domains=2)
+        self.server = eppmockserver.MockServer(registry=registry, latency=0.05).start()
+        self.addCleanup(self.server.stop)
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.addCleanup(self.loop.close)
+        self.addCleanup(asyncio.set_event_loop, None)
+        self.session = eppasync.AsyncEppSession(
+            lambda: eppasync.tcp_connect(self.server.address), '301234', 'secret')
+        self.addCleanup(self.run_async, self.session.close())
+
+    def run_async(self, awaitable):
+        return self.loop.run_until_complete(awaitable)
+
+    def test_setters_return_changed(self):
+        domain = self.session.domain('mock00000.nl')
+        self.assertFalse(self.run_async(domain.set_nameservers(['ns1.example.nl', 'ns2.example.nl'])))
+        self.assertTrue(self.run_async(domain.set_nameservers(['ns1.example.nl'])))
+        self.assertFalse(self.run_async(domain.set_handles(admin=['MCK000002'])))
+        self.assertTrue(self.run_async(domain.set_handles(admin=['MCK000003'])))
+
+    def test_cancelled_command_leaves_no_pending(self):
+        self.run_async(self.session.domain('mock00000.nl').get_nameservers())
+        task = self.loop.create_task(self.session._exec(DomainInfo(domainname='mock00000.nl')))
+        self.run_async(asyncio.sleep(0.01))
+        task.cancel()
+        self.run_async(asyncio.wait([task]))
+        self.assertEqual(dict(self.session.pending), {})
+        # The late response of the cancelled command goes nowhere.
+        nameservers = self.run_async(self.session.domain('mock00001.nl').get_nameservers())
+        self.assertEqual(nameservers, set(['ns1.example.nl', 'ns2.example.nl']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+# vim: set ts=8 sw=4 sts=4 et ai:
+# Copyright (C) 2026, OSSO B.V.
+'''
+Checks the BulkEngine against the mock server.
+'''
+import os
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import eppbulk  # noqa
+import eppmockserver  # noqa
+import eppsessionpool  # noqa
+import eppsocket  # noqa
+import eppxml  # noqa
+from eppbulk import CHANGED, FAILED, SKIPPED, UNCHANGED  # noqa
+
+NAMESERVERS = ['ns1.example.nl', 'ns2.example.nl']
+
+
+class BulkTestCase(unittest.TestCase):
+    def setUp(self):
+        self.registry = eppmockserver.MockRegistry()
+        self.registry.populate('301234', domains=8)
+        self.server = eppmockserver.MockServer(
+            registry=self.registry, latency=0.002, jitter=0.002).start()
+        self.addCleanup(self.server.stop)
+        self.pool = eppsessionpool.EppSessionPool(
+            lambda: eppxml.wrap_socket(eppsocket.tcp_connect(self.server.address)),
+            '301234', 'secret', min_size=0, max_size=4, write_through=True)
+        self.addCleanup(self.pool.close)
+        self.results = []
+        self.lock = threading.Lock()
+
+    def on_result(self, domainname, operation, status, error):
+        with self.lock:
+            self.results.append((domainname, operation, status))
+
+    def run_bulk(self, operations):
+        engine = eppbulk.BulkEngine(self.pool, workers=4, queue_size=2)
+        return engine.run(operations, on_result=self.on_result)
+
+    def test_operations_per_domain_in_order(self):
+        operations = []
+        for step in range(5):
+            for i in range(8):
+                operations.append(('mock%05d.nl' % (i,), 'set_nameservers', (
+                    ['ns%d.example.nl' % (step,)],)))
+        stats = self.run_bulk(operations)
+        self.assertEqual((stats.submitted, stats.done, stats.counts[CHANGED]), (40, 40, 40))
+        for i in range(8):
+            domainname = 'mock%05d.nl' % (i,)
+            self.assertEqual(
+                [j[2] for j in self.results if j[0] == domainname], [CHANGED] * 5)
+            self.assertEqual(self.registry.domains[domainname]['nameservers'], ['ns4.example.nl'])
+
+    def test_unchanged(self):
+        stats = self.run_bulk([
+            ('mock00000.nl', 'set_nameservers', (NAMESERVERS,)),
+            ('mock00001.nl', 'set_nameservers', (['ns3.example.nl'],))])
+        self.assertEqual(stats.counts[UNCHANGED], 1)
+        self.assertEqual(stats.counts[CHANGED], 1)
+
+    def test_skip_after_failure(self):
+        stats = self.run_bulk([
+            ('unknown.nl', 'set_nameservers', (NAMESERVERS,)),
+            ('mock00000.nl', 'set_nameservers', (['ns3.example.nl'],)),
+            ('unknown.nl', 'set_period', (12,)),
+            ('mock00000.nl', 'set_nameservers', (NAMESERVERS,)),
+            ('unknown.nl', 'set_nameservers', (NAMESERVERS,))])
+        self.assertEqual(
+            [i[2] for i in self.results if i[0] == 'unknown.nl'], [FAILED, SKIPPED, SKIPPED])
+        self.assertEqual(
+            [i[2] for i in self.results if i[0] == 'mock00000.nl'], [CHANGED, CHANGED])
+        self.assertEqual(stats.counts[FAILED], 1)
+        self.assertEqual(stats.counts[SKIPPED], 2)
+
+    def test_bad_input_runs_nothing(self):
+        operations = [
+            ('mock00000.nl', 'set_nameservers', (['ns3.example.nl'],)),
+            ('mock00001.nl', 'set_nameservers', ())]
+        self.assertRaises(ValueError, self.run_bulk, operations)
+        self.assertRaises(ValueError, self.run_bulk, [('mock00000.nl', 'delete', ())])
+        self.assertEqual(self.results, [])
+        self.assertEqual(self.registry.domains['mock00000.nl']['nameservers'], NAMESERVERS)
+
+
+if __name__ == '__main__':
+    unittest.main()
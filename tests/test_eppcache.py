@@ -0,0 +1,96 @@
+# vim: set ts=8 sw=4 sts=4 et ai:
+# Copyright (C) 2026, OSSO B.V.
+'''
+Checks the LruCache eviction, alone and as the session object cache.
+'''
+import gc
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import eppmockserver  # noqa
+import eppsession  # noqa
+import eppsocket  # noqa
+import eppxml  # noqa
+from eppcache import LruCache  # noqa
+
+
+class Value(object):
+    ''' Weakly referenceable, unlike int or str. '''
+    def __init__(self, name):
+        self.name = name
+
+
+class LruCacheTestCase(unittest.TestCase):
+    def test_least_recently_used_evicted(self):
+        cache = LruCache(2)
+        cache['a'], cache['b'] = 1, 2
+        self.assertEqual(cache.get('a'), 1)  # b is now the oldest
+        cache['c'] = 3
+        self.assertEqual(sorted(cache.entries), ['a', 'c'])
+        self.assertTrue('b' not in cache)
+        self.assertEqual(cache.get('b', 'gone'), 'gone')
+        self.assertEqual(cache.stats()['evictions'], 1)
+        self.assertEqual(len(cache), 2)
+
+    def test_live_evicted_value_comes_back(self):
+        cache = LruCache(1)
+        kept = Value('kept')
+        cache['kept'] = kept
+        cache['other'] = Value('other')
+        self.assertEqual(list(cache.entries), ['other'])
+        self.assertTrue('kept' in cache)
+        self.assertTrue(cache['kept'] is kept)
+        self.assertEqual(list(cache.entries), ['kept'])  # back as most recent
+
+    def test_dead_evicted_value_is_gone(self):
+        cache = LruCache(1)
+        cache['dropped'] = Value('dropped')
+        cache['other'] = Value('other')
+        gc.collect()
+        self.assertTrue('dropped' not in cache)
+        self.assertRaises(KeyError, cache.__getitem__, 'dropped')
+
+    def test_setdefault(self):
+        cache = LruCache(1)
+        first = cache.setdefault('a', Value('first'))
+        self.assertTrue(cache.setdefault('a', Value('second')) is first)
+        cache['b'] = Value('b')
+        self.assertTrue(cache.setdefault('a', Value('third')) is first)
+
+
+class SessionCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        registry = eppmockserver.MockRegistry()
+        registry.populate('301234', domains=3)
+        self.server = eppmockserver.MockServer(registry=registry).start()
+        self.addCleanup(self.server.stop)
+        self.session = eppsession.EppSession(
+            lambda: eppxml.wrap_socket(eppsocket.tcp_connect(self.server.address)),
+            '301234', 'secret', cache_size=1)
+        self.addCleanup(self.session.close)
+        self.sent = []
+        self.session.add_hook('before_send', self.sent.append)
+
+    def test_referenced_domain_stays_singleton(self):
+        domain = self.session.domain('mock00000.nl')
+        domain.get_nameservers()
+        self.session.domain('mock00001.nl').get_nameservers()
+        self.assertEqual(len(self.sent), 2)
+        # Evicted but referenced: the same object, with its info.
+        self.assertTrue(self.session.domain('mock00000.nl') is domain)
+        domain.get_nameservers()
+        self.assertEqual(len(self.sent), 2)
+
+    def test_dropped_domain_is_fetched_again(self):
+        self.session.domain('mock00000.nl').get_nameservers()
+        self.session.domain('mock00001.nl').get_nameservers()
+        gc.collect()
+        self.session.domain('mock00000.nl').get_nameservers()
+        self.assertEqual(len(self.sent), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+# vim: set ts=8 sw=4 sts=4 et ai:
+# Copyright (C) 2026, OSSO B.V.
+'''
+Checks the (re)connect counters of eppmetrics against the mock server.
+'''
+import os
+import socket
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import eppmetrics  # noqa
+import eppmockserver  # noqa
+import eppsessionpool  # noqa
+import eppsocket  # noqa
+import eppxml  # noqa
+from eppcommand import DomainInfo  # noqa
+
+
+class ReconnectsTestCase(unittest.TestCase):
+    def setUp(self):
+        registry = eppmockserver.MockRegistry()
+        registry.populate('301234', domains=1)
+        self.server = eppmockserver.MockServer(registry=registry).start()
+        self.addCleanup(self.server.stop)
+        self.pool = eppsessionpool.EppSessionPool(
+            lambda: eppxml.wrap_socket(eppsocket.tcp_connect(self.server.address)),
+            '301234', 'secret', min_size=0, max_size=1)
+        self.addCleanup(self.pool.close)
+        self.metrics = eppmetrics.Metrics()
+        self.metrics.attach(self.pool)
+
+    def info(self):
+        self.pool._exec(DomainInfo(domainname='mock00000.nl'))
+
+    def test_pooled_session_replaced(self):
+        self.info()
+        self.info()
+        self.assertEqual((self.metrics.connects, self.metrics.reconnects), (1, 0))
+
+        # Kill the connection under the idle session.
+        session = self.pool.checkout()
+        session.eppxml.eppsocket.socket.shutdown(socket.SHUT_RDWR)
+        self.pool.checkin(session)
+        self.assertRaises(Exception, self.info)
+
+        self.info()
+        self.assertEqual((self.metrics.connects, self.metrics.reconnects), (2, 1))
+        self.assertIn('epp_reconnects_total 1\n', self.metrics.to_prometheus())
+
+    def test_pool_growth_is_no_reconnect(self):
+        sessions = [self.pool.checkout()]
+        self.pool.max_size = 2
+        sessions.append(self.pool.checkout())
+        for session in sessions:
+            self.pool.checkin(session)
+        self.assertEqual((self.metrics.connects, self.metrics.reconnects), (2, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
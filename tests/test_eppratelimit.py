@@ -0,0 +1,135 @@
+# vim: set ts=8 sw=4 sts=4 et ai:
+# Copyright (C) 2026, OSSO B.V.
+'''
+Checks the token buckets of eppratelimit, alone and in front of the
+mock server.
+'''
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import eppmockserver  # noqa
+import eppratelimit  # noqa
+import eppsessionpool  # noqa
+import eppsocket  # noqa
+import eppxml  # noqa
+from eppcommand import DomainInfo, DomainUpdate  # noqa
+
+
+class TokenBucketTestCase(unittest.TestCase):
+    def test_burst_then_refill(self):
+        bucket = eppratelimit.TokenBucket(rate=20, burst=2)
+        self.assertEqual(bucket.take(block=False), 0)
+        self.assertEqual(bucket.take(block=False), 0)
+        self.assertRaises(eppratelimit.RateLimited, bucket.take, block=False)
+        time.sleep(0.06)
+        self.assertEqual(bucket.take(block=False), 0)
+
+    def test_block_waits_for_refill(self):
+        bucket = eppratelimit.TokenBucket(rate=20, burst=1)
+        bucket.take()
+        started = time.time()
+        waited = bucket.take()
+        self.assertTrue(0.02 < waited < 0.2, waited)
+        self.assertTrue(time.time() - started >= waited * 0.9)
+
+    def test_deadline(self):
+        bucket = eppratelimit.TokenBucket(rate=1, burst=1)
+        bucket.take()
+        self.assertRaises(
+            eppratelimit.RateLimited, bucket.take, deadline=time.time() + 0.1)
+
+    def test_burst_is_the_maximum(self):
+        bucket = eppratelimit.TokenBucket(rate=1000, burst=2)
+        time.sleep(0.01)
+        bucket.take(block=False)
+        bucket.take(block=False)
+        self.assertRaises(eppratelimit.RateLimited, bucket.take, block=False)
+
+
+class RateLimiterTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def limiter(self, path=None):
+        # Refills far too slowly to matter during the test.
+        return eppratelimit.RateLimiter(
+            rate=0.001, burst=3, command_rates={'DomainUpdate': (0.001, 1)},
+            policy=eppratelimit.REJECT, path=path)
+
+    def check_rejected_gives_back(self, limiter):
+        limiter.acquire(DomainUpdate(domainname='example.nl'))
+        for i in range(5):
+            self.assertRaises(
+                eppratelimit.RateLimited, limiter.acquire, DomainUpdate(domainname='example.nl'))
+        # The rejected updates did not use up the account bucket.
+        limiter.acquire(DomainInfo(domainname='example.nl'))
+        limiter.acquire(DomainInfo(domainname='example.nl'))
+        self.assertRaises(
+            eppratelimit.RateLimited, limiter.acquire, DomainInfo(domainname='example.nl'))
+        self.assertEqual(limiter.stats()['rejected'], 6)
+
+    def test_rejected_gives_back(self):
+        self.check_rejected_gives_back(self.limiter())
+
+    def test_file_rejected_gives_back(self):
+        self.check_rejected_gives_back(self.limiter(os.path.join(self.directory, 'bucket')))
+
+    @unittest.skipIf(not os.path.isdir('/proc/self/fd'), 'needs /proc')
+    def test_file_bucket_keeps_no_fd(self):
+        before = len(os.listdir('/proc/self/fd'))
+        for i in range(10):
+            self.limiter(os.path.join(self.directory, 'bucket%d' % (i,))).acquire(
+                DomainInfo(domainname='example.nl'))
+        self.assertEqual(len(os.listdir('/proc/self/fd')), before)
+
+
+
+class MockServerTestCase(unittest.TestCase):
+    def setUp(self):
+        registry = eppmockserver.MockRegistry()
+        registry.populate('301234', domains=3)
+        self.server = eppmockserver.MockServer(registry=registry).start()
+        self.addCleanup(self.server.stop)
+
+    def pool(self, limiter):
+        pool = eppsessionpool.EppSessionPool(
+            lambda: eppxml.wrap_socket(eppsocket.tcp_connect(self.server.address)),
+            '301234', 'secret', min_size=0, max_size=2, rate_limiter=limiter,
+            info_ttl=0)
+        self.addCleanup(pool.close)
+        self.sent = []
+        pool.add_hook('before_send', self.sent.append)
+        return pool
+
+    def test_rejected_command_is_not_sent(self):
+        pool = self.pool(eppratelimit.RateLimiter(
+            rate=0.001, burst=1, policy=eppratelimit.REJECT))
+        pool.domain('mock00000.nl').get_nameservers()
+        session = pool.idle[0][1]
+        self.assertRaises(
+            eppratelimit.RateLimited, pool.domain('mock00001.nl').get_nameservers)
+        self.assertEqual(len(self.sent), 1)
+        # The connection was fine, so the pool kept it.
+        self.assertEqual([i[1] for i in pool.idle], [session])
+
+    def test_blocked_commands_keep_the_rate(self):
+        limiter = eppratelimit.RateLimiter(rate=50, burst=1)
+        pool = self.pool(limiter)
+        started = time.time()
+        for i in range(6):
+            pool.domain('mock%05d.nl' % (i % 3,)).get_nameservers()
+        self.assertTrue(time.time() - started >= 0.09)
+        self.assertEqual(len(self.sent), 6)
+        self.assertEqual(limiter.stats()['acquired'], 6)
+        self.assertTrue(limiter.stats()['delayed'] > 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
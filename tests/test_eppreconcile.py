@@ -0,0 +1,136 @@
+# vim: set ts=8 sw=4 sts=4 et ai:
+# Copyright (C) 2026, OSSO B.V.
+'''
+Checks the reconcile planner and apply against the mock server.
+'''
+import io
+import os
+import random
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import eppmockserver  # noqa
+import eppsession  # noqa
+import eppsocket  # noqa
+import eppstore  # noqa
+import eppxml  # noqa
+from eppbulk import CHANGED, FAILED, UNCHANGED  # noqa
+from eppcommand import DnssecDomainUpdate, DomainRenew  # noqa
+from eppreconcile import Reconciler, load_desired  # noqa
+
+
+def desired(text):
+    return load_desired(io.StringIO(text))
+
+
+class LoadDesiredTestCase(unittest.TestCase):
+    def test_grouped(self):
+        ret = desired(u'''{"Example.NL": {
+            "admin": "ABC000123", "nameservers": ["NS1.example.nl"],
+            "dnskeys": [{"flags": 257, "algo": 13, "key": "a"},
+                        {"flags": 257, "algo": 13, "key": "b"}],
+            "period": 3}}''')
+        self.assertEqual(list(ret), ['example.nl'])
+        self.assertEqual(ret['example.nl'], {
+            'admin': ['ABC000123'], 'nameservers': ['ns1.example.nl'],
+            'dnskeys': {257: (13, ['a', 'b'])}, 'period': 3})
+
+    def test_bad_input(self):
+        for text in (
+                u'[]', u'{"a.nl": {"owner": "x"}}', u'{"a.nl": {"period": 6}}',
+                u'{"a.nl": {"nameservers": []}}',
+                u'{"a.nl": {"dnskeys": [{"flags": 257, "algo": 13, "key": "a"},'
+                u' {"flags": 257, "algo": 8, "key": "b"}]}}'):
+            self.assertRaises(ValueError, desired, text)
+
+
+class ReconcileTestCase(unittest.TestCase):
+    def setUp(self):
+        self.registry = eppmockserver.MockRegistry()
+        self.registry.populate('301234', domains=6)
+        self.server = eppmockserver.MockServer(registry=self.registry).start()
+        self.addCleanup(self.server.stop)
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def session(self, **kwargs):
+        session = eppsession.EppSession(
+            lambda: eppxml.wrap_socket(eppsocket.tcp_connect(self.server.address)),
+            '301234', 'secret', **kwargs)
+        self.addCleanup(session.close)
+        return session
+
+    def test_plan_and_apply(self):
+        wanted = desired(u'''{
+            "mock00000.nl": {"nameservers": ["ns1.example.nl", "ns2.example.nl"],
+                             "registrant": "MCK000001"},
+            "mock00001.nl": {"nameservers": ["ns1.example.nl", "ns3.example.nl"],
+                             "admin": ["MCK000003"], "dnskeys": []},
+            "unknown.nl": {"nameservers": ["ns1.example.nl"]}}''')
+        reconciler = Reconciler(self.session())
+        plans = reconciler.plan(wanted)
+        self.assertEqual([i.name for i in plans], list(wanted))
+        self.assertEqual(plans[0].commands, [])
+        self.assertEqual(len(plans[1].commands), 1)
+        self.assertTrue(isinstance(plans[1].commands[0], DnssecDomainUpdate))
+        self.assertEqual(plans[1].changes, [
+            'admin: +MCK000003 -MCK000002',
+            'nameservers: +ns3.example.nl -ns2.example.nl',
+            'dnskeys 257: -3 13 bW9jayBrZXkgJWQ='])
+        self.assertTrue(plans[2].error is not None)
+
+        results = []
+        counts = reconciler.apply(plans, on_result=lambda plan, status: results.append((plan.name, status)))
+        self.assertEqual(results, [
+            ('mock00000.nl', UNCHANGED), ('mock00001.nl', CHANGED), ('unknown.nl', FAILED)])
+        self.assertEqual(counts, {CHANGED: 1, UNCHANGED: 1, FAILED: 1})
+        domain = self.registry.domains['mock00001.nl']
+        self.assertEqual(sorted(domain['nameservers']), ['ns1.example.nl', 'ns3.example.nl'])
+        self.assertEqual(domain['admin'], ['MCK000003'])
+        self.assertEqual(domain['dnskeys'], [])
+
+        # Now everything is as desired.
+        self.assertEqual([i.commands for i in Reconciler(self.session()).plan(wanted)], [[], [], []])
+
+    def test_period_remembered_in_store(self):
+        store = eppstore.EppStore(os.path.join(self.directory, 'store.sqlite'))
+        self.addCleanup(store.close)
+        reconciler = Reconciler(self.session(store=store))
+        wanted = desired(u'{"mock00000.nl": {"period": 12}, "mock00001.nl": {"period": 3}}')
+        plans = reconciler.plan(wanted)
+        self.assertTrue(all(i.period_only for i in plans))
+        self.assertTrue(all(isinstance(i.commands[0], DomainRenew) for i in plans))
+        self.assertEqual(reconciler.apply(plans), {CHANGED: 1, UNCHANGED: 1, FAILED: 0})
+
+        self.assertEqual([i.commands for i in reconciler.plan(wanted)], [[], []])
+        wanted['mock00000.nl']['period'] = 1
+        plan = reconciler.plan(wanted)[0]
+        self.assertFalse(plan.period_only)
+        self.assertEqual(plan.changes, ['period: 12 -> 1'])
+
+    def test_apply_survives_lost_connections(self):
+        random.seed(3)
+        reconciler = Reconciler(self.session(pipeline_depth=4))
+        wanted = dict(
+            ('mock%05d.nl' % (i,), {'nameservers': ['ns1.example.nl', 'ns5.example.nl']})
+            for i in range(6))
+        plans = reconciler.plan(wanted)
+        self.server.disconnect_rate = 0.3
+        results = []
+        counts = reconciler.apply(plans, on_result=lambda plan, status: results.append(status))
+        self.server.disconnect_rate = 0
+        self.assertEqual(len(results), 6)
+        self.assertEqual(counts[FAILED], len([i for i in plans if i.error is not None]))
+
+        # A second run finishes the job.
+        plans = [i for i in reconciler.plan(wanted) if i.commands]
+        self.assertEqual(reconciler.apply(plans)[FAILED], 0)
+        self.assertEqual([i.commands for i in reconciler.plan(wanted)], [[]] * 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+# vim: set ts=8 sw=4 sts=4 et ai:
+# Copyright (C) 2026, OSSO B.V.
+'''
+Checks the eppresponse records against the mock server.
+'''
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import eppmockserver  # noqa
+import eppsession  # noqa
+import eppsocket  # noqa
+import eppxml  # noqa
+
+NAME = u'Jan J\xe4nsen'
+
+
+class RecordTestCase(unittest.TestCase):
+    def setUp(self):
+        registry = eppmockserver.MockRegistry()
+        registry.populate('301234', domains=1)
+        self.server = eppmockserver.MockServer(registry=registry).start()
+        self.addCleanup(self.server.stop)
+        self.session = eppsession.EppSession(
+            lambda: eppxml.wrap_socket(eppsocket.tcp_connect(self.server.address)),
+            '301234', 'secret')
+        self.addCleanup(self.session.close)
+
+    def contact_info(self):
+        contact = self.session.contact_create(
+            name=NAME, street=u'K\xf6nigstra\xdfe 1', zipcode='1234AB',
+            city='Groningen', countrycode='NL', phone='+31.501234567',
+            fax='', email='jan@example.nl')
+        return contact.verbose_info
+
+    def test_non_ascii_str(self):
+        info = self.contact_info()
+        self.assertEqual(info.name, NAME)
+        text = str(info)
+        if str is bytes:
+            text = text.decode('utf-8')
+        self.assertIn(u'  name: %s\n' % (NAME,), text)
+        self.assertIn(u'  street: K\xf6nigstra\xdfe 1\n', text)
+
+    @unittest.skipIf(str is not bytes, 'Python 2 only')
+    def test_non_ascii_unicode(self):
+        info = self.contact_info()
+        self.assertIn(u'  name: %s\n' % (NAME,), unicode(info))  # noqa
+
+    def test_domain_str(self):
+        text = str(self.session.domain('mock00000.nl').verbose_info)
+        self.assertIn('  nameservers: ns1.example.nl; ns2.example.nl\n', text)
+        self.assertIn('  dnskeys: 257 3 13 bW9jayBrZXkgJWQ=\n', text)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,173 @@
+# vim: set ts=8 sw=4 sts=4 et ai:
+# Copyright (C) 2026, OSSO B.V.
+'''
+Checks EppSession against the mock server.
+'''
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import eppmockserver  # noqa
+import eppsession  # noqa
+import eppsocket  # noqa
+import eppxml  # noqa
+from eppcommand import DomainInfo  # noqa
+from eppxml import UnexpectedData, xpath  # noqa
+
+
+class ReorderingXml(object):
+    ''' Wraps an EppXml. Hands out the responses in pairs, the second
+    one first, and without clTRID when strip is set. '''
+    def __init__(self, eppxml, swap=True, strip=False):
+        self.eppxml = eppxml
+        self.swap = swap
+        self.strip = strip
+        self.responses = []
+
+    def expect(self, write, xpath_read_check):
+        return self.eppxml.expect(write, xpath_read_check)
+
+    def write_many(self, commands):
+        self.eppxml.write_many(commands)
+
+    def read(self):
+        if not self.responses:
+            self.responses = [self.eppxml.read()]
+            if self.swap:
+                self.responses.insert(0, self.eppxml.read())
+        value = self.responses.pop()
+        if self.strip:
+            for element in xpath(value, eppsession.EppSession.XPATH_CLTRID):
+                element.getparent().remove(element)
+        return value
+
+    def close(self):
+        self.eppxml.close()
+
+
+class PipelineTestCase(unittest.TestCase):
+    def setUp(self):
+        registry = eppmockserver.MockRegistry()
+        registry.populate('301234', domains=10)
+        self.server = eppmockserver.MockServer(registry=registry, latency=0.01).start()
+        self.addCleanup(self.server.stop)
+
+    def session(self, **kwargs):
+        wrap = kwargs.pop('wrap', None)
+
+        def connect():
+            ret = eppxml.wrap_socket(eppsocket.tcp_connect(self.server.address))
+            return ret if wrap is None else wrap(ret)
+        session = eppsession.EppSession(connect, '301234', 'secret', **kwargs)
+        self.addCleanup(session.close)
+        return session
+
+    def check_answers(self, session, domainnames):
+        pendings = [session.submit(DomainInfo(domainname=i)) for i in domainnames]
+        in_flight = session.collect()
+        self.assertTrue(0 < len(in_flight) <= session.pipeline_depth)
+        self.assertEqual(in_flight, pendings[len(pendings) - len(in_flight):])
+        for domainname, pending in zip(domainnames, pendings):
+            self.assertTrue(pending.done())
+            if domainname.startswith('mock'):
+                self.assertEqual(xpath(pending.result(), '//domain:infData/domain:name')[0].text, domainname)
+            else:
+                self.assertRaises(UnexpectedData, pending.result)
+        self.assertEqual(session.pending, {})
+
+    def test_pipelined(self):
+        domainnames = ['mock%05d.nl' % (i,) for i in range(10)]
+        domainnames.insert(3, 'unknown.nl')
+        self.check_answers(self.session(pipeline_depth=4), domainnames)
+
+    def test_cltrid_correlation(self):
+        # The responses come in out of order; the clTRIDs match them up.
+        session = self.session(wrap=ReorderingXml)
+        self.check_answers(session, ['mock00000.nl', 'unknown.nl', 'mock00002.nl', 'mock00003.nl'])
+
+    def test_oldest_pending_fallback(self):
+        # Without clTRID, a response belongs to the oldest command.
+        session = self.session(wrap=lambda i: ReorderingXml(i, swap=False, strip=True))
+        self.check_answers(session, ['mock00000.nl', 'unknown.nl', 'mock00002.nl'])
+
+    def test_result_reads_until_done(self):
+        session = self.session()
+        first = session.submit(DomainInfo(domainname='mock00000.nl'))
+        last = session.submit(DomainInfo(domainname='mock00001.nl'))
+        self.assertFalse(first.done())
+        last.result()
+        self.assertTrue(first.done())
+        self.assertEqual(session.pending, {})
+
+
+class WriteThroughTestCase(unittest.TestCase):
+    def setUp(self):
+        registry = eppmockserver.MockRegistry()
+        registry.populate('301234', domains=2)
+        self.server = eppmockserver.MockServer(registry=registry).start()
+        self.addCleanup(self.server.stop)
+        self.session = self.new_session(write_through=True)
+        self.sent = []
+        self.session.add_hook('before_send', self.sent.append)
+        self.domain = self.session.domain('mock00000.nl')
+        self.domain.get_nameservers()  # cached from here on
+
+    def new_session(self, **kwargs):
+        session = eppsession.EppSession(
+            lambda: eppxml.wrap_socket(eppsocket.tcp_connect(self.server.address)),
+            '301234', 'secret', **kwargs)
+        self.addCleanup(session.close)
+        return session
+
+    def infos_sent(self):
+        return len([i for i in self.sent if isinstance(i, DomainInfo)])
+
+    def assert_as_registered(self, *fields):
+        # The cached info has what a fresh info says.
+        cached = self.domain.verbose_info
+        fresh = self.new_session().domain('mock00000.nl').verbose_info
+        for field in fields:
+            self.assertEqual(getattr(cached, field), getattr(fresh, field), field)
+        self.assertEqual(self.infos_sent(), 1)
+
+    def test_nameservers(self):
+        self.assertTrue(self.domain.set_nameservers(['ns1.example.nl', 'ns3.example.nl']))
+        self.assertEqual(self.domain.get_nameservers(), set(['ns1.example.nl', 'ns3.example.nl']))
+        self.assertFalse(self.domain.set_nameservers(['ns3.example.nl', 'ns1.example.nl']))
+        self.assert_as_registered('nameservers')
+
+    def test_handles(self):
+        self.assertTrue(self.domain.set_handles(admin=['MCK000003'], tech=['MCK000002']))
+        self.assertEqual(self.domain.get_handles()['admin'], set(['MCK000003']))
+        self.assert_as_registered('registrant', 'admin', 'tech')
+
+    def test_dnskeys(self):
+        self.assertTrue(self.domain.replace_dnskeys(257, 13, ['bmV3IGtleQ==']))
+        self.assertTrue(self.domain.replace_dnskeys(256, 13, ['enNrIGtleQ==']))
+        self.assertEqual([i.key for i in self.domain.get_dnskeys(257)], ['bmV3IGtleQ=='])
+        self.assert_as_registered('dnskeys')
+
+    def test_period(self):
+        self.assertTrue(self.domain.set_period(1))
+        self.assertFalse(self.domain.set_period(1))
+        self.assert_as_registered('expires')
+
+    def test_without_write_through(self):
+        self.session.write_through = False
+        self.domain.set_nameservers(['ns3.example.nl'])
+        self.assertEqual(self.infos_sent(), 1)
+        self.assertEqual(self.domain.get_nameservers(), set(['ns3.example.nl']))
+        self.assertEqual(self.infos_sent(), 2)
+
+    def test_failed_change_drops_info(self):
+        self.server.error_rate = 1.0
+        self.assertRaises(UnexpectedData, self.domain.set_nameservers, ['ns3.example.nl'])
+        self.server.error_rate = 0.0
+        self.assertEqual(self.domain.get_nameservers(), set(['ns1.example.nl', 'ns2.example.nl']))
+        self.assertEqual(self.infos_sent(), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
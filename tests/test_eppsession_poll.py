@@ -0,0 +1,81 @@
+# vim: set ts=8 sw=4 sts=4 et ai:
+# Copyright (C) 2026, OSSO B.V.
+'''
+Checks EppSession.poll against the mock server.
+'''
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import eppmockserver  # noqa
+import eppsession  # noqa
+import eppsocket  # noqa
+import eppxml  # noqa
+
+
+class PollTestCase(unittest.TestCase):
+    def setUp(self):
+        self.registry = eppmockserver.MockRegistry()
+        self.registry.populate('301234', domains=1, messages=5)
+        self.server = eppmockserver.MockServer(registry=self.registry, latency=0.01).start()
+        self.addCleanup(self.server.stop)
+        self.session = eppsession.EppSession(
+            lambda: eppxml.wrap_socket(eppsocket.tcp_connect(self.server.address)),
+            '301234', 'secret')
+        self.addCleanup(self.session.close)
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.queued = [i[0] for i in self.registry.queues['301234']]
+
+    def test_drain_overlaps_ack_and_read(self):
+        self.session._ensure_connected()
+        batches = []
+        write_many = self.session.eppxml.write_many
+
+        def counting_write_many(frames):
+            batches.append([i.__class__.__name__ for i in frames])
+            write_many(frames)
+        self.session.eppxml.write_many = counting_write_many
+
+        messages = list(self.session.poll())
+        self.assertEqual([i.id for i in messages], self.queued)
+        self.assertEqual(messages[0].count, 5)
+        self.assertEqual(len(self.registry.queues['301234']), 0)
+        # Every ack goes out together with the next read.
+        self.assertEqual(batches, [['MessageQueueReadFirst']] + [
+            ['MessageQueueRemoveFirst', 'MessageQueueReadFirst']] * 5)
+
+    def test_stop_iterating_keeps_message(self):
+        for message in self.session.poll():
+            break
+        self.assertEqual(message.id, self.queued[0])
+        self.assertEqual([i.id for i in self.session.poll()], self.queued)
+
+    def test_no_ack(self):
+        self.assertEqual([i.id for i in self.session.poll(ack=False)], self.queued[:1])
+        self.assertEqual(len(self.registry.queues['301234']), 5)
+
+    def test_checkpoint_skips_handled_message(self):
+        checkpoint = os.path.join(self.directory, 'checkpoint')
+        poll = self.session.poll(checkpoint=checkpoint)
+        self.assertEqual(next(poll).id, self.queued[0])
+        self.assertEqual(next(poll).id, self.queued[1])
+        with open(checkpoint) as fp:
+            self.assertEqual(fp.read().strip(), self.queued[0])
+
+        # We crashed before the second ack got out: the message is
+        # still queued, but the checkpoint says it was handled.
+        poll.close()
+        self.session.close()
+        self.session._save_checkpoint(checkpoint, self.queued[1])
+        messages = list(self.session.poll(checkpoint=checkpoint))
+        self.assertEqual([i.id for i in messages], self.queued[2:])
+        self.assertEqual(len(self.registry.queues['301234']), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+# vim: set ts=8 sw=4 sts=4 et ai:
+# Copyright (C) 2026, OSSO B.V.
+'''
+Checks checkout/checkin of EppSessionPool against the mock server.
+'''
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import eppmockserver  # noqa
+import eppsessionpool  # noqa
+import eppsocket  # noqa
+import eppxml  # noqa
+from eppcommand import DomainInfo  # noqa
+
+
+class PoolTestCase(unittest.TestCase):
+    def setUp(self):
+        registry = eppmockserver.MockRegistry()
+        registry.populate('301234', domains=4)
+        self.server = eppmockserver.MockServer(registry=registry, latency=0.01).start()
+        self.addCleanup(self.server.stop)
+        self.pool = eppsessionpool.EppSessionPool(
+            lambda: eppxml.wrap_socket(eppsocket.tcp_connect(self.server.address)),
+            '301234', 'secret', min_size=0, max_size=1)
+        self.addCleanup(self.pool.close)
+
+    def test_timeout(self):
+        session = self.pool.checkout()
+        try:
+            with self.assertRaises(eppsessionpool.PoolTimeout) as raised:
+                self.pool.checkout(timeout=0.05)
+            self.assertFalse(isinstance(raised.exception, eppsessionpool.PoolClosed))
+        finally:
+            self.pool.checkin(session)
+        self.pool.close()
+        self.assertRaises(eppsessionpool.PoolClosed, self.pool.checkout)
+
+    def test_checkin_collects_in_flight(self):
+        with self.pool.session() as session:
+            pendings = [
+                session.submit(DomainInfo(domainname='mock%05d.nl' % (i,)))
+                for i in range(4)]
+        self.assertEqual(session.pending, {})
+        self.assertEqual(self.pool.size, 1)
+        for pending in pendings:
+            self.assertTrue(pending.result() is not None)
+
+        # The keepalive reads its own greeting, not a stale response.
+        session = self.pool.checkout()
+        try:
+            self.pool._ping(session)
+        finally:
+            self.pool.checkin(session)
+        self.assertEqual(len(self.pool.idle), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
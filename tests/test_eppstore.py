@@ -0,0 +1,57 @@
+# vim: set ts=8 sw=4 sts=4 et ai:
+# Copyright (C) 2026, OSSO B.V.
+'''
+Checks the EppStore shared between sessions against the mock server.
+'''
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import eppmockserver  # noqa
+import eppsession  # noqa
+import eppsocket  # noqa
+import eppstore  # noqa
+import eppxml  # noqa
+
+
+class StoreTestCase(unittest.TestCase):
+    def setUp(self):
+        registry = eppmockserver.MockRegistry({'301234': 'a', '305678': 'b'})
+        registry.populate('301234', domains=1)
+        registry.populate('305678', domains=1, prefix='other')
+        self.server = eppmockserver.MockServer(registry=registry).start()
+        self.addCleanup(self.server.stop)
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def session(self, username, password, path):
+        store = eppstore.EppStore(os.path.join(self.directory, path))
+        self.addCleanup(store.close)
+        session = eppsession.EppSession(
+            lambda: eppxml.wrap_socket(eppsocket.tcp_connect(self.server.address)),
+            username, password, store=store)
+        self.addCleanup(session.close)
+        return session
+
+    def test_shared_between_sessions(self):
+        first = self.session('301234', 'a', 'store.sqlite')
+        token = first.domain('mock00000.nl').token
+        second = self.session('301234', 'a', 'store.sqlite')
+        sent = []
+        second.add_hook('before_send', sent.append)
+        self.assertEqual(second.domain('mock00000.nl').token, token)
+        self.assertEqual(sent, [])
+
+    def test_other_account_refused(self):
+        self.session('301234', 'a', 'store.sqlite').domain('mock00000.nl').token
+        self.assertRaises(ValueError, self.session, '305678', 'b', 'store.sqlite')
+        other = self.session('305678', 'b', 'other.sqlite')
+        self.assertTrue(other.domain('other00000.nl').token)
+
+
+if __name__ == '__main__':
+    unittest.main()